@@ -0,0 +1,163 @@
+"""Write output PDFs to a single ZIP or TAR archive
+"""
+
+# Author: David A. Thompson
+
+import errno
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import time
+import zipfile
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+
+#
+# Rather than creating one file per output PDF, the output PDFs (and
+# the manifest) may be written, in a single sequential pass, to one
+# archive: a ZIP file, a TAR file (optionally compressed), or a TAR
+# stream on standard output. Members are written as they are added;
+# nothing is read back or rewritten. An existing file is not
+# replaced unless overwriting is requested (see open_archive). An
+# archive left incomplete by a failed run is removed (see
+# Archive.discard).
+#
+
+# archive suffix -> archive format
+archive_suffixes = [
+    ('.zip', 'zip'),
+    ('.tar', 'tar'),
+    ('.tar.gz', 'tar.gz'),
+    ('.tgz', 'tar.gz')
+]
+
+# name of the manifest within an archive
+manifest_member_name = 'manifest.jsonl'
+
+class Archive(object):
+    """
+    ARCHIVE_SPEC is the path to the archive ('-' indicates standard
+    output). ARCHIVE_FORMAT is 'zip', 'tar', or 'tar.gz'. Raise
+    OSError (EEXIST) if the archive exists, unless OVERWRITE_P is
+    true. MEMBERS maps the name of each member added to a dictionary
+    with the size ('bytes') and the SHA-256 digest ('sha256') of the
+    member.
+    """
+    def __init__(self,archive_spec,archive_format,overwrite_p=False):
+        self.archive_spec = archive_spec
+        self.archive_format = archive_format
+        self.members = {}
+        self.closed = False
+        self._file = None
+        if archive_spec == '-':
+            # a TAR stream is written without seeking
+            self._tar = tarfile.open(fileobj=getattr(sys.stdout,'buffer',sys.stdout),mode='w|')
+            self._zip = None
+            return
+        # the archive is created, not opened, so that an existing file
+        # is never truncated unless requested
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if overwrite_p else os.O_EXCL)
+        self._file = os.fdopen(os.open(archive_spec,flags,0o666),'wb')
+        try:
+            if archive_format == 'zip':
+                # PDF content streams are already compressed
+                self._zip = zipfile.ZipFile(self._file,'w',zipfile.ZIP_STORED,True)
+                self._tar = None
+            else:
+                self._tar = tarfile.open(fileobj=self._file,mode='w|gz' if archive_format == 'tar.gz' else 'w|')
+                self._zip = None
+        except BaseException:
+            self._file.close()
+            os.remove(archive_spec)
+            raise
+
+    def add(self,name,data):
+        """Add the member NAME, holding the bytes DATA, to the archive."""
+        now = time.time()
+        if self._zip:
+            info = zipfile.ZipInfo(name,time.localtime(now)[:6])
+            info.external_attr = 0o644 << 16
+            self._zip.writestr(info,data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(now)
+            info.mode = 0o644
+            self._tar.addfile(info,io.BytesIO(data))
+        self.members[name] = {
+            'bytes': len(data),
+            'sha256': hashlib.sha256(data).hexdigest()
+        }
+
+    def close(self):
+        """Complete the archive. Closing a closed archive has no effect."""
+        if self.closed:
+            return
+        self.closed = True
+        self._close()
+        lg.info(json1.json_archive_written(self.archive_spec,sorted(self.members.keys())))
+
+    def discard(self):
+        """
+        Close the archive, left incomplete by a failure, and remove it.
+        A TAR stream written to standard output cannot be removed; it
+        is only closed.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._close()
+        except Exception as e:
+            lg.debug("closing %s: %s",self.archive_spec,e)
+        if self.archive_spec != '-':
+            try:
+                os.remove(self.archive_spec)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    lg.warn("could not remove %s: %s",self.archive_spec,e)
+
+    def _close(self):
+        try:
+            if self._zip:
+                self._zip.close()
+            else:
+                self._tar.close()
+        finally:
+            if self._file:
+                self._file.close()
+        if self.archive_spec == '-':
+            sys.stdout.flush()
+
+def archive_format(archive_spec):
+    """
+    Return the format ('zip', 'tar', or 'tar.gz') of the archive
+    specified by ARCHIVE_SPEC, based on its suffix, or None if the
+    suffix is not recognized. Standard output ('-') receives a TAR
+    stream.
+    """
+    if archive_spec == '-':
+        return 'tar'
+    for suffix, suffix_format in archive_suffixes:
+        if archive_spec.lower().endswith(suffix):
+            return suffix_format
+    return None
+
+def open_archive(archive_spec,overwrite_p=False):
+    """
+    Return an Archive for ARCHIVE_SPEC. Raise an exception if the
+    suffix of ARCHIVE_SPEC is not recognized or if the archive exists
+    and OVERWRITE_P is false.
+    """
+    archive_spec_format = archive_format(archive_spec)
+    if not archive_spec_format:
+        raise ValueError("unrecognized archive suffix (expected {}): {}".format(
+            ", ".join([suffix for suffix, suffix_format in archive_suffixes]),archive_spec))
+    return Archive(archive_spec,archive_spec_format,overwrite_p)
@@ -7,10 +7,6 @@
 #import cv2
 #import numpy
 
-# If relying on shell invocation of zbarimg
-#import subprocess
-#import tempfile
-
 import imp
 import sys
 
@@ -21,21 +17,19 @@ import logging
 lg=logging
 
 # internal/busca modules
+import decoders
 import json1
+import pgm
+import pruning
 
 #
 # this can handle a single PDF sheet w/all sorts of other stuff on it -- as long as it only has a single bar code on the sheet -- no need to identify region with bar code... zbar handles it all... lovely!
 #
-
-try:
-    imp.find_module('zbar')
-except ImportError:
-    msg = json1.json_msg_module_not_accessible('zbar')
-    lg.error(msg)
-    lg.info(json1.json_last_log_msg())
-    sys.exit(msg)
-import zbar
-
+# Decoding is performed by one of the backends in decoders.py (the
+# python zbar binding by default). PGM files (e.g., pdftoppm
+# renderings) are mapped into memory and handed to the decoder without
+# copying the pixels (see pgm.py).
+#
 
 # Image is provided by PIL or pillow
 try:
@@ -46,6 +40,10 @@ except ImportError:
     lg.info(json1.json_last_log_msg())
     sys.exit(msg)
 from PIL import Image
+from PIL import ImageChops
+
+# box filter (Image.BOX requires Pillow >= 3.4)
+box_resample = getattr(Image,'BOX',None) or Image.ANTIALIAS
 
 
 
@@ -58,11 +56,30 @@ from PIL import Image
 # img.read(imagePDFPath) # read in at 300 dpi
 # img.write(imagePNGPath)
 
+# barcode prefilter (see barcode_likely)
+prefilter_cell_size = 16        # pixels
+prefilter_min_contrast = 24     # mean absolute difference between adjacent pixels
+prefilter_min_ratio = 2.5       # contrast across bars relative to contrast along bars
+# images are reduced to at most this many pixels on a side before the
+# prefilter is applied to the whole image (see locate_barcode)
+prefilter_max_size = 1200
+
+# 2D symbologies (zbar names); a 2D symbol has no bars (see
+# symbol_orientation)
+matrix_symbologies = set(['QRCODE', 'PDF417', 'DATAMATRIX', 'AZTEC', 'MAXICODE', 'SQCODE'])
+
+# skew estimation (see estimate_skew)
+skew_max_angle = 20             # degrees
+skew_coarse_step = 4            # degrees
+skew_sample_size = 240          # pixels
+
 # imagePNGPath should be a string defining the location of a PNG file
-def barcodeScan(imagePNGPath, scan_region):
+def barcodeScan(imagePNGPath, scan_region, decoder=None, rotate=0):
     """
     Return None if a barcode was not found. If a barcode was found,
-    return a string corresponding to the barcode-encoded data.
+    return a string corresponding to the barcode-encoded data. If
+    several barcodes were found, the topmost is used (see
+    select_symbol).
 
     Search within the region defined by SCAN_REGION when SCAN_REGION
     is a list. When SCAN_REGION is a list, it specifies two points as
@@ -74,6 +91,42 @@ def barcodeScan(imagePNGPath, scan_region):
     If SCAN_REGION is not a list, the full image is analyzed. If
     analysis of the full image is desirable, do not set SCAN_REGION to
     [0,0,1,1] but instead set it to None or some other non-list value.
+
+    DECODER names the decoder backend (see decoders.py); by default,
+    decoders.default_decoder is used. See barcodeScanResult regarding
+    ROTATE.
+    """
+    return barcodeScanResult(imagePNGPath, scan_region, decoder, rotate)['barcode']
+
+def barcodeScanResult(imagePNGPath, scan_region, decoder=None, rotate=0, whole_page=True, barcode_filter=None, signature_p=False):
+    """
+    Scan the image specified by IMAGEPNGPATH as described for
+    barcodeScan. Return a dictionary: 'symbols' is a list of the
+    barcodes found (see decoders.make_symbol; bounding boxes are
+    expressed, as is SCAN_REGION, relative to the dimensions of the
+    image), 'barcode' is the string encoded by the barcode selected
+    from 'symbols' by select_symbol (or None), and 'orientation'
+    describes the orientation of the barcodes (or None if no barcode
+    was found or its orientation is unknown; see symbol_orientation
+    and barcode_orientation).
+
+    ROTATE is the /Rotate attribute (0, 90, 180, or 270) of the PDF
+    page on which the image is displayed; SCAN_REGION is taken
+    relative to the page as displayed. WHOLE_PAGE should be True if
+    the image spans the page (e.g., a scanned page extracted from the
+    PDF) and False if the image is an excerpt of the page (e.g., the
+    rendering of a region of the page).
+
+    If the barcode cannot be decoded as is, the image is searched for
+    barcode-like texture (see locate_barcode); if found, only that
+    portion of the image is deskewed and decoded again.
+
+    Only barcodes passing BARCODE_FILTER (if specified; see
+    decoders.make_barcode_filter) are decoded.
+
+    If SIGNATURE_P is true and WHOLE_PAGE is True, 'signature' holds
+    the signature of the image (see pruning.page_signature);
+    otherwise, 'signature' is None.
     """
     # sanity check(s)
     if not isinstance(scan_region,list):
@@ -88,151 +141,417 @@ def barcodeScan(imagePNGPath, scan_region):
     # obtain image data either via PIL or CV2/numpy
     #   1. using pil
     # PIL origin (0,0) is top left corner
-    pil = Image.open(imagePNGPath).convert('L') # 'L' is "black and white mode": converts to 8-bit pixels B/W
+    pil, bitmap = open_grayscale(imagePNGPath)
     #   2. using cv2/numpy
     #pil_1 = Image.open(imagePNGPath)
     #frame = pil_1.convert("RGB")
     #pil_gray = cv2.cvtColor(numpy.array(frame), cv2.COLOR_BGR2GRAY, dstCn=0)
     #pil = Image.fromarray(pil_gray)
-    pilCropped = pil
     width, height = pil.size
     lg.debug("width: %s height: %s",width,height)
+    # the pixels are at hand; describe the page for pruning.py
+    signature = None
+    if signature_p and whole_page:
+        signature = pruning.page_signature(pil)
+    box = (0,0,width,height)
     if scan_region:
-        # relative (percentage) values between 0 and 1
-        x_crop_min = min(scan_region[0],scan_region[2])
-        x_crop_max = max(scan_region[0],scan_region[2])
-        y_crop_min = min(scan_region[1],scan_region[3])
-        y_crop_max = max(scan_region[1],scan_region[3])
-        cropTop=int(height*y_crop_min)
-        cropBottom=int(height*y_crop_max)
-        cropLeft=int(height*x_crop_min)
-        cropRight=int(height*x_crop_max)
-        # crop box is 4-tuple: left,upper,right,lower
-        pilCropBox = [cropLeft,cropTop,cropRight,cropBottom]
-        pilCropped = pil.crop(pilCropBox)
-    #  zbar sometimes catches a barcode at a lower resolution but misses it at a higher resolution. Scan for barcode with several variants of image specified by IMAGE_FILE_SPEC.
-    barcodeString = barcode_scan_at_resolutions(pilCropped,None)
-    if ( not barcodeString ):
-            lg.warn(json1.json_barcode_not_found_msg([imagePNGPath],""))
-    return barcodeString
-
-def barcode_scan_at_resolutions (pil,scale_values):
+        # the image is stored unrotated; map the region accordingly
+        box = region_box(unrotate_region(scan_region, rotate), width, height)
+    symbols, orientation = scan_box(pil, box, decoder, rotate, whole_page, True, barcode_filter, bitmap)
+    # most pages are not cover sheets; a warning per page would flood
+    # the log (the progress records count the pages scanned)
+    if ( not symbols ):
+        lg.debug(json1.json_barcode_not_found_msg([imagePNGPath],""))
+    return scan_result(symbols, orientation, signature)
+
+def open_grayscale(imagePNGPath):
+    """
+    Return multiple values: a grayscale PIL image of the image file
+    specified by IMAGEPNGPATH and, if the file is a PGM file, the
+    pgm.PGMImage sharing its pixels with the PIL image (or None).
+    """
+    bitmap = pgm.open_pgm(imagePNGPath)
+    if bitmap:
+        return bitmap.image(), bitmap
+    return Image.open(imagePNGPath).convert('L'), None # 'L' is "black and white mode": converts to 8-bit pixels B/W
+
+def scan_result(symbols, orientation, signature=None):
+    selected = select_symbol(symbols)
+    return {
+        'barcode': (selected['data'] if selected else None),
+        'symbols': symbols,
+        'orientation': orientation,
+        'signature': signature
+    }
+
+def region_box(region, width, height):
+    """
+    Return the box (a 4-tuple: left,upper,right,lower), in pixels,
+    corresponding to REGION, [x1,y1,x2,y2] relative to the dimensions
+    (WIDTH and HEIGHT) of an image.
+    """
+    # relative (percentage) values between 0 and 1
+    x_crop_min = min(region[0],region[2])
+    x_crop_max = max(region[0],region[2])
+    y_crop_min = min(region[1],region[3])
+    y_crop_max = max(region[1],region[3])
+    cropTop=int(height*y_crop_min)
+    cropBottom=int(height*y_crop_max)
+    cropLeft=int(width*x_crop_min)
+    cropRight=int(width*x_crop_max)
+    # crop box is 4-tuple: left,upper,right,lower
+    return (cropLeft,cropTop,cropRight,cropBottom)
+
+def scan_box(pil, box, decoder, rotate, whole_page, retry_p, barcode_filter=None, bitmap=None):
+    """
+    Scan the portion, bounded by BOX, of the grayscale image PIL.
+    Return multiple values: a list of symbols, with bounding boxes
+    relative to the dimensions of PIL, and the orientation of the
+    barcodes (or None). If RETRY_P is true and no barcode is decoded,
+    locate, deskew, and decode the barcode portion of BOX (see
+    barcodeScanResult) and, failing that, decode BOX again at a lower
+    resolution. BITMAP, if specified, is the pgm.PGMImage holding the
+    pixels of PIL.
+    """
+    pilCropped = None
+    # the decoders handle bars at any multiple of 90 degrees; try the image as is first
+    if bitmap:
+        # hand the mapped pixels to the decoder without copying them
+        raw, width, height = bitmap.crop(box)
+        symbols = barcodeScan_decoder_raw(raw,width,height,decoder,barcode_filter)
+    else:
+        pilCropped = crop_image(pil, box)
+        symbols = barcodeScan_decoder_sub(pilCropped,decoder,barcode_filter)
+    if symbols:
+        # decoded as is: only the decoder can tell the orientation
+        return place_symbols(symbols, box, pil.size), symbol_orientation(symbols, rotate, 0)
+    if not retry_p:
+        return [], None
+    if pilCropped is None:
+        pilCropped = crop_image(pil, box)
+    # locate barcode-like texture to estimate the orientation and
+    # skew; this is cheap relative to decoding
+    located = locate_barcode(pilCropped)
+    if located:
+        located_box, bars = located
+        pilBarcode = pilCropped.crop(located_box)
+        skew = estimate_skew(pilBarcode, bars)
+        #  zbar sometimes catches a barcode at a lower resolution but misses it at a higher resolution. Scan for barcode with several variants of the barcode portion of the image.
+        symbols = barcode_scan_at_resolutions(rotate_image(pilBarcode, skew),None,decoder,barcode_filter)
+        if symbols:
+            # positions within the deskewed excerpt do not map directly onto the image
+            for symbol in symbols:
+                symbol['bbox'] = list(located_box)
+            image_box = (located_box[0] + box[0], located_box[1] + box[1],
+                         located_box[2] + box[0], located_box[3] + box[1])
+            return (place_symbols(symbols, box, pil.size),
+                    symbol_orientation(symbols, rotate, skew) or
+                    barcode_orientation(image_box, bars, pil.size, rotate, skew, whole_page))
+    # no texture located (e.g., a 2D symbol) or the located portion
+    # could not be decoded: the whole of BOX at a lower resolution
+    symbols = barcode_scan_at_resolutions(pilCropped,[0.5],decoder,barcode_filter)
+    if not symbols:
+        return [], None
+    return place_symbols(symbols, box, pil.size), symbol_orientation(symbols, rotate, 0)
+
+def symbol_orientation(symbols, rotate, skew):
+    """
+    Return the orientation (see barcode_orientation) of the barcode
+    selected from SYMBOLS (see select_symbol), decoded after rotating
+    the image by SKEW degrees, as reported by the decoder (see
+    decoders.make_symbol), or None if the decoder does not report the
+    rotation of the symbol. ROTATE is the /Rotate attribute of the
+    page. The sheet is assumed to bear the barcode upright; the
+    position of the barcode does not matter. 'bars' is None for a 2D
+    symbol.
+    """
+    symbol = select_symbol(symbols)
+    if not symbol or symbol.get('rotation') is None:
+        return None
+    bars = None
+    if symbol['type'] not in matrix_symbologies:
+        bars = ('vertical' if symbol['rotation'] in (0, 180) else 'horizontal')
+    return {
+        'rotate': rotate,
+        'rotation': (symbol['rotation'] + rotate) % 360,
+        'bars': bars,
+        'skew': skew
+    }
+
+def crop_image(pil, box):
+    if box != (0,0) + pil.size:
+        return pil.crop(box)
+    return pil
+
+def place_symbols(symbols, box, size):
+    """
+    Express the bounding box of each member of SYMBOLS, in pixels
+    relative to BOX within an image of size SIZE (width,height),
+    relative to the dimensions of the image. Return SYMBOLS.
+    """
+    width, height = size
+    for symbol in symbols:
+        if symbol['bbox']:
+            left, top, right, bottom = symbol['bbox']
+            symbol['bbox'] = [round(float(left + box[0]) / width, 4),
+                              round(float(top + box[1]) / height, 4),
+                              round(float(right + box[0]) / width, 4),
+                              round(float(bottom + box[1]) / height, 4)]
+    return symbols
+
+def select_symbol(symbols, match_re=None, symbologies=None, position=None):
+    """
+    Return the member of SYMBOLS which identifies the page or, if no
+    member qualifies, None. Symbols not matching the regex MATCH_RE
+    (if specified) are disregarded. Symbols are preferred in the order
+    of their symbology in the list SYMBOLOGIES (if specified; zbar
+    names, e.g., ['CODE128','QRCODE']); symbols of other symbologies
+    follow. Among symbols of equal preference, POSITION selects the
+    symbol nearest the 'top' (the default), 'bottom', 'left', or
+    'right' of the image, or the 'first' symbol reported by the
+    decoder.
+    """
+    candidates = [symbol for symbol in symbols if not match_re or match_re.match(symbol['data'])]
+    if not candidates:
+        return None
+    symbologies = symbologies or []
+    position = position or 'top'
+    def preference (i):
+        symbol = candidates[i]
+        rank = len(symbologies)
+        if symbol['type'] in symbologies:
+            rank = symbologies.index(symbol['type'])
+        bbox = symbol['bbox']
+        # symbols without a location follow those with a location
+        place = 2
+        if bbox and position != 'first':
+            place = {'top': bbox[1], 'bottom': -bbox[3], 'left': bbox[0], 'right': -bbox[2]}[position]
+        return (rank, place, i)
+    return candidates[min(range(len(candidates)), key=preference)]
+
+def unrotate_region(scan_region, rotate):
+    """
+    Return the region, as [x1,y1,x2,y2] relative to the image as
+    stored, corresponding to SCAN_REGION relative to the image as
+    displayed on a page with the /Rotate attribute ROTATE. (A page is
+    displayed rotated clockwise by ROTATE degrees.)
+    """
+    x1, y1, x2, y2 = scan_region
+    rotate = rotate % 360
+    if rotate == 90:
+        return [y1, 1-x2, y2, 1-x1]
+    elif rotate == 180:
+        return [1-x2, 1-y2, 1-x1, 1-y1]
+    elif rotate == 270:
+        return [1-y2, x1, 1-y1, x2]
+    return [x1, y1, x2, y2]
+
+def barcode_orientation(box, bars, size, rotate, skew, whole_page):
+    """
+    Return a dictionary describing the orientation of a barcode found
+    within BOX (a 4-tuple: left,upper,right,lower) in an image of size
+    SIZE (width,height). BARS is 'vertical' or 'horizontal' (see
+    locate_barcode), ROTATE is the /Rotate attribute of the page, and
+    SKEW is the estimated skew of the barcode in degrees (see
+    estimate_skew).
+
+    'rotation' is the clockwise rotation (0, 90, 180, or 270) of the
+    sheet as displayed, assuming the barcode is printed, with vertical
+    bars, in the top half of the sheet. The rotation can only be
+    estimated if WHOLE_PAGE is True (the image spans the page);
+    otherwise, 'rotation' is None.
+    """
+    rotation = None
+    if whole_page:
+        width, height = size
+        center_x = (box[0] + box[2]) / 2.0
+        center_y = (box[1] + box[3]) / 2.0
+        if bars == 'vertical':
+            sheet_rotation = (0 if center_y < height / 2.0 else 180)
+        else:
+            sheet_rotation = (90 if center_x >= width / 2.0 else 270)
+        rotation = (sheet_rotation + rotate) % 360
+    return {
+        'rotate': rotate,
+        'rotation': rotation,
+        'bars': bars,
+        'skew': skew
+    }
+
+def barcode_likely(imagePNGPath):
+    """
+    Return True if the image specified by IMAGEPNGPATH appears to
+    contain a barcode, whether or not the barcode can be decoded at the
+    resolution of the image. This is a cheap test intended to identify
+    images worth rendering again at a higher resolution.
+    """
+    return barcode_likely_pil(open_grayscale(imagePNGPath)[0])
+
+def barcode_likely_pil(pil):
+    """
+    Return True if the grayscale image PIL appears to contain a
+    linear barcode (see barcode_cells).
+    """
+    return bool(barcode_cells(pil))
+
+def barcode_cells(pil):
+    """
+    Return a list of (<column>,<row>,<bars>) tuples, one for each cell
+    of the grayscale image PIL which appears to hold part of a linear
+    barcode. The image is divided into cells; a linear barcode yields
+    a cell with high contrast between horizontally (or vertically)
+    adjacent pixels but low contrast in the perpendicular direction.
+    Text yields contrast in both directions. (Dense 2D symbols are not
+    distinguished from text and are not detected.) BARS is 'vertical'
+    if contrast is high between horizontally adjacent pixels and
+    'horizontal' otherwise.
+    """
+    width, height = pil.size
+    if width < 2 or height < 2:
+        return []
+    # differences between horizontally and vertically adjacent pixels
+    dx = ImageChops.difference(pil.crop((1,0,width,height-1)), pil.crop((0,0,width-1,height-1)))
+    dy = ImageChops.difference(pil.crop((0,1,width-1,height)), pil.crop((0,0,width-1,height-1)))
+    cells = (max(1,(width-1)//prefilter_cell_size), max(1,(height-1)//prefilter_cell_size))
+    # box filter: each cell holds the mean difference
+    found = []
+    for cell_index, (mean_dx, mean_dy) in enumerate(zip(dx.resize(cells,box_resample).getdata(), dy.resize(cells,box_resample).getdata())):
+        high = max(mean_dx,mean_dy)
+        low = min(mean_dx,mean_dy)
+        if high >= prefilter_min_contrast and high >= prefilter_min_ratio * (low + 1):
+            found.append((cell_index % cells[0], cell_index // cells[0],
+                          ('vertical' if mean_dx >= mean_dy else 'horizontal')))
+    return found
+
+def locate_barcode(pil):
+    """
+    Return multiple values: the box (a 4-tuple: left,upper,right,lower)
+    bounding the cells of the grayscale image PIL which appear to hold
+    a linear barcode and the orientation ('vertical' or 'horizontal')
+    of the bars. Return None if no such cells are found.
+    """
+    width, height = pil.size
+    # reduce large images (e.g., 300 dpi scans) to the scale at which
+    # the prefilter is tuned
+    factor = max(1, -(-max(width,height) // prefilter_max_size))
+    reduced = pil
+    if factor > 1:
+        reduced = pil.resize((max(2,width//factor),max(2,height//factor)),box_resample)
+    cells = barcode_cells(reduced)
+    if not cells:
+        return None
+    vertical = [cell for cell in cells if cell[2] == 'vertical']
+    horizontal = [cell for cell in cells if cell[2] == 'horizontal']
+    if len(vertical) >= len(horizontal):
+        cells, bars = vertical, 'vertical'
+    else:
+        cells, bars = horizontal, 'horizontal'
+    # cell coordinates -> image coordinates, with a margin of one cell
+    # (quiet zone and the ends of skewed bars)
+    size = prefilter_cell_size * factor
+    left = max(0, (min([cell[0] for cell in cells]) - 1) * size)
+    upper = max(0, (min([cell[1] for cell in cells]) - 1) * size)
+    right = min(width, (max([cell[0] for cell in cells]) + 2) * size)
+    lower = min(height, (max([cell[1] for cell in cells]) + 2) * size)
+    return (left, upper, right, lower), bars
+
+def estimate_skew(pil, bars):
+    """
+    Return the angle, in degrees counterclockwise, by which the
+    grayscale image PIL, holding a linear barcode with bars oriented as
+    BARS ('vertical' or 'horizontal'), should be rotated to square
+    the bars with the image. When the bars are square, the sums of
+    pixel values along the bars vary most from one bar to the next.
+    """
+    # work with a small sample; rotation cost scales with area
+    width, height = pil.size
+    scale = min(1.0, float(skew_sample_size) / max(width, height, 1))
+    sample = pil
+    if scale < 1.0:
+        sample = pil.resize((max(1,int(width*scale)),max(1,int(height*scale))),box_resample)
+    def score (angle):
+        rotated = rotate_image(sample, angle)
+        w, h = rotated.size
+        # 1-pixel-thick profile across the bars
+        if bars == 'vertical':
+            profile = list(rotated.resize((w,1),box_resample).getdata())
+        else:
+            profile = list(rotated.resize((1,h),box_resample).getdata())
+        mean = float(sum(profile)) / len(profile)
+        return sum([(value - mean) ** 2 for value in profile]) / len(profile)
+    # coarse search, then refine about the best coarse angle
+    angles = range(-skew_max_angle, skew_max_angle+1, skew_coarse_step)
+    best = max(angles, key=lambda angle: (score(angle), -abs(angle)))
+    fine_angles = range(best-skew_coarse_step+1, best+skew_coarse_step)
+    return max(fine_angles, key=lambda angle: (score(angle), -abs(angle)))
+
+def rotate_image(pil, angle):
+    """
+    Return the grayscale image PIL rotated ANGLE degrees
+    counterclockwise, expanded to hold the rotated image, with white
+    corners.
+    """
+    if not angle:
+        return pil
+    try:
+        return pil.rotate(angle, Image.BILINEAR, expand=True, fillcolor=255)
+    except TypeError:
+        # Pillow < 5.2: corners are black; paste onto white
+        mask = Image.new('L', pil.size, 255).rotate(angle, expand=True)
+        rotated = Image.new('L', mask.size, 255)
+        rotated.paste(pil.rotate(angle, Image.BILINEAR, expand=True), (0,0), mask)
+        return rotated
+
+def barcode_scan_at_resolutions (pil,scale_values,decoder=None,barcode_filter=None):
     """
     Try scans at multiple image resolutions since zbar sometimes is befuddled by high resolution images.
+    Return a list of symbols (see barcodeScan_decoder_sub).
     """
     if scale_values == [] :
         # done - empty array indicates all scale values have been tried
-        return None;
+        return [];
     elif ( not scale_values ):
-        # Options for leveraging zbar: (1) via shell invocation and (2) via python zbar library
-        #barcodeString = barcodeScan_zbarimg (pil)
-        barcodeString = barcodeScan_python_zbar_sub (pil)
-        if ( barcodeString ):
-            return barcodeString
+        symbols = barcodeScan_decoder_sub (pil,decoder,barcode_filter)
+        if ( symbols ):
+            return symbols
         else:
             scale_values = [ 0.5 ]
-            return barcode_scan_at_resolutions(pil,scale_values)
+            return barcode_scan_at_resolutions(pil,scale_values,decoder,barcode_filter)
     else:
         scale_value = scale_values.pop()
         resize_x = int(round(scale_value * pil.size[0]))
         resize_y = int(round(scale_value * pil.size[1]))
         pil_scaled = pil.resize( (resize_x, resize_y) )
-        barcodeString = barcodeScan_python_zbar_sub (pil_scaled)
-        if ( barcodeString ):
-            return barcodeString
+        symbols = barcodeScan_decoder_sub (pil_scaled,decoder,barcode_filter)
+        if ( symbols ):
+            # positions relative to PIL
+            for symbol in symbols:
+                if symbol['bbox']:
+                    symbol['bbox'] = [int(value / scale_value) for value in symbol['bbox']]
+            return symbols
         else:
-            return barcode_scan_at_resolutions(pil,scale_values)
+            return barcode_scan_at_resolutions(pil,scale_values,decoder,barcode_filter)
 
-def barcodeScan_zbarimg (pil):
+def barcodeScan_decoder_sub (pilCropped,decoder=None,barcode_filter=None):
     """
-    If possible, return the string encoded by the barcode in the image specified by PIL.
+    Return a list of the barcodes (see decoders.make_symbol), passing
+    BARCODE_FILTER if specified, found in the grayscale image
+    PILCROPPED.
     """
-    barcodeString = None
-    tf = tempfile.NamedTemporaryFile()
-    pil.save(tf,"png")
-    code_type_pairs,return_val = zbarimg(tf.name)
-    lg.debug("code_type_pairs: %s",code_type_pairs)
-    for code_type_pair in code_type_pairs:
-        barcodeString = code_type_pair[0]
-    tf.close()
-    return barcodeString
-
-def barcodeScan_python_zbar_sub (pilCropped):
-    lg.debug("barcodeScan_python_zbar_sub.00")
+    lg.debug("barcodeScan_decoder_sub.00")
     pilCroppedWidth,pilCroppedHeight = pilCropped.size
-    raw = pilCropped.tobytes()
-    # wrap raw image data in zbar.Image
-    image = zbar.Image(pilCroppedWidth, pilCroppedHeight, 'Y800', raw)
-    # create and configure a reader
-    scanner = zbar.ImageScanner()
-    scanner.parse_config('enable')
-    # scan the image for barcodes
-    scanner.scan(image)
-    # extract results
-    barcodeString = None
-    #lg.debug("image: %s",image)
-    #lg.debug("image dir: %s",dir(image))
-    #lg.debug("image symbols: %s",image.symbols)
-    # image.symbols should hold a zbar.SymbolSet object
-    for symbol in image:
+    return barcodeScan_decoder_raw(pilCropped.tobytes(),pilCroppedWidth,pilCroppedHeight,decoder,barcode_filter)
+
+def barcodeScan_decoder_raw (raw,width,height,decoder=None,barcode_filter=None):
+    """
+    Return a list of the barcodes (see decoders.make_symbol), passing
+    BARCODE_FILTER if specified, found in the grayscale image data RAW
+    (see decoders.py) of dimensions WIDTH and HEIGHT.
+    """
+    symbols = decoders.decode(raw,width,height,decoder,barcode_filter)
+    for symbol in symbols:
         lg.debug("symbol: %s",symbol)
-        barcodeString = symbol.data
-        #barcodeType = symbol.type
-    lg.debug("barcodeScan_python_zbar_sub.90: %s",barcodeString)
-    # clean up (destroy the image object to free up references to the data and symbols)
-    # - note: if another image will be scanned, it's also possible to simply recycle the image object
-    del(image)
-    return barcodeString
-
-# hangs with invocation from Common Lisp with large files
-def zbarimgWithPopen (path):
-    """
-    PATH can correspond to any file which the zbarimg executable can handle.
-    """
-    # limit to CODE128?
-    # -Sdisable -Scode128.enable
-    p = subprocess.Popen(['zbarimg',path],shell=False,stdout=subprocess.PIPE)
-    lines = p.stdout.readlines()
-    retval = p.wait()
-    return parse_zbarimg_lines(lines),retval
-
-# zbarimgWithCheckOutput
-def zbarimg (path):
-    """
-    PATH can correspond to any file which the zbarimg executable can handle. Return multiple values. The first value returned is a list of lists; each sublist contains two members, the encoded string and the encoding system. The second value returned is an integer representing the return code (exit status) associated with invocation of zbarimg.
-    """
-    # limit to CODE128?
-    # -Sdisable -Scode128.enable
-    output = None
-    returncode = None
-    try:
-        output = subprocess.check_output(
-            ['zbarimg',path],
-            shell=False,
-            stderr=subprocess.STDOUT)
-        returncode = 0
-    except subprocess.CalledProcessError as e:
-        returncode = e.returncode
-        output = e.output
-    lines = output.splitlines()
-    return parse_zbarimg_lines(lines),returncode
-
-def parse_zbarimg_line (line):
-    """
-    LINE is a string corresponding to a single line of zbarimg
-    output. Return the encoded string and the encoding system.
-    """
-    # example line: 'CODE-128:1000642\n'
-    line = line.rstrip()
-    colon_index = line.find(':')
-    return line[colon_index+1:],line[:colon_index]
-
-def parse_zbarimg_lines (lines):
-    parsed_lines = []
-    for line in lines:
-        parsed_line,code = parse_zbarimg_line(line)
-        parsed_lines.append([parsed_line,code])
-    return parsed_lines
+    return symbols
 
 if __name__ == "__main__":
     import sys
@@ -241,6 +560,6 @@ if __name__ == "__main__":
     # only intended to be run as python ./barScan.py "/path/to/foo.png"
     lg.debug("%s",sys.argv)
     if len(sys.argv) > 1:
-        barcodeScan(sys.argv[1])
+        barcodeScan(sys.argv[1],None)
     else:
         sys.exit("Must supply a single file as argument")
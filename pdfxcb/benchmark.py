@@ -0,0 +1,132 @@
+"""Compare barcode decoder backends on a corpus of page images
+"""
+
+# Author: David A. Thompson
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# configure logging
+import logging
+lg=logging
+
+from PIL import Image
+
+# internal modules
+import decoders
+
+# file suffixes recognized as page images
+image_suffixes = ['.png', '.pgm', '.pbm', '.ppm', '.jpg', '.jpeg', '.tif', '.tiff']
+
+def load_corpus(corpus_dir):
+    """
+    Return a list of (<file name>,<raw>,<width>,<height>) tuples, one
+    for each image in the directory CORPUS_DIR, where RAW is 8-bit
+    grayscale image data. Images are loaded up front so that image
+    decompression is not charged to any decoder.
+    """
+    corpus = []
+    for file_name in sorted(os.listdir(corpus_dir)):
+        if os.path.splitext(file_name)[1].lower() in image_suffixes:
+            pil = Image.open(os.path.join(corpus_dir,file_name)).convert('L')
+            width, height = pil.size
+            corpus.append((file_name,pil.tobytes(),width,height))
+    return corpus
+
+def benchmark_decoder(decoder,corpus,repeat):
+    """
+    Decode each image in CORPUS (see load_corpus) REPEAT times with
+    the backend DECODER. Return multiple values: a dictionary mapping
+    file names to the list of encoded strings found and the mean time,
+    in seconds, to decode the corpus once.
+    """
+    found = {}
+    start_time = time.time()
+    for iteration in range(repeat):
+        for file_name, raw, width, height in corpus:
+            found[file_name] = [symbol['data'] for symbol in decoders.decode(raw,width,height,decoder)]
+    return found,(time.time() - start_time)/repeat
+
+def benchmark(corpus_dir,decoder_names,expected,repeat):
+    """
+    Return a list of dictionaries, one per decoder named in
+    DECODER_NAMES, describing throughput and recall on the images in
+    CORPUS_DIR. EXPECTED maps file names to the encoded string
+    expected for the image (images without a barcode are absent or
+    map to None). If EXPECTED is None, the barcodes found by any
+    decoder are taken as the expected barcodes.
+    """
+    corpus = load_corpus(corpus_dir)
+    found_by_decoder = {}
+    seconds_by_decoder = {}
+    for decoder in decoder_names:
+        found_by_decoder[decoder], seconds_by_decoder[decoder] = benchmark_decoder(decoder,corpus,repeat)
+    if expected is None:
+        expected = {}
+        for found in found_by_decoder.values():
+            for file_name, codes in found.items():
+                if codes:
+                    expected.setdefault(file_name,codes[0])
+    expected_count = len([file_name for file_name, code in expected.items() if code])
+    results = []
+    for decoder in decoder_names:
+        found = found_by_decoder[decoder]
+        seconds = seconds_by_decoder[decoder]
+        hits = len([file_name for file_name, code in expected.items()
+                    if code and code in found.get(file_name,[])])
+        # a barcode reported for an image expected to lack one, or differing from the expected barcode
+        false_positives = len([file_name for file_name, codes in found.items()
+                               if codes and expected.get(file_name) not in codes])
+        results.append({
+            'decoder': decoder,
+            'images': len(corpus),
+            'seconds': seconds,
+            'images_per_second': (len(corpus)/seconds if seconds else None),
+            'expected': expected_count,
+            'found': hits,
+            'recall': (float(hits)/expected_count if expected_count else None),
+            'false_positives': false_positives
+        })
+    return results
+
+def main():
+    """Handle command-line invocation of benchmark.py."""
+    parser = argparse.ArgumentParser(description="Compare barcode decoder backends on a corpus of page images")
+    parser.add_argument("-b",
+                        help="comma-separated list of decoders (default: all available decoders)",
+                        action="store",
+                        dest="decoder_names",
+                        type=str)
+    parser.add_argument("-e",
+                        help="JSON file mapping image file names to expected barcodes (default: pool the barcodes found by all decoders)",
+                        action="store",
+                        dest="expected_file",
+                        type=str)
+    parser.add_argument("-r",
+                        help="number of passes over the corpus (default: 1)",
+                        action="store",
+                        dest="repeat",
+                        default=1,
+                        type=int)
+    parser.add_argument("corpus_dir", help="directory containing page images",
+                        type=str)
+    args = parser.parse_args()
+    if args.decoder_names:
+        decoder_names = args.decoder_names.split(',')
+    else:
+        decoder_names = decoders.available_decoders()
+    for decoder in decoder_names:
+        decoders.decoder_sanity_check(decoder)
+    expected = None
+    if args.expected_file:
+        with open(args.expected_file) as f:
+            expected = json.load(f)
+    for result in benchmark(args.corpus_dir,decoder_names,expected,args.repeat):
+        sys.stdout.write(json.dumps(result, sort_keys=True))
+        sys.stdout.write('\n')
+
+if __name__ == "__main__":
+    main()
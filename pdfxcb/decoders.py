@@ -0,0 +1,470 @@
+"""Barcode decoder backends
+"""
+
+# Author: David A. Thompson
+
+#
+# Each backend decodes 8-bit grayscale image data (Y800: one byte per
+# pixel, row by row, no padding) held in memory: a bytes object or
+# any object exporting such a buffer (e.g., the ctypes array sharing a
+# memory-mapped PGM file; see pgm.py). The pyzbar and zxing backends
+# hand the buffer to the library without copying it. The python zbar
+# binding (the default backend) accepts only a string, so the zbar
+# backend copies each image once; zbarimg reads the image from a
+# temporary file. A backend is a
+# function DECODE(RAW,WIDTH,HEIGHT,BARCODE_FILTER) returning a list of
+# symbols (see make_symbol), one for each barcode found. Symbology
+# names are normalized to the zbar names (e.g., CODE128, QRCODE,
+# EAN13).
+#
+# A barcode filter (see make_barcode_filter) describes the barcodes of
+# interest. Each backend pushes as much of the filter as it can into
+# the configuration of the decoder (symbologies and, for zbar, length
+# limits) so that other barcodes are not decoded at all; DECODE
+# applies the remainder of the filter to the symbols returned.
+#
+#
+# Backends are registered in DECODERS along with the python module
+# each requires. The zbar backend relies on the python zbar binding,
+# the zbarimg backend relies on the zbarimg executable, the pyzbar
+# backend relies on pyzbar, and the zxing backend relies on zxingcpp.
+#
+
+import imp
+import re
+import sys
+import tempfile
+import threading
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+import tools
+import util
+
+# name -> (required python module or None, required executable or None, decode function)
+decoders = {}
+
+default_decoder = 'zbar'
+
+def register_decoder(name,module_name,executable_name,decode_fn):
+    """
+    Make DECODE_FN available as the backend NAME. MODULE_NAME and
+    EXECUTABLE_NAME specify the python module and executable required
+    by the backend (either may be None).
+    """
+    decoders[name] = (module_name,executable_name,decode_fn)
+
+def decoder_available_p(name):
+    """Return True if the backend NAME can be used."""
+    module_name, executable_name, decode_fn = decoders[name]
+    if module_name:
+        try:
+            imp.find_module(module_name)
+        except ImportError:
+            return False
+    if executable_name and not util.which(executable_name):
+        return False
+    return True
+
+def available_decoders():
+    """Return a sorted list of the names of backends which can be used."""
+    return sorted([name for name in decoders if decoder_available_p(name)])
+
+def decoder_sanity_check(name):
+    """
+    Log and exit if the backend NAME is unknown or cannot be used.
+    """
+    if name not in decoders:
+        msg = json1.json_msg(137,'Unknown barcode decoder: {}'.format(name),False)
+        lg.error(msg)
+        lg.info(json1.json_last_log_msg())
+        sys.exit(msg)
+    module_name, executable_name, decode_fn = decoders[name]
+    if not decoder_available_p(name):
+        if module_name:
+            msg = json1.json_msg_module_not_accessible(module_name)
+        else:
+            msg = json1.json_msg_executable_not_accessible(executable_name)
+        lg.error(msg)
+        lg.info(json1.json_last_log_msg())
+        sys.exit(msg)
+
+def decode(raw,width,height,decoder=None,barcode_filter=None):
+    """
+    Decode the barcodes in the grayscale image data RAW (see above)
+    using the backend DECODER (by default, DEFAULT_DECODER). Return a
+    list of symbols (see make_symbol) which pass BARCODE_FILTER (if
+    specified).
+    """
+    symbols = decoders[decoder or default_decoder][2](raw,width,height,barcode_filter)
+    if barcode_filter:
+        symbols = [symbol for symbol in symbols if symbol_passes_p(symbol,barcode_filter)]
+    return symbols
+
+def raw_bytes(raw):
+    """Return the image data RAW as a bytes object, copying RAW only if necessary."""
+    if isinstance(raw,bytes):
+        return raw
+    return memoryview(raw).tobytes()
+
+def warm(decoder=None,barcode_filter=None):
+    """
+    Prepare the backend DECODER (by default, DEFAULT_DECODER) for use
+    by the current thread with BARCODE_FILTER, so that the first image
+    decoded does not bear the cost of loading and configuring the
+    decoder.
+    """
+    decode(b'\xff' * 64,8,8,decoder,barcode_filter)
+
+def make_symbol(data,symbology,points=None,quality=None,rotation=None):
+    """
+    Return a dictionary describing a barcode: 'data' is the encoded
+    string, 'type' is the symbology (see symbology_name), 'bbox' is the
+    box [left,top,right,bottom], in pixels, bounding POINTS (a sequence
+    of (x,y) pairs outlining the barcode) or None if the location is
+    unknown, 'quality' is a backend-specific measure of confidence
+    (larger is better) or None, and 'rotation' is ROTATION, the
+    clockwise rotation (0, 90, 180, or 270) of the barcode within the
+    image, as reported by the decoder, or None if unknown.
+    """
+    bbox = None
+    if points:
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        bbox = [min(xs),min(ys),max(xs)+1,max(ys)+1]
+    return {
+        'data': data,
+        'type': symbology_name(symbology),
+        'bbox': bbox,
+        'quality': quality,
+        'rotation': rotation
+    }
+
+# zbar orientation (zbar_orientation_t) -> clockwise rotation of the symbol
+zbar_rotations = {
+    'UP': 0,
+    'RIGHT': 90,
+    'DOWN': 180,
+    'LEFT': 270
+}
+
+def zbar_rotation(orientation):
+    """
+    Return the clockwise rotation of a symbol whose zbar orientation
+    is ORIENTATION (a name, e.g., 'UP', an enumeration member with such
+    a name, or the zbar_orientation_t value) or None if ORIENTATION is
+    None or unknown (e.g., ZBAR_ORIENT_UNKNOWN).
+    """
+    if orientation is None:
+        return None
+    name = str(orientation).rsplit('.',1)[-1].upper()
+    if name in zbar_rotations:
+        return zbar_rotations[name]
+    try:
+        value = int(orientation)
+    except (TypeError, ValueError):
+        return None
+    if 0 <= value < 4:
+        return value * 90
+    return None
+
+# names used by other decoders for zbar symbologies
+symbology_aliases = {
+    'ITF': 'I25',
+    'DATABAREXPANDED': 'DATABAREXP',
+    'QR': 'QRCODE'
+}
+
+def symbology_name(name):
+    """
+    Return the zbar name corresponding to the symbology name NAME
+    (e.g., 'CODE-128', 'Code 128', and 'BarcodeFormat.Code128' all
+    correspond to CODE128).
+    """
+    name = str(name).upper()
+    if name.startswith('BARCODEFORMAT.'):
+        name = name[len('BARCODEFORMAT.'):]
+    name = name.replace('-','').replace('_','').replace(' ','')
+    return symbology_aliases.get(name,name)
+
+#
+# barcode filters
+#
+def make_barcode_filter(symbologies=None,min_length=None,max_length=None,check_digit=None,match_re=None):
+    """
+    Return a barcode filter: a barcode passes if its symbology is a
+    member of SYMBOLOGIES (a list of symbology names), if the length
+    of the encoded string is at least MIN_LENGTH and at most
+    MAX_LENGTH, if the encoded string ends with a valid check digit
+    according to the scheme CHECK_DIGIT (see check_digit_schemes), and
+    if the encoded string matches the regex MATCH_RE (a string or a
+    compiled regex). Constraints which are None are not applied.
+    """
+    if check_digit and check_digit not in check_digit_schemes:
+        raise ValueError('Unknown check digit scheme: {}'.format(check_digit))
+    if isinstance(match_re,str):
+        match_re = re.compile(match_re)
+    return {
+        'symbologies': ([symbology_name(symbology) for symbology in symbologies] if symbologies else None),
+        'min_length': min_length,
+        'max_length': max_length,
+        'check_digit': check_digit,
+        'match_re': match_re
+    }
+
+def symbol_passes_p(symbol,barcode_filter):
+    """Return True if SYMBOL (see make_symbol) passes BARCODE_FILTER."""
+    data = symbol['data']
+    if barcode_filter['symbologies'] and symbol['type'] not in barcode_filter['symbologies']:
+        return False
+    if barcode_filter['min_length'] is not None and len(data) < barcode_filter['min_length']:
+        return False
+    if barcode_filter['max_length'] is not None and len(data) > barcode_filter['max_length']:
+        return False
+    if barcode_filter['check_digit'] and not check_digit_schemes[barcode_filter['check_digit']](data):
+        return False
+    if barcode_filter['match_re'] and not barcode_filter['match_re'].match(data):
+        return False
+    return True
+
+def mod10_check_digit_p(data):
+    """
+    Return True if DATA, a string of digits, ends with a valid GS1
+    (EAN, UPC, ITF, SSCC) mod 10 check digit.
+    """
+    if len(data) < 2 or not data.isdigit():
+        return False
+    digits = [int(digit) for digit in reversed(data[:-1])]
+    total = sum([digit * (3 if i % 2 == 0 else 1) for i, digit in enumerate(digits)])
+    return (10 - total % 10) % 10 == int(data[-1])
+
+def luhn_check_digit_p(data):
+    """Return True if DATA, a string of digits, passes the Luhn check."""
+    if len(data) < 2 or not data.isdigit():
+        return False
+    total = 0
+    for i, digit in enumerate([int(digit) for digit in reversed(data)]):
+        if i % 2 == 1:
+            digit = digit * 2
+            if digit > 9:
+                digit = digit - 9
+        total = total + digit
+    return total % 10 == 0
+
+code39_characters = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%'
+
+def mod43_check_digit_p(data):
+    """Return True if DATA ends with a valid Code 39 mod 43 check character."""
+    if len(data) < 2 or [c for c in data if c not in code39_characters]:
+        return False
+    return code39_characters[sum([code39_characters.index(c) for c in data[:-1]]) % 43] == data[-1]
+
+check_digit_schemes = {
+    'mod10': mod10_check_digit_p,
+    'luhn': luhn_check_digit_p,
+    'mod43': mod43_check_digit_p
+}
+
+#
+# zbar (python binding)
+#
+
+# zbar.ImageScanner objects are reused from one image to the next;
+# one scanner per configuration (see zbar_config) and per thread (a
+# scanner must not be used by two threads at once)
+zbar_state = threading.local()
+
+# zbar configuration names differing from the (normalized) symbology name
+zbar_config_names = {
+    'DATABAREXP': 'databar-exp'
+}
+
+# symbologies with a variable length (zbar min-length and max-length apply)
+zbar_variable_length_symbologies = ['CODE128', 'CODE39', 'CODE93', 'I25', 'CODABAR', 'DATABAREXP']
+
+def zbar_config(barcode_filter):
+    """
+    Return a list of zbar configuration settings (as accepted by
+    zbar_parse_config and by zbarimg -S) implementing as much of
+    BARCODE_FILTER as zbar supports.
+    """
+    if not barcode_filter:
+        return ['enable']
+    if not barcode_filter['symbologies']:
+        # unprefixed settings apply to every symbology
+        config = ['enable']
+        if barcode_filter['min_length'] is not None:
+            config.append('min-length={}'.format(barcode_filter['min_length']))
+        if barcode_filter['max_length'] is not None:
+            config.append('max-length={}'.format(barcode_filter['max_length']))
+        return config
+    config = ['disable']
+    for symbology in barcode_filter['symbologies']:
+        name = zbar_config_names.get(symbology,symbology.lower())
+        config.append(name + '.enable')
+        if symbology in zbar_variable_length_symbologies:
+            if barcode_filter['min_length'] is not None:
+                config.append('{}.min-length={}'.format(name,barcode_filter['min_length']))
+            if barcode_filter['max_length'] is not None:
+                config.append('{}.max-length={}'.format(name,barcode_filter['max_length']))
+    return config
+
+def decode_zbar(raw,width,height,barcode_filter=None):
+    import zbar
+    config = tuple(zbar_config(barcode_filter))
+    zbar_scanners = getattr(zbar_state,'scanners',None)
+    if zbar_scanners is None:
+        zbar_scanners = zbar_state.scanners = {}
+    zbar_scanner = zbar_scanners.get(config)
+    if not zbar_scanner:
+        zbar_scanner = zbar.ImageScanner()
+        for setting in config:
+            zbar_scanner.parse_config(setting)
+        zbar_scanners[config] = zbar_scanner
+    # wrap raw image data in zbar.Image
+    try:
+        image = zbar.Image(width, height, 'Y800', raw)
+    except TypeError:
+        # the binding (at least under Python 2) only accepts a string:
+        # the image is copied once
+        image = zbar.Image(width, height, 'Y800', raw_bytes(raw))
+    zbar_scanner.scan(image)
+    # image.symbols should hold a zbar.SymbolSet object
+    # releases of the binding before zbar 0.11 lack orientation
+    symbols = [make_symbol(symbol.data, symbol.type, symbol.location, symbol.quality,
+                           zbar_rotation(getattr(symbol,'orientation',None)))
+               for symbol in image]
+    # clean up (destroy the image object to free up references to the data and symbols)
+    del(image)
+    return symbols
+
+register_decoder('zbar','zbar',None,decode_zbar)
+
+#
+# zbarimg (executable)
+#
+def decode_zbarimg(raw,width,height,barcode_filter=None):
+    # zbarimg only reads files; PGM is the cheapest format to write
+    tf = tempfile.NamedTemporaryFile(suffix='.pgm')
+    try:
+        tf.write(pgm_header(width,height))
+        tf.write(raw)
+        tf.flush()
+        code_type_pairs, returncode = zbarimg(tf.name,zbar_config(barcode_filter))
+    finally:
+        tf.close()
+    # zbarimg does not report locations
+    return [make_symbol(code, code_type) for code, code_type in code_type_pairs]
+
+def pgm_header(width,height):
+    """Return the header of a binary (P5) 8-bit PGM file."""
+    return ('P5\n%d %d\n255\n' % (width,height)).encode('ascii')
+
+def zbarimg (path,config=None):
+    """
+    PATH can correspond to any file which the zbarimg executable can handle. Return multiple values. The first value returned is a list of lists; each sublist contains two members, the encoded string and the encoding system. The second value returned is an integer representing the return code (exit status) associated with invocation of zbarimg. CONFIG is a list of zbar configuration settings (see zbar_config).
+    """
+    # e.g., -Sdisable -Scode128.enable
+    settings = ['-S' + setting for setting in (config or [])]
+    # zbarimg reports symbols on stdout and a summary on stderr;
+    # tools.run drains both so large images cannot block zbarimg on a
+    # full pipe
+    returncode, lines = tools.run(['zbarimg','--quiet'] + settings + [path])
+    return parse_zbarimg_lines(lines),returncode
+
+def parse_zbarimg_line (line):
+    """
+    LINE is a string corresponding to a single line of zbarimg
+    output. Return the encoded string and the encoding system.
+    """
+    # example line: 'CODE-128:1000642\n'
+    line = line.rstrip()
+    colon_index = line.find(':')
+    return line[colon_index+1:],line[:colon_index]
+
+def parse_zbarimg_lines (lines):
+    parsed_lines = []
+    for line in lines:
+        parsed_line,code = parse_zbarimg_line(line)
+        parsed_lines.append([parsed_line,code])
+    return parsed_lines
+
+register_decoder('zbarimg',None,'zbarimg',decode_zbarimg)
+
+#
+# pyzbar (ctypes binding to libzbar)
+#
+def decode_pyzbar(raw,width,height,barcode_filter=None):
+    from pyzbar import pyzbar
+    symbols = None
+    if barcode_filter and barcode_filter['symbologies']:
+        # pyzbar only accepts symbologies it knows
+        symbols = [symbol for symbol in pyzbar.ZBarSymbol
+                   if symbology_name(symbol.name) in barcode_filter['symbologies']]
+    # pyzbar passes RAW (bytes or a ctypes array) to libzbar by
+    # address; older releases of pyzbar lack polygon, quality, and
+    # orientation
+    return [make_symbol(symbol.data, symbol.type, pyzbar_points(symbol), getattr(symbol,'quality',None),
+                        zbar_rotation(getattr(symbol,'orientation',None)))
+            for symbol in pyzbar.decode((raw,width,height),symbols=symbols)]
+
+def pyzbar_points(symbol):
+    polygon = getattr(symbol,'polygon',None)
+    if polygon:
+        return polygon
+    left, top, width, height = symbol.rect
+    return [(left,top),(left+width-1,top+height-1)]
+
+register_decoder('pyzbar','pyzbar',None,decode_pyzbar)
+
+#
+# zxing (zxing-cpp binding)
+#
+def decode_zxing(raw,width,height,barcode_filter=None):
+    import zxingcpp
+    from PIL import Image
+    # frombuffer shares RAW rather than copying it
+    pil = Image.frombuffer('L',(width,height),raw,'raw','L',0,1)
+    formats = zxing_formats(zxingcpp,barcode_filter)
+    if formats is None:
+        results = zxingcpp.read_barcodes(pil)
+    else:
+        results = zxingcpp.read_barcodes(pil,formats=formats)
+    return [make_symbol(result.text, result.format, zxing_points(result.position), None,
+                        zxing_rotation(getattr(result,'orientation',None)))
+            for result in results]
+
+def zxing_rotation(orientation):
+    """
+    Return the clockwise rotation (0, 90, 180, or 270) nearest
+    ORIENTATION, the clockwise angle (degrees) of a symbol reported by
+    zxing-cpp, or None if ORIENTATION is None.
+    """
+    if orientation is None:
+        return None
+    return int(round(orientation / 90.0)) * 90 % 360
+
+def zxing_formats(zxingcpp,barcode_filter):
+    """
+    Return the zxingcpp.BarcodeFormat flags corresponding to the
+    symbologies of BARCODE_FILTER or None if all formats are of
+    interest.
+    """
+    if not barcode_filter or not barcode_filter['symbologies']:
+        return None
+    formats = None
+    for name in dir(zxingcpp.BarcodeFormat):
+        if not name.startswith('_') and symbology_name(name) in barcode_filter['symbologies']:
+            barcode_format = getattr(zxingcpp.BarcodeFormat,name)
+            formats = barcode_format if formats is None else formats | barcode_format
+    return formats
+
+def zxing_points(position):
+    corners = [position.top_left, position.top_right, position.bottom_right, position.bottom_left]
+    return [(corner.x, corner.y) for corner in corners]
+
+register_decoder('zxing','zxingcpp',None,decode_zxing)
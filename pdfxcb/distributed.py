@@ -0,0 +1,440 @@
+"""Extract and scan pages on several workers
+"""
+
+# Author: David A. Thompson
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import threading
+import time
+
+# configure logging
+import logging
+lg=logging
+
+try:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode
+    from urllib2 import HTTPError, Request, urlopen
+    from urlparse import parse_qs, urlsplit
+    import Queue as queue
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import HTTPError
+    from urllib.parse import parse_qs, urlencode, urlsplit
+    from urllib.request import Request, urlopen
+    import queue
+
+# internal modules
+import decoders
+import json1
+import pdf
+import pdfindex
+import pdfxcb
+import progress
+import tools
+
+#
+# A coordinator divides the pages of a PDF into work units (runs of
+# consecutive pages) and hands each unit to a worker. A worker is an
+# HTTP server (see serve) which extracts and scans the pages of a unit
+# exactly as a single-node run would (see pdfxcb.extract_and_scan) and
+# returns the scan result for each image. The coordinator merges the
+# results, in page order, and selects cover sheets and splits the PDF
+# itself, so the cover sheets found do not depend on how the pages
+# were divided.
+#
+# A unit is described to a worker by a POST to /scan; the query
+# parameter 'options' holds a JSON object (see scan_options). If the
+# worker can read the input PDF (workers on the coordinator's host),
+# the object names the file and the pages to scan. Otherwise, the
+# body of the request holds a PDF containing only the pages of the
+# unit. The response is a JSON object (see scan_unit).
+#
+# A worker does not authenticate its clients. Any client able to reach
+# it can have it process a PDF; only a client on the worker's host
+# (i.e., connecting through the loopback interface) may name a file
+# for it to read (see local_client_p).
+#
+
+# number of units per worker when the unit size is not specified;
+# several units per worker even out differences in speed
+default_units_per_worker = 2
+
+# seconds; a unit which takes longer is abandoned
+request_timeout = 3600
+
+# hosts whose workers are assumed to share the coordinator's file system
+local_hosts = ['localhost', '127.0.0.1']
+
+#
+# coordinator
+#
+def scan_distributed(pdf_file_spec,index,scratch_dir,workers,match_re,rasterize_p,decoder,timings,resolutions=None,barcode_filter=None,unit_pages=None,signature_p=False):
+    """
+    Extract and scan the pages of the PDF file specified by
+    PDF_FILE_SPEC, described by INDEX, using WORKERS, a list of worker
+    addresses ('<host>:<port>'). Return values as
+    pdfxcb.extract_and_scan. UNIT_PAGES is the number of pages per
+    work unit. A worker may be listed more than once to have it scan
+    several units at a time. If a worker fails, its unit is handed to
+    another worker; an exception is raised if no worker remains. See
+    pdfxcb.extract_and_scan regarding SIGNATURE_P.
+    """
+    start_time = time.time()
+    units = work_units(index.number_of_pages,
+                       unit_pages or default_unit_pages(index.number_of_pages,len(workers)))
+    options = scan_options(match_re,rasterize_p,decoder,resolutions,barcode_filter,signature_p)
+    if [worker for worker in workers if worker_host(worker) not in local_hosts]:
+        index_file = None
+    else:
+        # local workers read the input and the index directly
+        index_file = os.path.join(scratch_dir,'index.json')
+        pdfindex.save_index(index,index_file)
+    unit_queue = queue.Queue()
+    for unit in units:
+        unit_queue.put(unit)
+    results = {}
+    failures = []
+    # the PyPDF2 reader is not safe for concurrent use
+    reader_lock = threading.Lock()
+    # pages are reported as done by the dispatching threads
+    run_progress = progress.current()
+    progress.stage('scan',index.number_of_pages)
+    def dispatch (worker):
+        while True:
+            try:
+                unit = unit_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if index_file:
+                    results[unit] = request_scan(worker,options,unit,pdf_file_spec=pdf_file_spec,index_file=index_file)
+                else:
+                    with reader_lock:
+                        unit_file_spec = write_unit(pdf_file_spec,index,scratch_dir,unit)
+                    results[unit] = request_scan(worker,options,unit,unit_file_spec=unit_file_spec)
+                if run_progress:
+                    run_progress.advance(unit[1] - unit[0] + 1)
+            except Exception as e:
+                lg.error(json1.json_msg(112,['Worker failed', str(e)],False,data={'worker': worker, 'pages': list(unit)}))
+                failures.append(worker)
+                # another worker takes the unit
+                unit_queue.put(unit)
+                return
+    remaining_workers = list(workers)
+    while remaining_workers and not unit_queue.empty():
+        threads = [threading.Thread(target=dispatch,args=(worker,)) for worker in remaining_workers]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # a unit given up by a failed worker may remain after the others finish
+        remaining_workers = [worker for worker in remaining_workers if worker not in failures]
+    if len(results) < len(units):
+        raise Exception("No worker remains to scan pages {}".format(sorted([unit for unit in units if unit not in results])))
+    png_file_page_number_tuples = []
+    scan_results = []
+    timings['extract'] = 0
+    timings['scan'] = 0
+    for unit in units:
+        for png_file, page_number, scan_result in results[unit]['images']:
+            png_file_page_number_tuples.append((png_file,page_number))
+            scan_results.append(scan_result)
+        timings['extract'] = timings['extract'] + results[unit]['timings']['extract']
+        timings['scan'] = timings['scan'] + results[unit]['timings']['scan']
+    timings['distributed'] = time.time() - start_time
+    return png_file_page_number_tuples, scan_results
+
+def default_unit_pages(number_of_pages,number_of_workers):
+    return max(1, -(-number_of_pages // (number_of_workers * default_units_per_worker)))
+
+def work_units(number_of_pages,unit_pages):
+    """
+    Return a list of (<first page>,<last page>) tuples dividing the
+    pages 1 through NUMBER_OF_PAGES into runs of UNIT_PAGES pages.
+    """
+    return [(first_page, min(first_page + unit_pages - 1, number_of_pages))
+            for first_page in range(1, number_of_pages + 1, unit_pages)]
+
+def write_unit(pdf_file_spec,index,scratch_dir,unit):
+    """
+    Write the pages of UNIT, a (<first page>,<last page>) tuple, of
+    the PDF file specified by PDF_FILE_SPEC to a file in SCRATCH_DIR.
+    Return the file name.
+    """
+    unit_file_spec = os.path.join(scratch_dir,'unit-{}-{}.pdf'.format(unit[0],unit[1]))
+    pdf.pdf_split(pdf_file_spec,[unit_file_spec],[unit],index.reader())
+    return unit_file_spec
+
+def scan_options(match_re,rasterize_p,decoder,resolutions,barcode_filter,signature_p=False):
+    """Return a dictionary (serializable as JSON) of scan options."""
+    filter_obj = None
+    if barcode_filter:
+        filter_obj = dict(barcode_filter)
+        if barcode_filter['match_re']:
+            filter_obj['match_re'] = barcode_filter['match_re'].pattern
+    return {
+        'match': (match_re.pattern if match_re else None),
+        'rasterize': rasterize_p,
+        'decoder': decoder,
+        'resolutions': resolutions,
+        'filter': filter_obj,
+        'signatures': signature_p
+    }
+
+def worker_host(worker):
+    return worker.rsplit(':',1)[0]
+
+def request_scan(worker,options,unit,pdf_file_spec=None,index_file=None,unit_file_spec=None):
+    """
+    Ask WORKER to scan UNIT, a (<first page>,<last page>) tuple.
+    Either PDF_FILE_SPEC (and, optionally, INDEX_FILE), the input as
+    seen by the worker, or UNIT_FILE_SPEC, a PDF holding only the
+    pages of UNIT, should be specified. Return the decoded response
+    (see scan_unit).
+    """
+    options = dict(options)
+    options['first_page'], options['last_page'] = unit
+    body = None
+    if unit_file_spec:
+        with open(unit_file_spec,'rb') as f:
+            body = f.read()
+    else:
+        options['file'] = os.path.abspath(pdf_file_spec)
+        options['index_file'] = index_file
+    url = 'http://{}/scan?{}'.format(worker,urlencode({'options': json.dumps(options)}))
+    request = Request(url,data=(body if body is not None else b''),
+                      headers={'Content-Type': 'application/pdf'})
+    lg.debug("worker %s: pages %s",worker,unit)
+    try:
+        response = urlopen(request,timeout=request_timeout)
+    except HTTPError as e:
+        raise Exception("{}: {}".format(e.code,e.read()))
+    try:
+        return json.loads(response.read().decode('utf-8'))
+    finally:
+        response.close()
+
+#
+# worker
+#
+class WorkerHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # SCRATCH_ROOT is the directory within which scratch directories are created
+    scratch_root = None
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/scan':
+            return self.send_json(404,{'error': 'unknown endpoint: ' + url.path})
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        try:
+            options = json.loads(parse_qs(url.query)['options'][0])
+        except (KeyError, ValueError) as e:
+            return self.send_json(400,{'error': 'malformed options: ' + str(e)})
+        if ((options.get('file') or options.get('index_file')) and
+            not local_client_p(self.client_address[0])):
+            return self.send_json(403,{'error': 'files may be named only by a client on the host of the worker'})
+        if options.get('decoder') and not (options['decoder'] in decoders.decoders and
+                                           decoders.decoder_available_p(options['decoder'])):
+            return self.send_json(400,{'error': 'decoder unavailable: ' + options['decoder']})
+        try:
+            result = scan_request(options,body,self.server.scratch_root)
+        except Exception as e:
+            lg.error(json1.json_msg(112,['Failed to scan work unit', str(e)],False))
+            return self.send_json(500,{'error': str(e)})
+        self.send_json(200,result)
+
+    def send_json(self,status,obj):
+        data = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self,format,*args):
+        lg.debug("%s %s",self.address_string(),format % args)
+
+def local_client_p(client_host):
+    """Return True if CLIENT_HOST is an address of the loopback interface."""
+    if client_host.startswith('::ffff:'):
+        # IPv4-mapped IPv6 address
+        client_host = client_host[len('::ffff:'):]
+    return client_host.startswith('127.') or client_host == '::1'
+
+def scan_request(options,body,scratch_root):
+    """
+    Scan the work unit described by OPTIONS (see request_scan). BODY,
+    if not empty, is a PDF holding only the pages of the unit.
+    """
+    scratch_dir = pdfxcb.make_scratch_dir(scratch_root)
+    try:
+        if body:
+            pdf_file_spec = os.path.join(scratch_dir,'unit.pdf')
+            with open(pdf_file_spec,'wb') as f:
+                f.write(body)
+            page_numbers = None
+            page_offset = options['first_page'] - 1
+            index = pdfindex.build_index(pdf_file_spec)
+        else:
+            pdf_file_spec = options['file']
+            page_numbers = range(options['first_page'],options['last_page']+1)
+            page_offset = 0
+            index = pdfindex.document_index(pdf_file_spec,options.get('index_file'))
+        try:
+            return scan_unit(pdf_file_spec,index,scratch_dir,options,page_numbers,page_offset)
+        finally:
+            index.close()
+    finally:
+        shutil.rmtree(scratch_dir,ignore_errors=True)
+
+def scan_unit(pdf_file_spec,index,scratch_dir,options,page_numbers,page_offset):
+    """
+    Extract and scan the pages PAGE_NUMBERS (by default, all pages) of
+    the PDF file specified by PDF_FILE_SPEC. Return a dictionary:
+    'images' is a list of [<PNG file name>,<PDF page number>,<scan
+    result>] lists (see pdfxcb.scan_for_barcode), ordered by page
+    number, where page numbers are offset by PAGE_OFFSET, and
+    'timings' holds the time spent in each stage.
+    """
+    match_re = None
+    if options.get('match'):
+        match_re = re.compile(options['match'])
+    barcode_filter = None
+    if options.get('filter'):
+        filter_obj = options['filter']
+        barcode_filter = decoders.make_barcode_filter(filter_obj['symbologies'],filter_obj['min_length'],
+                                                      filter_obj['max_length'],filter_obj['check_digit'],
+                                                      filter_obj['match_re'])
+    timings = {}
+    png_file_page_number_tuples, scan_results = pdfxcb.extract_and_scan(
+        pdf_file_spec,index,scratch_dir,match_re,options.get('rasterize'),options.get('decoder'),timings,
+        options.get('resolutions'),barcode_filter,page_numbers,bool(options.get('signatures')))
+    return {
+        'images': [[png_file, page_number + page_offset, scan_result]
+                   for (png_file, page_number), scan_result in zip(png_file_page_number_tuples,scan_results)],
+        'timings': timings
+    }
+
+def serve(address,scratch_root=None,ready_fn=None):
+    """
+    Serve work units at ADDRESS, a (<host>,<port>) tuple, until the
+    process is terminated. A PORT of 0 selects a free port. READY_FN,
+    if specified, is called with the address of the server once the
+    server is listening.
+    """
+    server = WorkerHTTPServer(address,WorkerRequestHandler)
+    server.scratch_root = scratch_root
+    host, port = server.server_address[:2]
+    lg.debug("worker listening on %s:%s",host,port)
+    if ready_fn:
+        ready_fn('{}:{}'.format(host,port))
+    server.serve_forever()
+
+def handle_worker_signals():
+    """
+    Have the process, a worker, stop on SIGTERM, SIGINT, or SIGHUP
+    without logging the end of a run (see pdfxcb.signal_handler): a
+    worker shares the log of its coordinator, whose final message
+    (code 2) must remain the only one.
+    """
+    for signal_number in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signal_number,stop_worker)
+
+def stop_worker(signal_number,frame):
+    # don't leave orphaned pdftoppm/gs/pdfimages/zbarimg processes behind
+    tools.terminate_all()
+    os._exit(0)
+
+def serve_local(address,scratch_root=None,ready_fn=None):
+    """Serve work units (see serve) as a local worker (see start_local_workers)."""
+    handle_worker_signals()
+    serve(address,scratch_root,ready_fn)
+
+def start_local_workers(n,scratch_root=None):
+    """
+    Start N worker processes listening on free ports of the loopback
+    interface. Return multiple values: a list of worker addresses and
+    a list of the multiprocessing.Process objects (see
+    stop_local_workers). The workers are forked and so log to the log
+    of the calling process; they log nothing when stopped.
+    """
+    processes = []
+    addresses = []
+    for i in range(n):
+        parent_connection, child_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=serve_local,
+                                          args=(('127.0.0.1',0),scratch_root,child_connection.send))
+        process.daemon = True
+        process.start()
+        addresses.append(parent_connection.recv())
+        processes.append(process)
+    return addresses, processes
+
+def stop_local_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+def main():
+    """Handle command-line invocation of distributed.py (a worker)."""
+    parser = argparse.ArgumentParser(description="Serve pdfxcb work units")
+    parser.add_argument("-a",
+                        help="address to listen on (default: 127.0.0.1:8401)",
+                        action="store",
+                        dest="address",
+                        default="127.0.0.1:8401",
+                        type=str)
+    parser.add_argument("-f",
+                        help="absolute path to log file",
+                        action="store",
+                        dest="log_file",
+                        type=str)
+    parser.add_argument("-l",
+                        help="integer between 0 (verbose) and 51 (terse) defining logging",
+                        action="store",
+                        dest="log_level",
+                        type=int)
+    parser.add_argument("-s",
+                        help="absolute path to a directory within which scratch directories are created",
+                        action="store",
+                        dest="scratch_root",
+                        type=str)
+    parser.add_argument("-T",
+                        help="seconds after which an external tool is killed",
+                        action="store",
+                        dest="tool_timeout",
+                        type=float)
+    args = parser.parse_args()
+    if args.log_file:
+        for handler in lg.getLogger().handlers:
+            lg.getLogger().removeHandler(handler)
+        file_handler = logging.FileHandler(args.log_file,'a')
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        lg.getLogger().addHandler(file_handler)
+    if args.log_level is not None:
+        lg.getLogger().setLevel(args.log_level)
+    else:
+        lg.getLogger().setLevel(logging.INFO)
+    if args.tool_timeout:
+        tools.set_default_timeout(args.tool_timeout)
+    host, port = args.address.rsplit(':',1)
+    handle_worker_signals()
+    serve((host,int(port)),args.scratch_root)
+
+if __name__ == "__main__":
+    main()
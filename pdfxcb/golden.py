@@ -0,0 +1,580 @@
+"""Check pdfxcb against a generated corpus of PDFs with known outcomes
+"""
+
+# Author: David A. Thompson
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+# configure logging
+import logging
+lg=logging
+
+import PyPDF2
+from PIL import Image, ImageDraw
+
+# internal modules
+import decoders
+import distributed
+import manifest
+import pdfxcb
+import pdfindex
+import plan
+import pruning
+
+#
+# The golden corpus is a set of PDFs, generated on each run, whose
+# cover sheets (Code 39 barcodes), page ranges, and output file names
+# are known in advance. Each PDF is generated in two forms: 'image'
+# (each page is a single embedded grayscale image, as a scanner
+# produces) and 'vector' (each page is drawn with filled rectangles).
+# Each form is split with every applicable extraction mode (see
+# pdfxcb.extraction_modes) and every decoder, in each variant (see
+# golden_variants): by a single process, by local workers, and by
+# writing a plan and then applying it. A run fails if the barcodes,
+# page ranges, output file names, or output page counts differ from
+# those expected, or if the output PDFs of a case differ between
+# extraction modes, decoders, or variants.
+#
+# Throughput (pages per second, the best of several repetitions) is
+# recorded for each run. If a baseline is specified, a run whose
+# throughput is less than the baseline throughput by more than the
+# threshold (a fraction) is reported as a regression.
+#
+
+# points
+page_width = 612
+page_height = 792
+
+# resolution (DPI) of the images of 'image' pages
+image_resolution = 150
+
+# Code 39: for each character, the widths (n: narrow, w: wide) of its
+# five bars and four spaces, alternating, beginning with a bar
+code39_patterns = {
+    '0': 'nnnwwnwnn', '1': 'wnnwnnnnw', '2': 'nnwwnnnnw', '3': 'wnwwnnnnn',
+    '4': 'nnnwwnnnw', '5': 'wnnwwnnnn', '6': 'nnwwwnnnn', '7': 'nnnwnnwnw',
+    '8': 'wnnwnnwnn', '9': 'nnwwnnwnn', 'A': 'wnnnnwnnw', 'B': 'nnwnnwnnw',
+    'C': 'wnwnnwnnn', 'D': 'nnnnwwnnw', 'E': 'wnnnwwnnn', 'F': 'nnwnwwnnn',
+    'G': 'nnnnnwwnw', 'H': 'wnnnnwwnn', 'I': 'nnwnnwwnn', 'J': 'nnnnwwwnn',
+    'K': 'wnnnnnnww', 'L': 'nnwnnnnww', 'M': 'wnwnnnnwn', 'N': 'nnnnwnnww',
+    'O': 'wnnnwnnwn', 'P': 'nnwnwnnwn', 'Q': 'nnnnnnwww', 'R': 'wnnnnnwwn',
+    'S': 'nnwnnnwwn', 'T': 'nnnnwnwwn', 'U': 'wwnnnnnnw', 'V': 'nwwnnnnnw',
+    'W': 'wwwnnnnnn', 'X': 'nwnnwnnnw', 'Y': 'wwnnwnnnn', 'Z': 'nwwnwnnnn',
+    '-': 'nwnnnnwnw', '*': 'nwnnwnwnn'
+}
+
+# points
+code39_narrow = 1.5
+code39_wide = 4.5
+code39_height = 54
+
+# Each case lists its pages -- ('cover', <barcode>), 'content', or
+# 'blank' -- and the outcome expected.
+golden_cases = [
+    {'name': 'single',
+     'pages': [('cover', 'PX1001'), 'content', 'content'],
+     'barcodes': ['PX1001'],
+     'page_ranges': [[1, 3]],
+     'files': ['PX1001-001.pdf']},
+    {'name': 'several',
+     'pages': [('cover', 'PX1001'), 'content', ('cover', 'PX1002'), 'content', 'blank', 'content', ('cover', 'PX1003')],
+     'barcodes': ['PX1001', 'PX1002', 'PX1003'],
+     'page_ranges': [[1, 2], [3, 6], [7, 7]],
+     'files': ['PX1001-001.pdf', 'PX1002-003.pdf', 'PX1003-007.pdf']},
+    {'name': 'leading',
+     'pages': ['content', 'content', ('cover', 'PX1004'), 'content'],
+     'barcodes': ['PX1004'],
+     'page_ranges': [[3, 4]],
+     'files': ['PX1004-003.pdf']},
+    {'name': 'repeated',
+     'pages': [('cover', 'PX1005'), 'content', ('cover', 'PX1005'), 'content'],
+     'name_template': '{barcode}.pdf',
+     'barcodes': ['PX1005', 'PX1005'],
+     'page_ranges': [[1, 2], [3, 4]],
+     'files': ['PX1005.pdf', 'PX1005-1.pdf']},
+    {'name': 'none',
+     'pages': ['content', 'blank', 'content'],
+     'barcodes': [],
+     'page_ranges': [],
+     'files': []}
+]
+
+# form -> extraction modes applicable
+golden_forms = [
+    ('image', ['auto', 'images', 'rasterize']),
+    ('vector', ['auto', 'rasterize'])
+]
+
+# ways of splitting a PDF: 'single' (pdfxcb.pdfxcb), 'distributed'
+# (pdfxcb.pdfxcb handing the pages to local workers; see
+# distributed.py), and 'plan' (pdfxcb.scan_plan writes a plan which
+# pdfxcb.apply_plan reads back)
+golden_variants = ['single', 'distributed', 'plan']
+
+# number of local workers started for 'distributed' runs
+golden_workers = 2
+
+# fraction by which throughput may fall below the baseline
+default_threshold = 0.2
+
+#
+# corpus
+#
+def code39_rectangles(data,x,top):
+    """
+    Return a list of (<x>,<top>,<width>,<height>,<gray>) rectangles,
+    in points from the top left corner of the page, drawing DATA as a
+    Code 39 barcode whose top left corner is at X, TOP.
+    """
+    rectangles = []
+    for character in '*' + data + '*':
+        for i, width_code in enumerate(code39_patterns[character]):
+            width = (code39_wide if width_code == 'w' else code39_narrow)
+            if i % 2 == 0:
+                rectangles.append((x,top,width,code39_height,0.0))
+            x = x + width
+        # intercharacter gap
+        x = x + code39_narrow
+    return rectangles
+
+def page_rectangles(page,page_number):
+    """Return the rectangles (see code39_rectangles) drawing PAGE, a member of the pages of a case."""
+    if page == 'blank':
+        return []
+    if page == 'content':
+        # lines of "text" of varying length
+        return [(72,150+i*30,460-((i+page_number)%4)*70,10,0.3) for i in range(16)]
+    kind, barcode = page
+    return code39_rectangles(barcode,72,90)
+
+def vector_content(rectangles):
+    """Return a PDF content stream drawing RECTANGLES."""
+    return b''.join([('%.2f g %.2f %.2f %.2f %.2f re f\n' % (gray,x,page_height-top-height,width,height)).encode('ascii')
+                     for x, top, width, height, gray in rectangles])
+
+def page_image(rectangles):
+    """Return a grayscale PIL image of a page drawing RECTANGLES."""
+    scale = image_resolution / 72.0
+    image = Image.new('L',(int(page_width*scale),int(page_height*scale)),255)
+    draw = ImageDraw.Draw(image)
+    for x, top, width, height, gray in rectangles:
+        draw.rectangle([int(round(x*scale)),int(round(top*scale)),
+                        int(round((x+width)*scale))-1,int(round((top+height)*scale))-1],
+                       fill=int(gray*255))
+    return image
+
+def pdf_bytes(pages_rectangles,form):
+    """
+    Return a PDF (a string) with one page for each member of
+    PAGES_RECTANGLES, a list of lists of rectangles, in the form FORM
+    ('image' or 'vector').
+    """
+    # object number 1 is the catalog and 2 the page tree
+    objects = [None, None]
+    page_object_numbers = []
+    for rectangles in pages_rectangles:
+        resources = b'<< >>'
+        if form == 'image':
+            image = page_image(rectangles)
+            data = zlib.compress(image.tobytes())
+            objects.append(('<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray '
+                            '/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>' %
+                            (image.size[0],image.size[1],len(data))).encode('ascii') +
+                           b'\nstream\n' + data + b'\nendstream')
+            resources = ('<< /XObject << /Im0 %d 0 R >> >>' % len(objects)).encode('ascii')
+            content = ('q %d 0 0 %d 0 0 cm /Im0 Do Q\n' % (page_width,page_height)).encode('ascii')
+        else:
+            content = vector_content(rectangles)
+        objects.append(('<< /Length %d >>' % len(content)).encode('ascii') + b'\nstream\n' + content + b'\nendstream')
+        objects.append(('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources ' %
+                        (page_width,page_height,len(objects))).encode('ascii') + resources + b' >>')
+        page_object_numbers.append(len(objects))
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = ('<< /Type /Pages /Kids [%s] /Count %d >>' %
+                  (' '.join(['%d 0 R' % n for n in page_object_numbers]),len(page_object_numbers))).encode('ascii')
+    output = b'%PDF-1.4\n'
+    offsets = []
+    for i, body in enumerate(objects):
+        offsets.append(len(output))
+        output = output + ('%d 0 obj\n' % (i+1)).encode('ascii') + body + b'\nendobj\n'
+    xref_offset = len(output)
+    output = output + ('xref\n0 %d\n0000000000 65535 f \n' % (len(objects)+1)).encode('ascii')
+    for offset in offsets:
+        output = output + ('%010d 00000 n \n' % offset).encode('ascii')
+    output = output + ('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' %
+                       (len(objects)+1,xref_offset)).encode('ascii')
+    return output
+
+def write_corpus(corpus_dir,cases):
+    """
+    Write, to the directory CORPUS_DIR, each of CASES (see
+    golden_cases) in each form. Return a list of (<case>,<form>,<PDF
+    file path>,<extraction modes>) tuples.
+    """
+    corpus = []
+    for case in cases:
+        pages_rectangles = [page_rectangles(page,i+1) for i, page in enumerate(case['pages'])]
+        for form, modes in golden_forms:
+            pdf_file_spec = os.path.join(corpus_dir,'{}-{}.pdf'.format(case['name'],form))
+            with open(pdf_file_spec,'wb') as f:
+                f.write(pdf_bytes(pages_rectangles,form))
+            corpus.append((case,form,pdf_file_spec,modes))
+    return corpus
+
+#
+# checks
+#
+def check_functions():
+    """
+    Return a list of strings, each describing a failure of a helper
+    whose outcome does not depend on the corpus.
+    """
+    failures = []
+    cover_sheet_indices = [0, 2]
+    png_file_page_number_tuples = [('a.png', 1), ('b.png', 2), ('c.png', 3)]
+    page_ranges = pdfxcb.generate_page_ranges(cover_sheet_indices,png_file_page_number_tuples,5)
+    if page_ranges != [(1, 2), (3, 5)]:
+        failures.append('generate_page_ranges returned {}'.format(page_ranges))
+    if cover_sheet_indices != [0, 2] or png_file_page_number_tuples != [('a.png', 1), ('b.png', 2), ('c.png', 3)]:
+        failures.append('generate_page_ranges modified its arguments')
+    file_names = pdfxcb.generate_output_file_names(['X1', 'X1', 'Y2'],[1, 1, 4],None)
+    if file_names != ['X1-001.pdf', 'X1-001-1.pdf', 'Y2-004.pdf']:
+        failures.append('generate_output_file_names returned {}'.format(file_names))
+    # page 2 holds a blank image and page 3 a blank image and text
+    # (kept); page 5 draws text over the image of page 4 (kept), page 6
+    # repeats that image (kept: page 5 is not judged), and page 7
+    # repeats page 6
+    blank = pruning.page_signature(Image.new('L',(200,200),255))
+    sheet = Image.new('L',(200,200),255)
+    ImageDraw.Draw(sheet).rectangle((40,40,160,100),fill=0)
+    sheet = pruning.page_signature(sheet)
+    contents = ['image','image','vector','image','vector','image','image']
+    index = pdfindex.DocumentIndex(None,[{'page': page_number, 'content': content}
+                                         for page_number, content in enumerate(contents,1)],0,0)
+    dropped = pruning.dropped_pages(index,[('p{}.png'.format(page_number),page_number) for page_number in range(1,8)],
+                                    [sheet,blank,blank,sheet,sheet,sheet,sheet],[0])
+    if dropped != {'blank': [2], 'duplicate': [7]}:
+        failures.append('dropped_pages returned {}'.format(dropped))
+    return failures
+
+def outcome_failures(case,result,output_dir):
+    """
+    Return a list of strings, each describing a way in which RESULT
+    (see pdfxcb), the outcome of splitting CASE into OUTPUT_DIR,
+    differs from the outcome expected.
+    """
+    failures = []
+    if result.get('barcodes') != case['barcodes']:
+        failures.append('barcodes: expected {}, found {}'.format(case['barcodes'],result.get('barcodes')))
+    page_ranges = [list(page_range) for page_range in result.get('page_ranges',[])]
+    if page_ranges != case['page_ranges']:
+        failures.append('page ranges: expected {}, found {}'.format(case['page_ranges'],page_ranges))
+    file_names = [os.path.basename(path) for path in result.get('files',[])]
+    if file_names != case['files']:
+        failures.append('files: expected {}, found {}'.format(case['files'],file_names))
+    for file_name, page_range in zip(case['files'],case['page_ranges']):
+        path = os.path.join(output_dir,file_name)
+        if not os.path.isfile(path):
+            continue
+        with open(path,'rb') as stream:
+            number_of_pages = PyPDF2.PdfFileReader(stream,strict=False).getNumPages()
+        if number_of_pages != page_range[1] - page_range[0] + 1:
+            failures.append('{}: expected {} pages, found {}'.format(file_name,page_range[1]-page_range[0]+1,number_of_pages))
+    return failures
+
+def run_log_failures(pdf_file_spec,decoder,scratch_root=None):
+    """
+    Return a list of strings, each describing a failure of the log of
+    a command-line run splitting PDF_FILE_SPEC with DECODER and two
+    local workers (-W 2): the log must hold exactly one final message
+    (code 2), at its end, whether or not the run succeeds.
+    """
+    work_dir = tempfile.mkdtemp(prefix='pdfxcb-golden-',dir=scratch_root)
+    try:
+        log_file = os.path.join(work_dir,'run.log')
+        output_dir = os.path.join(work_dir,'out')
+        os.mkdir(output_dir)
+        command = [sys.executable, os.path.splitext(pdfxcb.__file__)[0] + '.py',
+                   '-W', '2', '-z', decoder, '-f', log_file, '-d', output_dir, pdf_file_spec]
+        with open(os.devnull,'wb') as devnull:
+            subprocess.call(command,stdout=devnull,stderr=devnull)
+        codes = []
+        if os.path.exists(log_file):
+            with open(log_file) as f:
+                codes = [json.loads(line).get('code') for line in f if line.strip()]
+    finally:
+        shutil.rmtree(work_dir,True)
+    if codes.count(2) != 1:
+        return ['log of a run with -W 2: {} final messages (code 2)'.format(codes.count(2))]
+    if codes[-1] != 2:
+        return ['log of a run with -W 2: the final message (code 2) is followed by others']
+    return []
+
+def run_key(case,form,mode,decoder,variant='single'):
+    """Return the string identifying a run in a baseline."""
+    # single-process runs keep the keys of earlier baselines
+    return '/'.join([case['name'],form,mode,decoder] + ([] if variant == 'single' else [variant]))
+
+def split(case,pdf_file_spec,output_dir,mode,decoder,variant,result,workers=None,scratch_root=None):
+    """
+    Split PDF_FILE_SPEC, a form of CASE, into OUTPUT_DIR with the
+    extraction mode MODE and the decoder DECODER as described by
+    VARIANT (see golden_variants), recording the outcome in RESULT
+    (see pdfxcb.pdfxcb). WORKERS lists the addresses of the local
+    workers used by 'distributed' runs.
+    """
+    rasterize_p = pdfxcb.extraction_modes[mode]
+    if variant == 'plan':
+        plan_spec = output_dir + '-plan.json'
+        try:
+            pdfxcb.scan_plan(pdf_file_spec,None,rasterize_p,plan_spec=plan_spec,scratch_root=scratch_root,
+                             decoder=decoder)
+            pdfxcb.apply_plan(pdf_file_spec,plan.load_plan(plan_spec),output_dir,plan_spec=plan_spec,
+                              name_template=case.get('name_template'),result=result)
+        finally:
+            if os.path.exists(plan_spec):
+                os.remove(plan_spec)
+    else:
+        pdfxcb.pdfxcb(pdf_file_spec,output_dir,None,rasterize_p,
+                      name_template=case.get('name_template'),scratch_root=scratch_root,
+                      decoder=decoder,result=result,
+                      workers=(workers if variant == 'distributed' else None))
+
+def run(case,form,pdf_file_spec,mode,decoder,repeat,scratch_root=None,variant='single',workers=None):
+    """
+    Split PDF_FILE_SPEC, the form FORM of CASE, REPEAT times with the
+    extraction mode MODE and the decoder DECODER, as described by
+    VARIANT (see split). Return a dictionary describing the run: 'run'
+    (see run_key), 'pages', 'pages_per_second' (the best of the
+    repetitions), 'failures' (see outcome_failures), and 'digests'
+    (the SHA-256 digests of the output files of the first
+    repetition). A run which raises an exception fails; the remaining
+    runs proceed.
+    """
+    number_of_pages = len(case['pages'])
+    failures = []
+    digests = []
+    best_seconds = None
+    for iteration in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix='pdfxcb-golden-',dir=scratch_root)
+        result = {}
+        start_time = time.time()
+        try:
+            split(case,pdf_file_spec,output_dir,mode,decoder,variant,result,workers,scratch_root)
+            seconds = time.time() - start_time
+            if iteration == 0:
+                failures = outcome_failures(case,result,output_dir)
+                digests = [manifest.file_digest(path) for path in result.get('files',[])]
+        except (Exception, SystemExit) as e:
+            lg.debug("golden run failed: %s",e,exc_info=True)
+            failures = ['run failed: {}'.format(str(e) or e.__class__.__name__)]
+            seconds = None
+        finally:
+            shutil.rmtree(output_dir,True)
+        if seconds is None:
+            break
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return {
+        'run': run_key(case,form,mode,decoder,variant),
+        'pages': number_of_pages,
+        'pages_per_second': (round(number_of_pages/best_seconds,3) if best_seconds else None),
+        'failures': failures,
+        'digests': digests
+    }
+
+def equivalence_failures(outcomes):
+    """
+    Return a list of strings, each describing a case and form whose
+    output PDFs differ between the runs in OUTCOMES (see run).
+    """
+    digests_by_pdf = {}
+    for outcome in outcomes:
+        if not outcome['failures']:
+            case_name, form = outcome['run'].split('/')[:2]
+            digests_by_pdf.setdefault((case_name,form),{})[outcome['run']] = outcome['digests']
+    failures = []
+    for (case_name, form), digests_by_run in sorted(digests_by_pdf.items()):
+        if len(set([tuple(digests) for digests in digests_by_run.values()])) > 1:
+            failures.append('{}/{}: output differs between runs {}'.format(case_name,form,sorted(digests_by_run.keys())))
+    return failures
+
+def regressions(outcomes,baseline,threshold):
+    """
+    Return a list of dictionaries, one for each run in OUTCOMES whose
+    throughput is less than that recorded in BASELINE (a dictionary
+    mapping run keys to pages per second) by more than THRESHOLD (a
+    fraction).
+    """
+    found = []
+    for outcome in outcomes:
+        baseline_pages_per_second = baseline.get(outcome['run'])
+        if (baseline_pages_per_second and outcome['pages_per_second'] is not None and
+            outcome['pages_per_second'] < baseline_pages_per_second * (1 - threshold)):
+            found.append({
+                'run': outcome['run'],
+                'baseline': baseline_pages_per_second,
+                'pages_per_second': outcome['pages_per_second']
+            })
+    return found
+
+def golden(decoder_names,repeat=1,baseline=None,threshold=None,corpus_dir=None,scratch_root=None,case_names=None,variants=None):
+    """
+    Generate the golden corpus in CORPUS_DIR (by default, a temporary
+    directory which is removed) and split each PDF with each
+    applicable extraction mode, each decoder in DECODER_NAMES, and
+    each of VARIANTS (by default, GOLDEN_VARIANTS), REPEAT times.
+    Return a dictionary: 'runs' (see run), 'failures' (a list of
+    strings), and 'regressions' relative to BASELINE, if specified
+    (see regressions). CASE_NAMES, if specified, limits the cases
+    considered.
+    """
+    cases = [case for case in golden_cases if not case_names or case['name'] in case_names]
+    variants = variants or golden_variants
+    temporary_p = not corpus_dir
+    if temporary_p:
+        corpus_dir = tempfile.mkdtemp(prefix='pdfxcb-corpus-',dir=scratch_root)
+    outcomes = []
+    failures = check_functions()
+    workers = []
+    worker_processes = []
+    try:
+        if 'distributed' in variants:
+            workers, worker_processes = distributed.start_local_workers(golden_workers,scratch_root)
+        corpus = write_corpus(corpus_dir,cases)
+        if 'distributed' in variants and corpus:
+            failures.extend(run_log_failures(corpus[0][2],decoder_names[0],scratch_root))
+        for case, form, pdf_file_spec, modes in corpus:
+            for mode in modes:
+                for decoder in decoder_names:
+                    for variant in variants:
+                        outcome = run(case,form,pdf_file_spec,mode,decoder,repeat,scratch_root,variant,workers)
+                        lg.debug("golden run: %s",outcome)
+                        outcomes.append(outcome)
+    finally:
+        distributed.stop_local_workers(worker_processes)
+        if temporary_p:
+            shutil.rmtree(corpus_dir,True)
+    for outcome in outcomes:
+        failures.extend(['{}: {}'.format(outcome['run'],failure) for failure in outcome['failures']])
+    failures.extend(equivalence_failures(outcomes))
+    return {
+        'runs': outcomes,
+        'failures': failures,
+        'regressions': regressions(outcomes,baseline or {},
+                                   default_threshold if threshold is None else threshold)
+    }
+
+def main():
+    """Handle command-line invocation of golden.py."""
+    parser = argparse.ArgumentParser(description="Check pdfxcb against a generated corpus of PDFs with known outcomes")
+    parser.add_argument("-b",
+                        help="JSON file mapping runs to the throughput (pages per second) expected",
+                        action="store",
+                        dest="baseline_file",
+                        type=str)
+    parser.add_argument("-w",
+                        help="write the throughput measured to the baseline file (see -b) rather than checking it",
+                        action="store_true",
+                        dest="write_baseline")
+    parser.add_argument("-t",
+                        help="fraction by which throughput may fall below the baseline (default: {})".format(default_threshold),
+                        action="store",
+                        dest="threshold",
+                        type=float)
+    parser.add_argument("-r",
+                        help="number of times each run is repeated; the best throughput counts (default: 3)",
+                        action="store",
+                        dest="repeat",
+                        default=3,
+                        type=int)
+    parser.add_argument("-z",
+                        help="comma-separated list of decoders (default: all available decoders)",
+                        action="store",
+                        dest="decoder_names",
+                        type=str)
+    parser.add_argument("-n",
+                        help="comma-separated list of cases (default: all; " + ", ".join([case['name'] for case in golden_cases]) + ")",
+                        action="store",
+                        dest="case_names",
+                        type=str)
+    parser.add_argument("-V",
+                        help="comma-separated list of variants (default: all; " + ", ".join(golden_variants) + ")",
+                        action="store",
+                        dest="variants",
+                        type=str)
+    parser.add_argument("-c",
+                        help="absolute path to a directory where the corpus is written and kept (default: a temporary directory)",
+                        action="store",
+                        dest="corpus_dir",
+                        type=str)
+    parser.add_argument("-s",
+                        help="absolute path to a directory within which scratch directories are created",
+                        action="store",
+                        dest="scratch_root",
+                        type=str)
+    parser.add_argument("-f",
+                        help="absolute path to log file",
+                        action="store",
+                        dest="log_file",
+                        type=str)
+    parser.add_argument("-l",
+                        help="integer between 0 (verbose) and 51 (terse) defining logging",
+                        action="store",
+                        dest="log_level",
+                        type=int)
+    args = parser.parse_args()
+    for handler in lg.getLogger().handlers:
+        lg.getLogger().removeHandler(handler)
+    if args.log_file:
+        file_handler = logging.FileHandler(args.log_file,'w')
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        lg.getLogger().addHandler(file_handler)
+    else:
+        lg.getLogger().addHandler(logging.NullHandler())
+    if args.log_level is not None:
+        lg.getLogger().setLevel(args.log_level)
+    else:
+        lg.getLogger().setLevel(logging.INFO)
+    if args.decoder_names:
+        decoder_names = args.decoder_names.split(',')
+    else:
+        # without any decoder, the default decoder is reported missing
+        decoder_names = decoders.available_decoders() or [decoders.default_decoder]
+    for decoder in decoder_names:
+        decoders.decoder_sanity_check(decoder)
+    variants = None
+    if args.variants:
+        variants = args.variants.split(',')
+        for variant in variants:
+            if variant not in golden_variants:
+                parser.error("unknown variant: {}".format(variant))
+    baseline = None
+    if args.baseline_file and not args.write_baseline:
+        with open(args.baseline_file) as f:
+            baseline = json.load(f)
+    outcome = golden(decoder_names,args.repeat,baseline,args.threshold,args.corpus_dir,args.scratch_root,
+                     (args.case_names.split(',') if args.case_names else None),variants)
+    for run_outcome in outcome['runs']:
+        sys.stdout.write(json.dumps(run_outcome, sort_keys=True))
+        sys.stdout.write('\n')
+    sys.stdout.write(json.dumps({'failures': outcome['failures'], 'regressions': outcome['regressions']}, sort_keys=True))
+    sys.stdout.write('\n')
+    if args.write_baseline and args.baseline_file:
+        with open(args.baseline_file,'w') as f:
+            json.dump(dict([(run_outcome['run'],run_outcome['pages_per_second']) for run_outcome in outcome['runs']
+                            if not run_outcome['failures']]),f,indent=1,sort_keys=True)
+            f.write('\n')
+    if outcome['failures'] or outcome['regressions']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
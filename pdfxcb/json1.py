@@ -87,17 +87,64 @@ def json_directory_not_found(dir):
                     'Directory not found; directory: {}'.format(dir),
                     False,None)
 
-def json_first_log_msg(identifier,files=None):
-    """Return a string. Use for the first log message."""
+def json_preflight(pdf_file,report):
+    """REPORT describes the input (see preflight.preflight)."""
+    return json_msg(72, "Preflight passed", False, data=report, file=pdf_file)
+
+def json_preflight_failed(pdf_file,report):
+    """REPORT describes the input and the reason it failed (see preflight.preflight)."""
+    return json_msg(139,
+                    ['Preflight failed: ' + report['reason'], report['detail']],
+                    False, data=report, file=pdf_file)
+
+def json_extraction_plan(image_page_numbers,vector_page_numbers,number_of_pages):
+    """
+    Describe how image data is obtained: IMAGE_PAGE_NUMBERS lists the
+    pages whose embedded images are extracted and VECTOR_PAGE_NUMBERS
+    lists the pages which are rasterized.
+    """
+    data = { 'images': image_page_numbers,
+             'rasterize': vector_page_numbers,
+             'skip': number_of_pages - len(image_page_numbers) - len(vector_page_numbers) }
+    return json_msg(71, "Extraction plan", False, data=data)
+
+def json_first_log_msg(identifier,files=None,config=None):
+    """
+    Return a string. Use for the first log message. CONFIG, if
+    specified, describes the concurrency chosen (see resources.tune).
+    """
     obj = json_msg_obj(3,"Initial log message")
     obj['id'] = identifier
     obj['files'] = files
+    if config:
+        obj['config'] = config
     return json.dumps(obj)
 
 def json_last_log_msg():
     """Return a string. Use for the last log message."""
     return json_msg(2,"Scan and analysis complete",False,None)
 
+def json_manifest_written(manifest_spec):
+    """MANIFEST_SPEC is a string ('-' indicates standard output)."""
+    return json_msg(41,"Manifest written",False,file=manifest_spec)
+
+def json_archive_written(archive_spec,members):
+    """ARCHIVE_SPEC is a string ('-' indicates standard output); MEMBERS lists the names of the members."""
+    return json_msg(43,"Archive written",False,file=archive_spec,files=members)
+
+def json_profile_written(profile_spec,top_functions):
+    """TOP_FUNCTIONS summarizes the profile (see profiling.profile_summary)."""
+    return json_msg(44,"Profile written",False,data={'top': top_functions},file=profile_spec)
+
+def json_plan_written(plan_spec):
+    """PLAN_SPEC is a string ('-' indicates standard output)."""
+    return json_msg(42,"Plan written",False,file=plan_spec)
+
+def json_plan_not_current(plan_spec,pdf_file):
+    return json_msg(138,
+                    'Plan does not describe the input file; plan: {}'.format(plan_spec),
+                    False,file=pdf_file)
+
 def json_msg_executable_not_accessible(executable_name):
     """EXECUTABLE_NAME is a string."""
     return json_msg(134,
@@ -197,6 +244,18 @@ def json_progress(progress_message):
     """
     return json_msg(50, progress_message, False)
 
+def json_progress_event(event):
+    """
+    EVENT is a dictionary describing the progress of a run (see
+    progress.Progress.event).
+    """
+    message = 'Progress: {}'.format(event['stage'])
+    if event['total']:
+        message = message + ' {} / {}'.format(event['done'],event['total'])
+    if event['eta'] is not None:
+        message = message + ', about {} s remaining'.format(int(round(event['eta'])))
+    return json_msg(50, message, False, data=event)
+
 def json_scanset(scanSet):
     return json_msg(30, 'scanset', False, data=scanSet);
 
@@ -206,3 +265,9 @@ def json_scansets(scanSets):
 def json_successful_deskew(file):
     """Return a string"""
     return json_msg(20,"successful deskew",False, file=file)
+
+def json_tool_failed(executable_name,msg):
+    """EXECUTABLE_NAME and MSG are strings."""
+    return json_msg(111,
+                    ['External tool failed: ' + executable_name, msg],
+                    False,None)
@@ -0,0 +1,119 @@
+"""Describe the results of a run as a JSON Lines manifest
+"""
+
+# Author: David A. Thompson
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+
+def file_digest(file_spec, block_size=1048576):
+    """
+    Return the SHA-256 digest, as a hexadecimal string, of the file
+    specified by FILE_SPEC. The file is read in blocks of BLOCK_SIZE
+    bytes.
+    """
+    digest = hashlib.sha256()
+    with open(file_spec, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            digest.update(block)
+            block = f.read(block_size)
+    return digest.hexdigest()
+
+def manifest_records(identifier,pdf_file_spec,number_of_pages,output_files,barcodes,page_ranges,timings,orientations=None,symbols=None,output_stats=None,dropped_pages=None):
+    """
+    Return a list of dictionaries describing a single run. The first
+    member describes the run as a whole (input file, input digest,
+    number of pages, TIMINGS); each subsequent member describes a
+    single output file. OUTPUT_FILES, BARCODES, and PAGE_RANGES are
+    parallel lists. TIMINGS is a dictionary mapping stage names to
+    durations in seconds. ORIENTATIONS, if specified, is a list,
+    parallel to BARCODES, describing the orientation of each barcode
+    on its cover sheet (see barScan.barcode_orientation). SYMBOLS, if
+    specified, is a list, parallel to BARCODES, of the corresponding
+    symbols (see decoders.make_symbol). OUTPUT_STATS, if specified,
+    maps each output file to a dictionary holding its size ('bytes')
+    and digest ('sha256'), e.g., for output files written to an
+    archive (see archive.Archive.members); otherwise, the output files
+    are read. DROPPED_PAGES, if specified, identifies the blank and
+    duplicate pages left out of the output files (see
+    pruning.dropped_pages); the run record holds it and each output
+    record lists the pages dropped from its page range.
+    """
+    records = [{
+        'record': 'run',
+        'id': identifier,
+        'time': int(time.time()),
+        'input': {
+            'file': pdf_file_spec,
+            'bytes': os.path.getsize(pdf_file_spec),
+            'sha256': file_digest(pdf_file_spec),
+            'number_of_pages': number_of_pages
+        },
+        'outputs': len(output_files),
+        'timings': timings
+    }]
+    if dropped_pages is not None:
+        records[0]['dropped_pages'] = dropped_pages
+    if orientations is None:
+        orientations = [None] * len(barcodes)
+    if symbols is None:
+        symbols = [None] * len(barcodes)
+    for output_file, barcode, page_range, orientation, symbol in zip(output_files,barcodes,page_ranges,orientations,symbols):
+        if output_stats:
+            stats = output_stats[output_file]
+        else:
+            stats = {
+                'bytes': os.path.getsize(output_file),
+                'sha256': file_digest(output_file)
+            }
+        record = {
+            'record': 'output',
+            'id': identifier,
+            'file': output_file,
+            'barcode': barcode,
+            'page_range': [page_range[0],page_range[1]],
+            'orientation': orientation,
+            'symbol': symbol,
+            'bytes': stats['bytes'],
+            'sha256': stats['sha256']
+        }
+        if dropped_pages is not None:
+            record['dropped_pages'] = sorted([page_number for page_number in dropped_pages['blank'] + dropped_pages['duplicate']
+                                              if page_range[0] <= page_number <= page_range[1]])
+        records.append(record)
+    return records
+
+def write_manifest(records,manifest_spec):
+    """
+    Write RECORDS, one JSON object per line, to the file specified by
+    MANIFEST_SPEC. If MANIFEST_SPEC is '-', write to standard output.
+    An existing manifest file is appended to so that a single manifest
+    may accumulate the results of several runs.
+    """
+    if manifest_spec == '-':
+        write_manifest_records(records,sys.stdout)
+        sys.stdout.flush()
+    else:
+        with open(manifest_spec,'a') as outfp:
+            write_manifest_records(records,outfp)
+    lg.info(json1.json_manifest_written(manifest_spec))
+
+def manifest_bytes(records):
+    """Return RECORDS, one JSON object per line, as bytes (e.g., for an archive member)."""
+    return ''.join([json.dumps(record, sort_keys=True) + '\n' for record in records]).encode('utf-8')
+
+def write_manifest_records(records,outfp):
+    for record in records:
+        outfp.write(json.dumps(record, sort_keys=True))
+        outfp.write('\n')
@@ -0,0 +1,137 @@
+"""Read input PDFs through memory-mapped views
+"""
+
+# Author: David A. Thompson
+
+import errno
+import mmap
+import os
+import threading
+
+# configure logging
+import logging
+lg=logging
+
+#
+# Inputs are often hundreds of megabytes, yet splitting or indexing a
+# PDF touches only a fraction of it: the trailer and cross-reference
+# data, the page tree, and the objects of the pages being copied. An
+# input is therefore mapped into memory rather than read through a
+# file object. The operating system reads the pages of the file as
+# PyPDF2 touches them and holds them once, in the page cache, for
+# every reader of the file -- each stage of a run, each thread of a
+# server, and each local worker process (see
+# distributed.start_local_workers) -- instead of copying them into
+# the buffers of each reader.
+#
+# A process maps a file once (see input_mapping); the mapping is
+# reused while the size and modification time of the file are
+# unchanged. Each reader is handed a MappedStream, a file-like view of
+# the mapping with its own position, so that readers in several
+# threads do not disturb one another. A worker process forked after
+# the input is mapped (e.g., by pdfxcb.main) inherits the mapping.
+#
+
+# mappings retained at once (e.g., by a long-lived server); a
+# mapping dropped from the table remains valid for streams using it
+max_mappings = 8
+
+# (<path>, <size>, <mtime>, <mmap>) tuples, least recently used first
+_mappings = []
+_mappings_lock = threading.Lock()
+
+class MappedStream(object):
+    """
+    A read-only file-like object, as expected by PyPDF2.PdfFileReader,
+    reading the mmap MAPPING. NAME is the path of the file mapped.
+    Closing the stream does not close the mapping, which may be shared
+    (see above).
+    """
+    def __init__(self,mapping,name=None):
+        self._mapping = mapping
+        self._position = 0
+        self.name = name
+        self.closed = False
+
+    def read(self,size=-1):
+        """Return at most SIZE bytes (by default, all remaining bytes) from the current position."""
+        start = self._position
+        length = len(self._mapping)
+        if size is None or size < 0:
+            end = length
+        else:
+            end = min(start + size, length)
+        self._position = max(start,end)
+        # only the bytes requested are copied
+        return self._mapping[start:end]
+
+    def seek(self,offset,whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset = offset + self._position
+        elif whence == os.SEEK_END:
+            offset = offset + len(self._mapping)
+        if offset < 0:
+            raise IOError(errno.EINVAL,'Invalid argument')
+        self._position = offset
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def input_mapping(pdf_file_spec):
+    """
+    Return an mmap of the file specified by PDF_FILE_SPEC, reusing the
+    mapping made earlier in the process (or its parent) if the file
+    is unchanged, or None if the file cannot be mapped (e.g., an
+    empty file).
+    """
+    path = os.path.abspath(pdf_file_spec)
+    stat = os.stat(path)
+    with _mappings_lock:
+        for i, (mapped_path, size, mtime, mapping) in enumerate(_mappings):
+            if mapped_path == path:
+                del _mappings[i]
+                if (size, mtime) == (stat.st_size, stat.st_mtime):
+                    _mappings.append((mapped_path, size, mtime, mapping))
+                    return mapping
+                break
+        if not stat.st_size:
+            return None
+        try:
+            with open(path,'rb') as f:
+                mapping = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError) as e:
+            lg.debug("reading %s without a mapping: %s",path,e)
+            return None
+        _mappings.append((path, stat.st_size, stat.st_mtime, mapping))
+        del _mappings[:-max_mappings]
+        return mapping
+
+def open_input(pdf_file_spec):
+    """
+    Return a file-like object, open for reading, for the file
+    specified by PDF_FILE_SPEC: a MappedStream or, if the file cannot
+    be mapped, the file itself.
+    """
+    mapping = input_mapping(pdf_file_spec)
+    if mapping is None:
+        return open(pdf_file_spec,'rb')
+    return MappedStream(mapping,pdf_file_spec)
+
+def release(pdf_file_spec):
+    """
+    Forget the mapping of the file specified by PDF_FILE_SPEC (e.g.,
+    before the file is removed). Streams using the mapping remain
+    valid.
+    """
+    path = os.path.abspath(pdf_file_spec)
+    with _mappings_lock:
+        _mappings[:] = [entry for entry in _mappings if entry[0] != path]
@@ -6,7 +6,6 @@
 import io
 import os
 import re
-import subprocess
 import PyPDF2
 
 # configure logging
@@ -15,19 +14,23 @@ lg=logging
 
 # internal modules
 import json1
+import mapped
+import progress
+import tools
 
 def pdf_number_of_pages(pdf_file):
     """
     Determine the number of pages in a PDF document. Return an integer.
     """
-    reader = PyPDF2.PdfFileReader(file(pdf_file, "rb"))
-    # getNumPages can fail if the PDF, or an object therein, is
-    # corrupt
-    try:
-        return reader.getNumPages()
-    except Exception as e:
-        lg.error(json1.json_msg(109, "Failure to open or parse a PDF file -- possible indication of a corrupt PDF",None,file=pdf_file))
-        raise e
+    with mapped.open_input(pdf_file) as stream:
+        reader = PyPDF2.PdfFileReader(stream)
+        # getNumPages can fail if the PDF, or an object therein, is
+        # corrupt
+        try:
+            return reader.getNumPages()
+        except Exception as e:
+            lg.error(json1.json_msg(109, "Failure to open or parse a PDF file -- possible indication of a corrupt PDF",None,file=pdf_file))
+            raise e
 
 def pdf_page_to_png(src_pdf, pagenum = 0, resolution = 72):
     """
@@ -47,59 +50,95 @@ def pdf_page_to_png(src_pdf, pagenum = 0, resolution = 72):
     img.convert("png")
     return img
 
-def pdf_split(input_pdf_file,output_files,page_ranges):
+def pdf_split(input_pdf_file,output_files,page_ranges,reader=None,archive=None,excluded_pages=None):
     """
     INPUT_PDF_FILE is a string representing the path to a PDF file.
     OUTPUT_FILES is a list of strings representing paths to output
     files corresponding to the specified page ranges. PAGE_RANGES is
     an array of tuples where each tuple specifies the first page and
-    the last page of a given set of pages.
+    the last page of a given set of pages. If READER, a
+    PyPDF2.PdfFileReader for INPUT_PDF_FILE, is specified (see
+    pdfindex.DocumentIndex.reader), the document is not parsed again;
+    otherwise, the document is read through a memory-mapped view (see
+    mapped.py).
+    If ARCHIVE, an archive.Archive, is specified, OUTPUT_FILES are the
+    names of members added to ARCHIVE rather than paths. Pages listed
+    in EXCLUDED_PAGES (page numbering begins at one) are left out of
+    the output files.
     """
-    reader = PyPDF2.PdfFileReader(input_pdf_file)
-    for output_file, page_range in zip(output_files,page_ranges):
-        writer = PyPDF2.PdfFileWriter()
-        pdf_split_internal(reader,writer,page_range)
-        output_file = open(output_file,"wb")
-        writer.write(output_file)
-        output_file.close()
+    # the stream opened here (but not that of READER) is closed here
+    stream = None
+    if not reader:
+        stream = mapped.open_input(input_pdf_file)
+    try:
+        if stream:
+            reader = PyPDF2.PdfFileReader(stream)
+        for output_file, page_range in zip(output_files,page_ranges):
+            # a cancelled run writes no further output
+            tools.check_cancelled('split')
+            writer = PyPDF2.PdfFileWriter()
+            pdf_split_internal(reader,writer,page_range,excluded_pages)
+            if archive:
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                archive.add(output_file,buffer.getvalue())
+            else:
+                output_file = open(output_file,"wb")
+                writer.write(output_file)
+                output_file.close()
+            progress.advance()
+    finally:
+        if stream:
+            stream.close()
 
-def pdf_split_internal (pdf_file_reader,pdf_file_writer,page_range):
+def pdf_split_internal (pdf_file_reader,pdf_file_writer,page_range,excluded_pages=None):
     """
     Add the pages, specified by PAGE_RANGE, from specified reader
     object to the specified writer object. PAGE_RANGE is a tuple where
     the elements are integers defining the first and last page
-    (inclusive) in the page range. Page count begins at 1.
+    (inclusive) in the page range. Page count begins at 1. Pages
+    listed in EXCLUDED_PAGES are not added.
     """
+    excluded_pages = set(excluded_pages or [])
     # The reader and writer are PyPDF2 objects. Adjust page numbers as
     # PyPDF2 counts pages beginning at zero.
-    pages = list(range(page_range[0]-1,page_range[1]))
+    pages = [page_number-1 for page_number in range(page_range[0],page_range[1]+1)
+             if page_number not in excluded_pages]
     for page_index in pages:
         pdf_file_writer.addPage(pdf_file_reader.getPage(page_index))
 
-def pdf_to_pngs(pdf_file,output_dir):
+def pdf_to_pngs(pdf_file,output_dir,index=None,resolution=None,region=None,page_numbers=None):
     """
-    Generate PNG files, one corresponding to each page of the PDF file
+    Generate grayscale images (PGM files, despite the name of the
+    function), one corresponding to each page of the PDF file
     PDF_FILE. Write files to directory specified by OUTPUT_DIR. Return
-    a list of the PNG file names.
+    a list of (<PGM file>,<page number>) tuples. INDEX, if specified,
+    is the pdfindex.DocumentIndex for PDF_FILE.
+
+    RESOLUTION specifies the resolution in DPI (by default, that of
+    pdftoppm). REGION, a list [x1,y1,x2,y2] of fractions of the page
+    dimensions (see barScan.barcodeScan), limits rendering to part of
+    each page and requires INDEX. PAGE_NUMBERS limits rendering to the
+    specified pages (page numbering begins at one).
     """
     input_file_sans_suffix, input_file_suffix = os.path.splitext(pdf_file)
     maybe_dir, input_file_name_only = os.path.split(input_file_sans_suffix)
-    number_of_pages = None
     outfile_root = input_file_name_only
+    if resolution:
+        # distinguish renderings of the same page at different resolutions
+        outfile_root = outfile_root + "-r" + str(resolution)
     # determine number of pages
-    reader = PyPDF2.PdfFileReader(file(pdf_file, "rb"))
-    # getNumPages can fail if the PDF, or an object therein, is
-    # corrupt
-    try:
-        number_of_pages = reader.getNumPages()
+    if index:
+        number_of_pages = index.number_of_pages
+    else:
+        number_of_pages = pdf_number_of_pages(pdf_file)
         lg.info(json1.json_pdf_info(number_of_pages))
-    except Exception as e:
-        lg.error(json1.json_msg(109, "Failure to open or parse a PDF file -- possible indication of a corrupt PDF",None,file=pdf_file))
-        raise e
     # Qs:
     # 1. advantages/disadvantages of gs and pdftoppm = ?
     # 2. is there really no way to just scan directly from PDF, specifying page number as we go?
-    return pdf_to_pngs__pdftoppm(pdf_file, number_of_pages, outfile_root, output_dir)
+    return pdf_to_pngs__pdftoppm(pdf_file, number_of_pages, outfile_root, output_dir,
+                                 resolution=resolution, region=region,
+                                 page_numbers=page_numbers, index=index)
 
 def pdf_to_pngs__gs (pdf_file, number_of_pages, outfile_root, output_dir):
     """
@@ -126,8 +165,7 @@ def pdf_to_pngs__gs (pdf_file, number_of_pages, outfile_root, output_dir):
         "-sOutputFile=%s" % output_path_spec,
         pdf_file
     ]
-    lg.debug(gs_command)
-    return_code = subprocess.call(gs_command, shell=False)
+    return_code, output = tools.run(gs_command)
     # log success/failure
     pdf_to_pngs__gs_log(return_code,number_of_pages)
     # return file names
@@ -135,8 +173,7 @@ def pdf_to_pngs__gs (pdf_file, number_of_pages, outfile_root, output_dir):
 
 def pdf_to_pngs__gs_log (return_code,number_of_pages):
     if (return_code == 0):
-        for page_number in range(number_of_pages):
-            lg.info(json1.json_completed_pdf_to_ppm(page_number,number_of_pages))
+        progress.advance(number_of_pages)
     else:
         lg.error(json1.json_failed_to_convert_pdf(None,pdf_file))
 
@@ -151,53 +188,111 @@ def pdf_to_pngs__gs_file_names (number_of_pages,outfile_root):
         png_files.append(png_infile)
     return png_files
 
-def pdf_to_pngs__pdftoppm (pdf_file, number_of_pages, outfile_root, output_dir):
+def pdf_to_pngs__pdftoppm (pdf_file, number_of_pages, outfile_root, output_dir, resolution=None, region=None, page_numbers=None, index=None):
     """
     Helper relying on pdftoppm. OUTFILE_ROOT is the filename only (no
     directory information). Return a list where each member has the
     form (<file name>,<page number>) with page numbering beginning at
-    one.
+    one. See pdf_to_pngs regarding RESOLUTION, REGION, PAGE_NUMBERS,
+    and INDEX.
     """
     output_dir_and_filename = os.path.join(output_dir,outfile_root)
-    # Q: what is the point of calling pdftoppm repeatedly on each page, one at a time? doesn't this generate the exact same set of files as calling it just once w/o the -f and -l options?
-    for page_number in range(number_of_pages):
-        returncode = subprocess.call(
-            ["pdftoppm", "-f", str(page_number+1), "-l", str(page_number+1), "-gray", "-png", pdf_file, output_dir_and_filename],
-            shell=False)
+    if not page_numbers:
+        page_numbers = range(1,number_of_pages+1)
+    # A single invocation of pdftoppm handles a run of consecutive
+    # pages sharing the same crop geometry.
+    for first_page, last_page, crop_args in pdftoppm_page_runs(page_numbers,resolution,region,index):
+        # grayscale renderings are written as PGM files, which are
+        # scanned without decoding or copying the pixels (see pgm.py)
+        # -cropbox: render the page as displayed; crop arguments are
+        # computed relative to the crop box (see page_dimensions)
+        command = ["pdftoppm", "-f", str(first_page), "-l", str(last_page), "-gray", "-cropbox"]
+        if resolution:
+            command = command + ["-r", str(resolution)]
+        returncode, output = tools.run(
+            command + crop_args + [pdf_file, output_dir_and_filename])
         if (returncode == 0):
-            lg.info(json1.json_completed_pdf_to_ppm(page_number,number_of_pages))
+            progress.advance(last_page - first_page + 1)
         else:
             lg.error(json1.json_failed_to_convert_pdf(None,pdf_file))
     # Return an array where each member has the form
     # (<file name>,<page number>)
     return_value = []
+    for page_number in page_numbers:
+        return_value.append((pdftoppm_file_name(output_dir_and_filename,page_number,number_of_pages),
+                             page_number))
+    return return_value
+
+def pdftoppm_file_name (output_root,page_number,number_of_pages):
+    """
+    Return the name of the PGM file written by pdftoppm for page
+    PAGE_NUMBER given the output root OUTPUT_ROOT.
+    """
     # Due to the inability to configure the output file name format
     # for pdftoppm, plan ahead for the file names, anticipating
-    # pdftoppm's default non-configurable behavior.
-    index_format_string = ""
-    if ( number_of_pages < 10 ):
-        index_format_string = "{1:d}"
-    elif ( number_of_pages < 100 ):
-        index_format_string = "{1:0>02d}"
-    elif ( number_of_pages < 1000 ):
-        index_format_string = "{1:0>03d}"
-    else:
-        raise Exception('no support (at this point) for page count exceeding 1000 pages')
-    string_format_string = "{0}-" + index_format_string + ".png"
-    for pagenumber in range(number_of_pages):
-        png_file = str.format(
-            string_format_string,
-            output_dir_and_filename,pagenumber+1);
-        return_value.append((png_file,pagenumber))
-    return return_value
+    # pdftoppm's default non-configurable behavior: the page number
+    # is zero-padded to the number of digits in the page count.
+    index_format_string = "{1:0>" + str(len(str(number_of_pages))) + "d}"
+    string_format_string = "{0}-" + index_format_string + ".pgm"
+    return str.format(string_format_string,output_root,page_number)
+
+def pdftoppm_page_runs (page_numbers,resolution,region,index):
+    """
+    Return a list of (<first page>,<last page>,<crop arguments>)
+    tuples covering PAGE_NUMBERS where each tuple describes a run of
+    consecutive pages with identical pdftoppm crop arguments.
+    """
+    runs = []
+    for page_number in page_numbers:
+        crop_args = pdftoppm_crop_args(page_number,resolution,region,index)
+        if runs and runs[-1][1] == page_number-1 and runs[-1][2] == crop_args:
+            runs[-1] = (runs[-1][0],page_number,crop_args)
+        else:
+            runs.append((page_number,page_number,crop_args))
+    return runs
+
+def pdftoppm_crop_args (page_number,resolution,region,index):
+    """
+    Return the pdftoppm arguments (a list of strings) limiting
+    rendering of page PAGE_NUMBER to REGION (see pdf_to_pngs).
+    """
+    if not region:
+        return []
+    width, height = page_dimensions(index.page(page_number))
+    # pixels per point (pdftoppm renders at 150 DPI by default)
+    scale = (resolution or 150) / 72.0
+    x1, x2 = min(region[0],region[2]), max(region[0],region[2])
+    y1, y2 = min(region[1],region[3]), max(region[1],region[3])
+    return ["-x", str(int(x1*width*scale)),
+            "-y", str(int(y1*height*scale)),
+            "-W", str(int((x2-x1)*width*scale)),
+            "-H", str(int((y2-y1)*height*scale))]
+
+def page_dimensions (page):
+    """
+    Return the width and height, in points, of the page, described by
+    the index record PAGE, as rendered (i.e., crop box after
+    rotation).
+    """
+    box = page['cropbox']
+    width = abs(box[2]-box[0])
+    height = abs(box[3]-box[1])
+    if page['rotate'] in (90,270):
+        return height, width
+    return width, height
 
 #
 # pdfimages
 #
-def pdfimages(pdf_file,output_dir):
+def pdfimages(pdf_file,output_dir,index=None,page_numbers=None):
     """
     Generate PNG files, one corresponding to each image in the PDF
     file PDF_FILE. Write files to directory specified by OUTPUT_DIR.
+    OUTPUT_DIR is listed to identify the PNG files and should be
+    private to the caller (see pdfxcb.make_scratch_dir). INDEX, if
+    specified, is the pdfindex.DocumentIndex for PDF_FILE.
+    PAGE_NUMBERS, if specified, limits extraction to the specified
+    pages.
 
     Return tuples where each member has the form (PNG file names, page number)
     (where the first page in the document is numbered as 1).
@@ -206,21 +301,82 @@ def pdfimages(pdf_file,output_dir):
     maybe_dir, input_file_name_only = os.path.split(input_file_sans_suffix)
     outfile_root = input_file_name_only
     output_dir_and_filename = os.path.join(output_dir,outfile_root)
-    returncode = subprocess.call(
-        ["pdfimages", "-p", "-png", pdf_file, output_dir_and_filename],
-        shell=False)
-    if (returncode == 0):
-        # FIXME: this is a problem if other programs rely on this -- should be in docstring if it's guaranteed to log this
-        #lg.info(json1.json_completed_pdf_to_ppm(page_number,number_of_pages))
-        lg.info(json1.json_completed_pdf_to_ppm(-1,-1))
+    if page_numbers:
+        page_runs = page_number_runs(page_numbers)
     else:
-        lg.error(json1.json_failed_to_convert_pdf(None,pdf_file))
-    # return values
-    png_file_page_number_tuples=[]
-    # file names have the form <image root>-<page number>-<image number>.png where the numbers are 3-digit zero-padded values
+        page_runs = [None]
+    expected_png_file_page_number_tuples = []
+    for page_run in page_runs:
+        command = ["pdfimages", "-p", "-png"]
+        if page_run:
+            command = command + ["-f", str(page_run[0]), "-l", str(page_run[-1])]
+        returncode, output = tools.run(
+            command + [pdf_file, output_dir_and_filename])
+        if (returncode == 0):
+            if page_run:
+                progress.advance(len(page_run))
+            elif index:
+                progress.advance(index.number_of_pages)
+        else:
+            lg.error(json1.json_failed_to_convert_pdf(None,pdf_file))
+        if index:
+            # pdfimages numbers images from zero with each invocation
+            expected_png_file_page_number_tuples.extend(
+                pdfimages_expected_files(index,outfile_root,page_run))
     # - it would be great if pdfimages, w/o a single invocation, could (1) extract images *and* (2) provide list of images
     dir_files = os.listdir(output_dir)
-    outfile_root_re = re.compile("^"+outfile_root+"-(\d{1,3}\d{1,3}\d{1,3})-\d{1,3}\d{1,3}\d{1,3}\.png$")
+    if index:
+        # the index lists the images referenced by each page; an image
+        # referenced but not drawn (or an inline image) invalidates the
+        # expected list
+        if (len(expected_png_file_page_number_tuples) == len(dir_files) and
+            set(dir_files).issuperset([png_file for png_file, page_number in expected_png_file_page_number_tuples])):
+            return expected_png_file_page_number_tuples
+        lg.debug("pdfimages output does not match index; parsing file names")
+    return pdfimages_parse_file_names(dir_files,outfile_root)
+
+def pdfimages_expected_files(index,outfile_root,page_numbers=None):
+    """
+    Return the (<PNG file>,<page number>) tuples anticipated from a
+    single invocation of pdfimages, with output root OUTFILE_ROOT, on
+    the pages PAGE_NUMBERS (by default, all pages) of the document
+    described by INDEX.
+    """
+    if not page_numbers:
+        page_numbers = range(1,index.number_of_pages+1)
+    png_file_page_number_tuples=[]
+    # pdfimages numbers images sequentially across the pages
+    image_number = 0
+    for page_number in page_numbers:
+        for image in index.page(page_number)['images']:
+            for n in range(2 if image['smask'] else 1):
+                png_file_page_number_tuples.append(
+                    (str.format("{0}-{1:0>03d}-{2:0>03d}.png",outfile_root,page_number,image_number),
+                     page_number))
+                image_number = image_number + 1
+    return png_file_page_number_tuples
+
+def page_number_runs(page_numbers):
+    """
+    Return a list of lists of consecutive page numbers covering the
+    ascending page numbers PAGE_NUMBERS.
+    """
+    runs = []
+    for page_number in page_numbers:
+        if runs and runs[-1][-1] == page_number-1:
+            runs[-1].append(page_number)
+        else:
+            runs.append([page_number])
+    return runs
+
+def pdfimages_parse_file_names(dir_files,outfile_root):
+    """
+    Return (<PNG file>,<page number>) tuples for the members of
+    DIR_FILES written by pdfimages with output root OUTFILE_ROOT.
+    """
+    png_file_page_number_tuples=[]
+    # file names have the form <image root>-<page number>-<image number>.png where the numbers are 3-digit zero-padded values
+    outfile_root_re = re.compile("^"+re.escape(outfile_root)+"-(\d{1,3}\d{1,3}\d{1,3})-\d{1,3}\d{1,3}\d{1,3}\.png$")
     for dir_file in dir_files:
         png_file_match = outfile_root_re.match(dir_file)
         if png_file_match:
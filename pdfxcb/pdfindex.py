@@ -0,0 +1,278 @@
+"""Index the structure of a PDF document
+"""
+
+# Author: David A. Thompson
+
+import json
+import os
+import re
+
+import PyPDF2
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+import mapped
+
+#
+# A DocumentIndex is built once per input PDF and shared by the
+# extraction, scanning, and splitting stages so that the xref table
+# and page tree are parsed once. For each page, the index records the
+# page object (object number, generation, and byte offset), the page
+# boxes, the /Rotate attribute, the image XObjects referenced by the
+# page, and the kind of content drawn on the page (see
+# content_kind). The index may be saved as a JSON sidecar file and
+# reloaded for the same (unmodified) input without parsing the PDF.
+# The document is read through a memory-mapped view (see mapped.py),
+# so that objects are read on demand and the pages of the file held
+# in the page cache are shared with other readers.
+#
+
+# increment when the structure of the saved index changes
+index_format = 2
+
+# content stream operators which paint a path or show text
+painting_operators = set([b'f', b'F', b'f*', b'S', b's', b'B', b'B*', b'b', b'b*', b'sh'])
+# operator tokens (and the operand of Tr and Do) in a content stream;
+# inline image data (between ID and EI) is skipped
+content_token_re = re.compile(br'ID\s.*?\sEI(?=\s)|(\S+)\s+(Tr|Do)(?=[\s/\[<(]|$)|(?:^|(?<=[\s\]>)]))(BT|BI|f\*?|F|S|s|B\*?|b\*?|sh)(?=[\s/\[<(]|$)', re.S)
+
+class DocumentIndex(object):
+    """
+    PDF_FILE is the path to the PDF document. PAGES is a list of
+    dictionaries, one per page (see page_record). SIZE and MTIME
+    identify the version of PDF_FILE described by PAGES.
+    """
+    def __init__(self,pdf_file,pages,size,mtime,reader=None,stream=None):
+        self.pdf_file = pdf_file
+        self.pages = pages
+        self.size = size
+        self.mtime = mtime
+        self._reader = reader
+        self._stream = stream
+
+    @property
+    def number_of_pages(self):
+        return len(self.pages)
+
+    def page(self,page_number):
+        """Return the record for the page PAGE_NUMBER (beginning at one)."""
+        return self.pages[page_number-1]
+
+    def reader(self):
+        """
+        Return a PyPDF2.PdfFileReader for the document, opening the
+        document if necessary. The reader remains valid until close is
+        called.
+        """
+        if not self._reader:
+            self._stream = mapped.open_input(self.pdf_file)
+            self._reader = PyPDF2.PdfFileReader(self._stream,strict=False)
+        return self._reader
+
+    def close(self):
+        if self._stream:
+            self._stream.close()
+        self._reader = None
+        self._stream = None
+
+    def to_json(self):
+        return {
+            'format': index_format,
+            'file': self.pdf_file,
+            'size': self.size,
+            'mtime': self.mtime,
+            'pages': self.pages
+        }
+
+def build_index(pdf_file):
+    """
+    Parse the PDF document specified by PDF_FILE and return a
+    DocumentIndex. Log and raise an exception if the document (or an
+    object therein) cannot be parsed.
+    """
+    stat = os.stat(pdf_file)
+    stream = mapped.open_input(pdf_file)
+    try:
+        reader = PyPDF2.PdfFileReader(stream,strict=False)
+        pages = []
+        for page_index in range(reader.getNumPages()):
+            pages.append(page_record(reader,page_index))
+    except Exception as e:
+        stream.close()
+        lg.error(json1.json_msg(109, "Failure to open or parse a PDF file -- possible indication of a corrupt PDF",None,file=pdf_file))
+        raise e
+    lg.info(json1.json_pdf_info(len(pages)))
+    return DocumentIndex(pdf_file,pages,stat.st_size,stat.st_mtime,reader=reader,stream=stream)
+
+def page_record(reader,page_index):
+    """
+    Return a dictionary describing the page, specified by PAGE_INDEX
+    (beginning at zero), of the document read by READER.
+    """
+    page = reader.getPage(page_index)
+    object_number = None
+    generation = None
+    offset = None
+    if page.indirectRef:
+        object_number = page.indirectRef.idnum
+        generation = page.indirectRef.generation
+        # objects within object streams have no offset of their own
+        offset = reader.xref.get(generation,{}).get(object_number)
+    return {
+        'page': page_index+1,
+        'object': object_number,
+        'generation': generation,
+        'offset': offset,
+        'mediabox': page_box(page,'/MediaBox'),
+        'cropbox': page_box(page,'/CropBox'),
+        'rotate': int(get_value(page,'/Rotate',0)) % 360,
+        'images': image_records(get_value(page,'/Resources',None),0),
+        'content': content_kind(page)
+    }
+
+def box_list(box):
+    """Return the rectangle BOX as a list [x1,y1,x2,y2] of floats."""
+    return [float(value) for value in box]
+
+def page_box(page,name):
+    """
+    Return the rectangle NAME ('/MediaBox' or '/CropBox') of PAGE as a
+    list (see box_list); the crop box defaults to the media box.
+    PyPDF2's accessors (e.g., page.cropBox) are avoided since they
+    store a defaulted box in the page, which then differs from the
+    page split by a reader which has not been indexed.
+    """
+    if name == '/CropBox' and name not in page:
+        name = '/MediaBox'
+    return box_list(get_value(page,name,[0, 0, 612, 792]))
+
+def image_records(resources,depth):
+    """
+    Return a list of dictionaries, one for each image XObject in the
+    resource dictionary RESOURCES, including images within form
+    XObjects (to a limited depth).
+    """
+    images = []
+    if resources is None or depth > 4:
+        return images
+    resources = resources.getObject()
+    xobjects = get_value(resources,'/XObject',None)
+    if xobjects is None:
+        return images
+    for name in sorted(xobjects.keys()):
+        xobject = xobjects[name]
+        subtype = get_value(xobject,'/Subtype',None)
+        if subtype == '/Image':
+            filters = get_value(xobject,'/Filter',None)
+            if isinstance(filters,list):
+                filters = [str(f) for f in filters]
+            elif filters is not None:
+                filters = [str(filters)]
+            images.append({
+                'name': str(name),
+                'width': int(get_value(xobject,'/Width',0)),
+                'height': int(get_value(xobject,'/Height',0)),
+                'bits': int(get_value(xobject,'/BitsPerComponent',1)),
+                'filter': filters,
+                # pdfimages writes a soft mask as an image of its own
+                'smask': ('/SMask' in xobject)
+            })
+        elif subtype == '/Form':
+            images.extend(image_records(get_value(xobject,'/Resources',None),depth+1))
+    return images
+
+def content_kind(page):
+    """
+    Return a string describing what the PyPDF2 page object PAGE draws:
+    'image' if the page only draws images (a scanned page, possibly
+    with invisible OCR text), 'vector' if the page draws text, paths,
+    shadings, or form XObjects, and 'empty' if the page draws nothing.
+    """
+    contents = page.getContents()
+    if contents is None:
+        return 'empty'
+    xobjects = {}
+    resources = get_value(page,'/Resources',None)
+    if resources is not None:
+        xobjects = get_value(resources.getObject(),'/XObject',{})
+    images_p = False
+    text_p = False
+    text_rendering_modes = set()
+    for match in content_token_re.finditer(contents.getData()):
+        operand, operator, bare_operator = match.group(1), match.group(2), match.group(3)
+        if operator == b'Do':
+            name = operand.decode('latin-1')
+            if name in xobjects and get_value(xobjects[name],'/Subtype',None) == '/Image':
+                images_p = True
+            else:
+                return 'vector'
+        elif operator == b'Tr':
+            text_rendering_modes.add(operand)
+        elif bare_operator == b'BI' or (bare_operator is None and operator is None):
+            images_p = True
+        elif bare_operator == b'BT':
+            text_p = True
+        elif bare_operator in painting_operators:
+            return 'vector'
+    # text rendering mode 3 is invisible (e.g., an OCR layer)
+    if text_p and text_rendering_modes != set([b'3']):
+        return 'vector'
+    if images_p:
+        return 'image'
+    return 'empty'
+
+def get_value(dictionary,key,default):
+    """
+    Return the (direct) object corresponding to KEY in the PDF
+    dictionary DICTIONARY or, if KEY is absent, DEFAULT.
+    """
+    if key in dictionary:
+        # PyPDF2 resolves indirect objects on item access
+        return dictionary[key]
+    return default
+
+#
+# sidecar files
+#
+def load_index(index_file,pdf_file):
+    """
+    Return the DocumentIndex saved in INDEX_FILE if it describes the
+    current version of the document PDF_FILE. Otherwise, return None.
+    """
+    try:
+        with open(index_file) as f:
+            obj = json.load(f)
+    except (IOError, ValueError):
+        return None
+    stat = os.stat(pdf_file)
+    if (obj.get('format') != index_format or
+        obj.get('size') != stat.st_size or
+        obj.get('mtime') != stat.st_mtime):
+        return None
+    return DocumentIndex(pdf_file,obj['pages'],obj['size'],obj['mtime'])
+
+def save_index(index,index_file):
+    """Write INDEX, a DocumentIndex, to the file INDEX_FILE."""
+    with open(index_file,'w') as f:
+        json.dump(index.to_json(),f)
+
+def document_index(pdf_file,index_file=None):
+    """
+    Return a DocumentIndex for PDF_FILE. If INDEX_FILE is specified,
+    reuse the index saved there, if current; otherwise, build the
+    index and save it to INDEX_FILE.
+    """
+    if index_file:
+        index = load_index(index_file,pdf_file)
+        if index:
+            lg.debug("reusing index %s",index_file)
+            lg.info(json1.json_pdf_info(index.number_of_pages))
+            return index
+    index = build_index(pdf_file)
+    if index_file:
+        save_index(index,index_file)
+    return index
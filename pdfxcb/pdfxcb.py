@@ -4,14 +4,18 @@
 # Author: David A. Thompson
 
 import argparse
+import errno
 import imp
 import json
 import os
 import os.path
 import re
+import shutil
 import signal
 import sys
 import tempfile
+import threading
+import time
 import traceback
 import uuid
 
@@ -25,12 +29,25 @@ json_log_format = '%(message)s'
 lg.basicConfig(format=json_log_format,stream=sys.stdout)
 
 # internal modules
+import archive
 import barScan
 #import bubbles
+import decoders
+import distributed
 #import deskew
 #import exceptions
 import json1
+import manifest
+import mapped
 import pdf
+import pdfindex
+import plan
+import preflight
+import profiling
+import pruning
+import progress
+import resources
+import tools
 import util
 
 
@@ -52,12 +69,36 @@ except ImportError:
     sys.exit(msg)
 import PyPDF2
 
+# asyncio (or, with Python 2, the trollius backport) is only needed by
+# pdfxcb_async
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+class PdfxcbError(Exception):
+    """
+    A run made by pdfxcb_async failed. MESSAGE describes the failure
+    (as a rule, the JSON log message); REPORT describes the input if
+    it failed preflight (see preflight.PreflightFailed) and is None
+    otherwise.
+    """
+    def __init__(self,message,report=None):
+        Exception.__init__(self,message)
+        self.message = message
+        self.report = report
+
 
 # handle external signals requesting termination
 def signal_handler(signal, frame):
     # Ensure receipt of signal is logged prior to terminating
     msg = json1.json_exit_on_external_request_msg()
     lg.error(msg)
+    # don't leave orphaned pdftoppm/gs/pdfimages/zbarimg processes behind
+    tools.terminate_all()
     lg.info(json1.json_last_log_msg())
     sys.exit()
 
@@ -65,95 +106,280 @@ signal.signal(signal.SIGHUP, signal_handler)
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
+# output files are named, by default, as <barcode>-<index>.pdf (see README.md)
+default_name_template = "{barcode}-{index}.pdf"
+
+# Rasterization first renders the scan region of every page at the
+# low resolution (DPI), then renders again, at the high resolution,
+# only those pages where a barcode is suspected but was not decoded.
+default_resolutions = (100, 300)
+rasterize_scan_region = [0,0,0.7,0.5]
+
+# values of RASTERIZE_P (see pdfxcb) corresponding to the -r option
+extraction_modes = {
+    'auto': None,
+    'images': False,
+    'rasterize': True
+}
 
 #
 # function definitions
 #
-def locate_cover_sheets (png_file_tuples,containing_dir,match_re,scan_region):
+def locate_cover_sheets (png_file_tuples,containing_dir,match_re,scan_region,decoder=None):
     """
     Given the list of files specified by PNG_FILE_TUPLES (tuples where the first member specifies the name of the PNG file) and CONTAINING_DIR,
     identify those files containing a barcode. Return multiple values: a list of the
     corresponding barcodes and a list of the corresponding indices.
+    DECODER names the decoder backend (see decoders.py).
     """
-    barcodes = []
-    indices = []
+    return select_cover_sheets(select_barcodes(scan_images(png_file_tuples,containing_dir,scan_region,decoder),match_re),
+                               match_re)
+
+def scan_images (png_file_tuples,containing_dir,scan_region,decoder=None,index=None,whole_page=True,barcode_filter=None,signature_p=False):
+    """
+    Return a list, parallel to PNG_FILE_TUPLES, where each member is
+    the result of scanning the corresponding image (see
+    scan_for_barcode). If INDEX, the DocumentIndex of the PDF, is
+    specified, the /Rotate attribute of the page is taken into
+    account. WHOLE_PAGE should be False if the images are renderings
+    of a region of the page.
+
+    Each image is scanned as a whole, independently of the others, so
+    that the result for a page does not depend on the pages scanned
+    before it (e.g., by another worker; see distributed.py). Only
+    barcodes passing BARCODE_FILTER (if specified; see
+    decoders.make_barcode_filter) are decoded. If SIGNATURE_P is true,
+    the signature of each image spanning a page is recorded (see
+    pruning.py).
+    """
+    scan_results = []
     # I: index in IMAGE_FILES
     i = 0
     i_max = len(png_file_tuples)
+    progress.stage('scan',i_max)
     while (i<i_max):
-        # log progress by default (otherwise, this can be a long period of silence...)
-        lg.info(json1.json_progress("looking for barcode on " + str(i) + " of " + str(i_max) + " PNG files"))
-        image_file_spec = os.path.join(containing_dir,png_file_tuples[i][0])
-        lg.debug(image_file_spec)
-        maybe_barcode = barScan.barcodeScan(
-            image_file_spec,
-            scan_region         # None
-        )
-        # don't ignore barcode if consider is true
-        consider = True
-        if maybe_barcode:
-            if match_re:
-                consider = match_re.match(maybe_barcode)
-            if consider:
-                barcodes.append(maybe_barcode)
-                indices.append(i)
+        rotate = 0
+        if index:
+            rotate = index.page(png_file_tuples[i][1])['rotate']
+        scan_result = scan_for_barcode(os.path.join(containing_dir,png_file_tuples[i][0]),scan_region,decoder,rotate,whole_page,
+                                       barcode_filter,signature_p)
+        scan_results.append(scan_result)
+        # report progress (otherwise, this can be a long period of silence...)
+        progress.advance()
         i = i+1
-        #lg.debug(barcodes)
-        #lg.debug(indices)
+    return scan_results
+
+def select_barcodes (scan_results,match_re,symbologies=None,position=None):
+    """
+    Return a list, parallel to SCAN_RESULTS, where each member is the
+    barcode, selected from the symbols found in the corresponding
+    image, which identifies the page or None (see
+    barScan.select_symbol).
+    """
+    return [select_symbol_data(scan_result['symbols'],match_re,symbologies,position) for scan_result in scan_results]
+
+def select_symbol_data (symbols,match_re,symbologies,position):
+    symbol = barScan.select_symbol(symbols,match_re,symbologies,position)
+    if symbol:
+        return symbol['data']
+    return None
+
+def select_cover_sheets (maybe_barcodes,match_re):
+    """
+    MAYBE_BARCODES is a list where each member is a barcode or None.
+    Return multiple values: a list of the barcodes identifying cover
+    sheets and a list of the corresponding indices.
+    """
+    barcodes = []
+    indices = []
+    for i, maybe_barcode in enumerate(maybe_barcodes):
+        if cover_sheet_barcode_p(maybe_barcode,match_re):
+            barcodes.append(maybe_barcode)
+            indices.append(i)
+    lg.debug(barcodes)
+    lg.debug(indices)
     return barcodes,indices
 
+def scan_for_barcode (image_file_spec,scan_region,decoder,rotate=0,whole_page=True,barcode_filter=None,signature_p=False):
+    """
+    Return a dictionary describing the barcodes found in the image
+    specified by IMAGE_FILE_SPEC (see barScan.barcodeScanResult): the
+    'symbols' slot holds a list of the barcodes found and the
+    'barcode' slot holds the (topmost) barcode or, if no barcode is
+    found, None.
+    """
+    lg.debug(image_file_spec)
+    return barScan.barcodeScanResult(
+        image_file_spec,
+        scan_region,        # None
+        decoder,
+        rotate,
+        whole_page,
+        barcode_filter,
+        signature_p
+    )
+
+def cover_sheet_barcode_p (maybe_barcode,match_re):
+    """
+    Return true if MAYBE_BARCODE is a barcode which identifies a cover
+    sheet: if MATCH_RE is defined, ignore the barcode unless it
+    matches the regex MATCH_RE.
+    """
+    # don't ignore barcode if consider is true
+    consider = True
+    if maybe_barcode:
+        if match_re:
+            consider = match_re.match(maybe_barcode)
+        return bool(consider)
+    return False
+
 def executable_sanity_checks (executables):
     """
     Check for availability of executables specified in the list of strings EXECUTABLES.
+    Record the path of each executable found (see
+    tools.set_executable_path) so that subsequent runs of the tool use
+    the file checked.
     """
     lg.debug(util)
     for executable_spec in executables:
-        if not util.which(executable_spec):
+        executable_path = util.which(executable_spec)
+        if not executable_path:
             msg = json1.json_msg_executable_not_accessible(executable_spec)
             lg.error(msg)
             lg.info(json1.json_last_log_msg())
             sys.exit(msg)
+        tools.set_executable_path(executable_spec,os.path.abspath(executable_path))
+
+def generate_output_file_names(cover_sheet_barcodes,cover_sheet_page_numbers,output_dir,name_template=None,pdf_file_spec=None,start_time=None):
+    """
+    Return a list of paths, one for each member of
+    COVER_SHEET_BARCODES, within OUTPUT_DIR. COVER_SHEET_PAGE_NUMBERS
+    is a parallel list of the page numbers (page numbering begins at
+    one) of the corresponding cover sheets.
 
-def generate_output_file_names(cover_sheet_barcodes,cover_sheet_indices,output_dir):
+    NAME_TEMPLATE is a str.format template which may reference the
+    fields {barcode}, {index} (the cover sheet page number formatted
+    as a zero-padded three-digit value), {stem} (the name of the file
+    specified by PDF_FILE_SPEC without directory or suffix),
+    {timestamp} (START_TIME, the start of the run, in seconds since
+    the epoch; by default, the current time), and {version}. If NAME_TEMPLATE does not reference
+    {version}, a name which is already taken is disambiguated by
+    inserting -<version> before the suffix.
+
+    The directory is listed once. Each name is claimed by creating an
+    empty file exclusively so that concurrent pdfxcb processes writing
+    to the same directory never claim the same name; if claiming a
+    name fails, the names already claimed are removed. If OUTPUT_DIR is
+    None, return names (e.g., of archive members) distinct from one
+    another only.
+    """
+    if not name_template:
+        name_template = default_name_template
+    stem = None
+    if pdf_file_spec:
+        stem = os.path.splitext(os.path.basename(pdf_file_spec))[0]
+    timestamp = time.strftime("%Y%m%dT%H%M%S",time.localtime(start_time))
+    taken = set(os.listdir(output_dir) if output_dir else [])
     file_names = []
-    for cover_sheet_barcode,cover_sheet_index in zip(cover_sheet_barcodes,cover_sheet_indices):
-        cover_sheet_index_as_string = str.format("{0:0>03d}", cover_sheet_index)
-        version = -1
-        # sanity check on version (completely arbitrary at this point)
-        max_version = 99
-        while (not version >= max_version and (version < 0 or os.path.exists(path))):
-            version = version + 1
-            file_name = cover_sheet_barcode + "-" + cover_sheet_index_as_string + "-" + str(version) + ".pdf"
-            path = os.path.join(output_dir,file_name)
-        file_names.append(path)
+    # claimed names are removed if a later name cannot be claimed
+    try:
+        for cover_sheet_barcode,cover_sheet_page_number in zip(cover_sheet_barcodes,cover_sheet_page_numbers):
+            fields = {
+                'barcode': cover_sheet_barcode,
+                'index': str.format("{0:0>03d}", cover_sheet_page_number),
+                'stem': stem,
+                'timestamp': timestamp
+            }
+            # versionless name first unless the template demands a version
+            version = None
+            if '{version' in name_template:
+                version = 0
+            while True:
+                file_name = output_file_name(name_template,fields,version)
+                if file_name not in taken:
+                    if output_dir is None:
+                        path = file_name
+                        taken.add(file_name)
+                        break
+                    path = os.path.join(output_dir,file_name)
+                    # another process may have claimed the name since the directory was listed
+                    if claim_file(path):
+                        taken.add(file_name)
+                        break
+                taken.add(file_name)
+                if version is None:
+                    version = 1
+                else:
+                    version = version + 1
+            file_names.append(path)
+    except BaseException:
+        if output_dir is not None:
+            remove_output_files(file_names)
+        raise
     return file_names
 
+def output_file_name(name_template,fields,version):
+    """
+    Return a file name generated by filling NAME_TEMPLATE with the
+    values in the dictionary FIELDS and with VERSION. If VERSION is an
+    integer and NAME_TEMPLATE does not reference {version}, insert
+    -<version> before the suffix.
+    """
+    if version is None or '{version' in name_template:
+        return name_template.format(version=version,**fields)
+    file_name_sans_suffix, suffix = os.path.splitext(name_template.format(version=version,**fields))
+    return file_name_sans_suffix + "-" + str(version) + suffix
+
+def claim_file(path):
+    """
+    Atomically create an empty file at PATH. Return True if the file
+    was created and False if a file already exists at PATH.
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return False
+        raise
+    os.close(fd)
+    return True
+
+def remove_output_files(output_file_names):
+    """Remove the files OUTPUT_FILE_NAMES, claimed or (partially) written by split_document."""
+    for output_file_name in output_file_names:
+        try:
+            os.remove(output_file_name)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                lg.warn("could not remove %s: %s",output_file_name,e)
+
 def generate_page_ranges(cover_sheet_indices,png_file_page_number_tuples,number_of_pages):
     """
     Calling code must guarantee that tuples in
     PNG_FILE_PAGE_NUMBER_TUPLES are ordered (ascending) with respect
     to page numbers. COVER_SHEET_INDICES is an array of integers, each
     an index value identifying a member of PNG_FILE_PAGE_NUMBER_TUPLES
-    which corresponds to a cover sheet.
+    which corresponds to a cover sheet. Return a list of (<first
+    page>,<last page>) tuples, one for each cover sheet. The arguments
+    are not modified.
     """
     # to capture last set of pages, tag on an imaginary cover sheet at the end
-    cover_sheet_indices.append(
-        len(png_file_page_number_tuples)
-    )
-    png_file_page_number_tuples.append((None,number_of_pages+1))
+    first_page_numbers = ([png_file_page_number_tuples[cover_sheet_index][1] for cover_sheet_index in cover_sheet_indices] +
+                          [number_of_pages+1])
     page_ranges = []
-    for cover_sheet_index, next_cover_sheet_index in zip(cover_sheet_indices[:-1],cover_sheet_indices[1:]):
-        page_ranges.append(
-            (png_file_page_number_tuples[cover_sheet_index][1],
-             png_file_page_number_tuples[next_cover_sheet_index][1]-1))
+    for first_page_number, next_first_page_number in zip(first_page_numbers[:-1],first_page_numbers[1:]):
+        page_ranges.append((first_page_number,next_first_page_number-1))
     return page_ranges
 
+# external tools invoked by a run: pdftoppm rasterizes pages and
+# pdfimages extracts embedded images (see pdf.py)
+required_executables = [
+    'pdftoppm',
+    'pdfimages'
+]
+
 def sanity_checks (dirs,files):
     lg.debug(files)
-    required_executables = [
-        'gs'
-        #'pdftoppm'
-    ]
     executable_sanity_checks(required_executables)
     directory_sanity_checks (dirs,True)
     file_sanity_checks (files,True)
@@ -162,7 +388,7 @@ def sanity_checks (dirs,files):
     ]
     module_sanity_checks (required_modules,True)
 
-def pdfxcb (pdf_file_spec,output_dir,match_re,rasterize_p):
+def pdfxcb (pdf_file_spec,output_dir,match_re,rasterize_p,identifier=None,manifest_spec=None,name_template=None,scratch_root=None,keep_scratch=False,decoder=None,index_file=None,resolutions=None,symbologies=None,position=None,barcode_filter=None,workers=None,unit_pages=None,check_p=True,result=None,progress_interval=None,progress_file=None,progress_fn=None,archive_spec=None,profile_spec=None,profile_top_n=None,preflight_limits=None,reject_dir=None,prune_pages=False,blank_threshold=None,preflight_report=None,overwrite_archive=False):
     """
     Given the file specified by PDF_FILE_SPEC, look for cover sheets
     and split the PDF at each coversheet. Name output file(s) based on
@@ -171,16 +397,216 @@ def pdfxcb (pdf_file_spec,output_dir,match_re,rasterize_p):
     unless the corresponding string matches the regex MATCH_RE. Use
     RASTERIZE_P = False if the PDF does not contain vector graphics
     but is solely bitmap data (e.g., the PDF was generated from a
-    scanned document).
+    scanned document). Use RASTERIZE_P = None to choose, for each
+    page, between the two approaches based on the content of the page.
+
+    If MANIFEST_SPEC is a string, write a JSON Lines manifest
+    describing the run, tagged with IDENTIFIER, to the corresponding
+    file ('-' specifies standard output). NAME_TEMPLATE, if specified,
+    overrides the default output file name template (see
+    generate_output_file_names).
+
+    Intermediate files are written to a private directory created
+    within SCRATCH_ROOT (by default, the system temporary directory)
+    and removed at the end of the run unless KEEP_SCRATCH is true.
+    DECODER names the barcode decoder backend (see decoders.py). If
+    INDEX_FILE is specified, the document index (see pdfindex.py) is
+    reused from, or saved to, the corresponding file. RESOLUTIONS, a
+    pair of integers, specifies the low and high resolutions (DPI) for
+    rasterization (see rasterize_and_scan). Where a cover sheet holds
+    several barcodes, SYMBOLOGIES (a list of symbology names in order
+    of preference) and POSITION ('top', 'bottom', 'left', 'right', or
+    'first') select the barcode which identifies the cover sheet (see
+    barScan.select_symbol). Only barcodes passing BARCODE_FILTER (if
+    specified; see decoders.make_barcode_filter) are decoded.
+
+    If WORKERS, a list of worker addresses ('<host>:<port>'), is
+    specified, pages are extracted and scanned by the workers in units
+    of UNIT_PAGES pages (see distributed.py); cover sheets are located
+    and the PDF is split as usual.
+
+    If CHECK_P is False, the availability of external tools and of the
+    decoder is assumed (e.g., checked once by a long-lived server). If
+    RESULT, a dictionary, is specified, it is filled with a
+    description of the outcome: 'files', 'barcodes', 'indices',
+    'page_ranges', 'symbols', 'orientations', 'number_of_pages',
+    'dropped_pages', and 'timings'.
+
+    Progress is reported at most once every PROGRESS_INTERVAL seconds
+    (by default, progress.default_interval); see progress.Progress
+    regarding PROGRESS_FILE and PROGRESS_FN.
+
+    If ARCHIVE_SPEC is specified, the output files, and the manifest,
+    are written to the corresponding archive (see archive.py) rather
+    than to OUTPUT_DIR. Exit if the archive exists, unless
+    OVERWRITE_ARCHIVE is true.
+
+    If PROFILE_SPEC is specified, the run is profiled; the profile is
+    written to the corresponding file and the PROFILE_TOP_N functions
+    with the most internal time are logged (see profiling.py).
+
+    Before any image is extracted, the PDF is checked (see
+    preflight.py) and rejected if it is corrupt, encrypted, empty, or
+    exceeds PREFLIGHT_LIMITS; a rejected PDF is moved to REJECT_DIR, if
+    specified, and preflight.PreflightFailed is raised. If
+    PREFLIGHT_REPORT, the outcome of preflight.preflight for the file
+    (e.g., examined by main before resources are tuned), is specified,
+    the file is not examined again.
+
+    If PRUNE_PAGES is true, blank and duplicate pages are left out of
+    the output files (see pruning.py); a page is blank if its ink
+    coverage is below BLANK_THRESHOLD (by default,
+    pruning.default_blank_threshold). The pages dropped are reported
+    in the 'dropped_pages' slot of RESULT, the log (code 40), and the
+    manifest.
+
+    To scan the PDF now and split it later, see scan_plan and
+    apply_plan.
     """
     global lg
-    sanity_checks([output_dir],[pdf_file_spec])
+    timings = {}
+    start_time = time.time()
+    dirs = ([] if archive_spec else [output_dir])
+    if scratch_root:
+        dirs.append(scratch_root)
+    if check_p:
+        sanity_checks(dirs,[pdf_file_spec])
+        decoders.decoder_sanity_check(decoder or decoders.default_decoder)
+    else:
+        directory_sanity_checks(dirs,True)
+        file_sanity_checks([pdf_file_spec],True)
+    archive_sanity_check(archive_spec,overwrite_archive)
+    preflight.preflight_sanity_check(pdf_file_spec,preflight_limits,(resolutions or default_resolutions)[1],
+                                     reject_dir,result,preflight_report)
     # If confident that the PDF under analysis is derived from a scan
     # (i.e., contains only bitmap data), then the images embedded in
     # the PDF can be analyzed directly. If the PDF may contain vector
     # data on the cover sheet pages, then rasterization is indicated.
     # See doc/optimization.md for notes on time implications.
 
+    profiler = profiling.start(profile_spec)
+    progress.start(progress_interval,progress_file,progress_fn)
+    index = None
+    output_archive = None
+    try:
+        try:
+            # The index is shared by the extraction, scanning, and splitting
+            # stages so that the document is parsed once.
+            index = pdfindex.document_index(pdf_file_spec,index_file)
+            document_plan = scan_document(pdf_file_spec,index,match_re,rasterize_p,timings,scratch_root,keep_scratch,
+                                          decoder,resolutions,symbologies,position,barcode_filter,workers,unit_pages,
+                                          prune_pages,blank_threshold)
+            tools.check_cancelled('split')
+            output_archive = (archive.open_archive(archive_spec,overwrite_archive) if archive_spec else None)
+            output_file_names = split_document(pdf_file_spec,document_plan,output_dir,name_template,index.reader(),
+                                               timings,output_archive,start_time)
+        finally:
+            if index:
+                index.close()
+            progress.stop()
+            profiling.stop(profiler,profile_spec,profile_top_n)
+        timings['total'] = time.time() - start_time
+        report_outcome(pdf_file_spec,document_plan,output_file_names,timings,identifier,manifest_spec,result,output_archive)
+    except BaseException:
+        # an incomplete archive is not left behind
+        if output_archive:
+            output_archive.discard()
+        raise
+    finally:
+        if output_archive:
+            output_archive.close()
+    return True
+
+def scan_plan (pdf_file_spec,match_re,rasterize_p,plan_spec=None,scratch_root=None,keep_scratch=False,decoder=None,index_file=None,resolutions=None,symbologies=None,position=None,barcode_filter=None,workers=None,unit_pages=None,check_p=True,progress_interval=None,progress_file=None,progress_fn=None,profile_spec=None,profile_top_n=None,preflight_limits=None,reject_dir=None,prune_pages=False,blank_threshold=None,preflight_report=None):
+    """
+    Look for cover sheets in the file specified by PDF_FILE_SPEC, as
+    pdfxcb does, but do not split the PDF. Return the plan (see
+    plan.make_plan): the cover sheet barcodes and the page range
+    each identifies. If PLAN_SPEC is specified, write the plan to the
+    corresponding file ('-' specifies standard output); the PDF can
+    then be split with apply_plan. See pdfxcb regarding the other
+    arguments.
+    """
+    timings = {}
+    start_time = time.time()
+    dirs = []
+    if scratch_root:
+        dirs.append(scratch_root)
+    if check_p:
+        sanity_checks(dirs,[pdf_file_spec])
+        decoders.decoder_sanity_check(decoder or decoders.default_decoder)
+    else:
+        directory_sanity_checks(dirs,True)
+        file_sanity_checks([pdf_file_spec],True)
+    preflight.preflight_sanity_check(pdf_file_spec,preflight_limits,(resolutions or default_resolutions)[1],
+                                     reject_dir,None,preflight_report)
+    profiler = profiling.start(profile_spec)
+    progress.start(progress_interval,progress_file,progress_fn)
+    index = None
+    try:
+        index = pdfindex.document_index(pdf_file_spec,index_file)
+        document_plan = scan_document(pdf_file_spec,index,match_re,rasterize_p,timings,scratch_root,keep_scratch,
+                                      decoder,resolutions,symbologies,position,barcode_filter,workers,unit_pages,
+                                      prune_pages,blank_threshold)
+    finally:
+        if index:
+            index.close()
+        progress.stop()
+        profiling.stop(profiler,profile_spec,profile_top_n)
+    timings['total'] = time.time() - start_time
+    if plan_spec:
+        plan.write_plan(document_plan,plan_spec)
+    return document_plan
+
+def apply_plan (pdf_file_spec,document_plan,output_dir,plan_spec=None,identifier=None,manifest_spec=None,name_template=None,result=None,archive_spec=None,profile_spec=None,profile_top_n=None,overwrite_archive=False):
+    """
+    Split the file specified by PDF_FILE_SPEC as described by
+    DOCUMENT_PLAN (see scan_plan) without scanning the file. Return
+    True. PLAN_SPEC, if specified, identifies the plan in log
+    messages. Exit if the plan does not describe the current version
+    of the file. See pdfxcb regarding the other arguments.
+    """
+    timings = {}
+    start_time = time.time()
+    directory_sanity_checks(([] if archive_spec else [output_dir]),True)
+    file_sanity_checks([pdf_file_spec],True)
+    archive_sanity_check(archive_spec,overwrite_archive)
+    if not plan.plan_current_p(document_plan,pdf_file_spec):
+        msg = json1.json_plan_not_current(plan_spec,pdf_file_spec)
+        lg.error(msg)
+        lg.info(json1.json_last_log_msg())
+        sys.exit(msg)
+    output_archive = None
+    profiler = profiling.start(profile_spec)
+    try:
+        try:
+            tools.check_cancelled('split')
+            output_archive = (archive.open_archive(archive_spec,overwrite_archive) if archive_spec else None)
+            with mapped.open_input(pdf_file_spec) as stream:
+                output_file_names = split_document(pdf_file_spec,document_plan,output_dir,name_template,
+                                                   PyPDF2.PdfFileReader(stream,strict=False),timings,output_archive,
+                                                   start_time)
+        finally:
+            profiling.stop(profiler,profile_spec,profile_top_n)
+        timings['total'] = time.time() - start_time
+        report_outcome(pdf_file_spec,document_plan,output_file_names,timings,identifier,manifest_spec,result,output_archive)
+    except BaseException:
+        # an incomplete archive is not left behind
+        if output_archive:
+            output_archive.discard()
+        raise
+    finally:
+        if output_archive:
+            output_archive.close()
+    return True
+
+def scan_document (pdf_file_spec,index,match_re,rasterize_p,timings,scratch_root,keep_scratch,decoder,resolutions,symbologies,position,barcode_filter,workers,unit_pages,prune_p=False,blank_threshold=None):
+    """
+    Look for cover sheets in the PDF file specified by PDF_FILE_SPEC,
+    described by INDEX. Return a plan (see plan.make_plan). If PRUNE_P
+    is true, the plan identifies the blank and duplicate pages (see
+    pruning.dropped_pages) to drop when splitting.
+    """
     # PNG_FILE_PAGE_NUMBER_TUPLES is an array where each member has
     # the form (<PNG file name>, <PDF page number>). There is no
     # guarantee that all pages in the original PDF document are
@@ -188,55 +614,331 @@ def pdfxcb (pdf_file_spec,output_dir,match_re,rasterize_p):
     # PDF page -- i.e., the array might include ("flurpies.png",1) and
     # ("glurpies.png",1).
 
-    # FIXME: consider having a single call here -- FOO -- that specializes on rasterize_p
-    if rasterize_p:
-        # extract PDF pages as image data (PNG files)
-        png_file_page_number_tuples = split_pdf_to_png_files(pdf_file_spec,output_dir)
-        # Once rasterized pages are generated, optionally scan for cue marks
-        # CUE_INDICES = array where each member is an integer indicating index of member of png_file_page_number_tuples where the corresponding bitmap has a cue mark
-        # cue_indices = scan_for_cue_marks(png_file_page_number_tuples) <-- use urh_corner_mean w/reasonable threshold (10? 20? 50?) for "black" 
-    else:
-        # extract images directly from PDF
-        png_file_page_number_tuples = invoke_pdfimages_on(pdf_file_spec,output_dir)
-    # Code below expects png_file_page_number_tuples to be ordered with respect to page number.
-    # Note that sorted default is ascending order.
-    png_file_page_number_tuples = sorted(png_file_page_number_tuples,
-                                         key=lambda tuple: tuple[1])
-    #
-    # locate cover sheets
-    #
-    if rasterize_p:
-        # possibilities:
-        # 1. png files represent rasterized pages
-        scan_region = ([0,0,0.7,0.5])
-    else:
-        # 2. png files represent images from PDF (via pdfimages)
-        scan_region = None # None is not treated as the equivalent of ([0,0,1,1]). ([0,0,1,1]) triggers cropping by barcodeScan.
-    cover_sheet_barcodes, cover_sheet_indices = locate_cover_sheets(png_file_page_number_tuples,output_dir,match_re,scan_region)
-    print(cover_sheet_barcodes)
-    lg.debug(cover_sheet_barcodes)
-    lg.debug(cover_sheet_indices)
-    # Setting to False supports debugging/development. This should be set to True in production.
-    clean_up_png_files = False # False # True
-    if clean_up_png_files:
-        for png_file_tuple in png_file_page_number_tuples:
-            os.remove(os.path.join(output_dir,png_file_tuple[0]))
-    # write PDFs
-    pdf_length = pdf.pdf_number_of_pages(pdf_file_spec) # len(png_files) only works if PNGs are rasterized pages
+    # Intermediate (image) files are written to a private scratch
+    # directory, distinct from OUTPUT_DIR, so that concurrent runs
+    # never collide and OUTPUT_DIR is never listed.
+    scratch_dir = make_scratch_dir(scratch_root)
+    try:
+        png_file_page_number_tuples, cover_sheet_barcodes, cover_sheet_indices, cover_sheet_symbols, cover_sheet_orientations, signatures = extract_and_locate_cover_sheets(
+            pdf_file_spec,index,scratch_dir,match_re,rasterize_p,decoder,timings,resolutions,symbologies,position,
+            barcode_filter,workers,unit_pages,prune_p)
+    finally:
+        remove_scratch_dir(scratch_dir,keep_scratch)
+    pdf_length = index.number_of_pages # len(png_files) only works if PNGs are rasterized pages
     page_ranges = generate_page_ranges(cover_sheet_indices,png_file_page_number_tuples,pdf_length)
-    output_file_names = generate_output_file_names(cover_sheet_barcodes,cover_sheet_indices,output_dir)
+    # the logged indices end with the index of the imaginary cover
+    # sheet following the last image
+    logged_indices = cover_sheet_indices + [len(png_file_page_number_tuples)]
+    dropped_pages = None
+    if prune_p:
+        dropped_pages = pruning.dropped_pages(index,png_file_page_number_tuples,signatures,cover_sheet_indices,
+                                              blank_threshold)
+    return plan.make_plan(pdf_file_spec,pdf_length,cover_sheet_barcodes,logged_indices,page_ranges,
+                          cover_sheet_symbols,cover_sheet_orientations,dict(timings),dropped_pages)
+
+def split_document (pdf_file_spec,document_plan,output_dir,name_template,reader,timings,output_archive=None,start_time=None):
+    """
+    Write the PDFs described by DOCUMENT_PLAN to OUTPUT_DIR or, if
+    specified, to OUTPUT_ARCHIVE (an archive.Archive). READER is a
+    PyPDF2.PdfFileReader for the PDF file specified by PDF_FILE_SPEC.
+    START_TIME, the start of the run, fills the {timestamp} field of
+    NAME_TEMPLATE (see generate_output_file_names).
+    Return the paths (or member names) of the PDFs written. If
+    splitting fails (or the run is terminated), the output files
+    claimed in OUTPUT_DIR are removed so that none is mistaken for a
+    complete output.
+    """
+    page_ranges = document_plan['page_ranges']
+    dropped_pages = document_plan.get('dropped_pages')
+    excluded_pages = None
+    if dropped_pages:
+        excluded_pages = dropped_pages['blank'] + dropped_pages['duplicate']
+    output_file_names = generate_output_file_names(
+        document_plan['barcodes'],
+        [page_range[0] for page_range in page_ranges],
+        (None if output_archive else output_dir),
+        name_template=name_template,
+        pdf_file_spec=pdf_file_spec,
+        start_time=start_time)
     lg.debug(output_file_names)
-    pdf.pdf_split(pdf_file_spec,output_file_names,page_ranges)
+    stage_start_time = time.time()
+    progress.stage('split',len(page_ranges))
+    try:
+        pdf.pdf_split(pdf_file_spec,output_file_names,page_ranges,reader,output_archive,excluded_pages)
+    except BaseException:
+        if not output_archive:
+            remove_output_files(output_file_names)
+        raise
+    timings['split'] = time.time() - stage_start_time
+    return output_file_names
+
+def report_outcome (pdf_file_spec,document_plan,output_file_names,timings,identifier,manifest_spec,result,output_archive=None):
+    """
+    Log the outcome (code 40) of splitting the PDF file specified by
+    PDF_FILE_SPEC as described by DOCUMENT_PLAN into the files
+    OUTPUT_FILE_NAMES. See pdfxcb regarding MANIFEST_SPEC and RESULT.
+    If OUTPUT_ARCHIVE, the archive.Archive holding the files, is
+    specified, add the manifest to the archive and close the archive
+    (the caller discards the archive if this fails).
+    """
+    # plans written before pruning was introduced lack dropped_pages
+    dropped_pages = document_plan.get('dropped_pages')
+    data = {
+        'barcodes': document_plan['barcodes'],
+        'indices': document_plan['indices'],
+        'symbols': document_plan['symbols'],
+        'orientations': document_plan['orientations']
+    }
+    if dropped_pages is not None:
+        data['dropped_pages'] = dropped_pages
     lg.info(json1.json_msg(40,
              ['Analysis and burst completed'],
              False,
              files=output_file_names,
-             data={
-                 'barcodes': cover_sheet_barcodes,
-                 'indices': cover_sheet_indices
-             }
+             data=data
     ))
-    return True
+    if result is not None:
+        result.update({
+            'files': output_file_names,
+            'barcodes': document_plan['barcodes'],
+            'indices': document_plan['indices'],
+            'page_ranges': document_plan['page_ranges'],
+            'symbols': document_plan['symbols'],
+            'orientations': document_plan['orientations'],
+            'number_of_pages': document_plan['number_of_pages'],
+            'dropped_pages': dropped_pages,
+            'timings': timings
+        })
+    if manifest_spec or output_archive:
+        records = manifest.manifest_records(identifier,pdf_file_spec,document_plan['number_of_pages'],
+                                            output_file_names,document_plan['barcodes'],
+                                            document_plan['page_ranges'],timings,document_plan['orientations'],
+                                            document_plan['symbols'],
+                                            (output_archive.members if output_archive else None),
+                                            dropped_pages)
+        if output_archive:
+            output_archive.add(archive.manifest_member_name,manifest.manifest_bytes(records))
+            output_archive.close()
+        if manifest_spec:
+            manifest.write_manifest(records,manifest_spec)
+
+def extract_and_locate_cover_sheets (pdf_file_spec,index,scratch_dir,match_re,rasterize_p,decoder,timings,resolutions=None,symbologies=None,position=None,barcode_filter=None,workers=None,unit_pages=None,signature_p=False):
+    """
+    Extract image data from the PDF file specified by PDF_FILE_SPEC,
+    described by INDEX, into SCRATCH_DIR and look for cover sheets.
+    Return multiple values: the (<PNG file name>,<PDF page number>)
+    tuples, ordered by page number, the cover sheet barcodes, the
+    indices (into the tuples) of the cover sheets, the symbols (see
+    decoders.make_symbol) corresponding to the cover sheet barcodes,
+    the orientations of the cover sheet barcodes (see
+    barScan.barcode_orientation), and a list, parallel to the tuples,
+    of the signatures of the images (see pruning.py; None where an
+    image has no signature or SIGNATURE_P is false). Where an image holds several
+    barcodes, SYMBOLOGIES and POSITION determine which identifies the
+    page (see barScan.select_symbol). Only barcodes passing
+    BARCODE_FILTER (if specified) are decoded. Record the time
+    spent in each stage in the dictionary TIMINGS.
+
+    See extract_and_scan regarding RASTERIZE_P. If WORKERS, a list of
+    worker addresses, is specified, the pages are extracted and
+    scanned by the workers, UNIT_PAGES pages at a time (see
+    distributed.scan_distributed).
+    """
+    if workers:
+        png_file_page_number_tuples, scan_results = distributed.scan_distributed(
+            pdf_file_spec,index,scratch_dir,workers,match_re,rasterize_p,decoder,timings,
+            resolutions,barcode_filter,unit_pages,signature_p)
+    else:
+        png_file_page_number_tuples, scan_results = extract_and_scan(
+            pdf_file_spec,index,scratch_dir,match_re,rasterize_p,decoder,timings,
+            resolutions,barcode_filter,signature_p=signature_p)
+    cover_sheet_barcodes, cover_sheet_indices = select_cover_sheets(select_barcodes(scan_results,match_re,symbologies,position),match_re)
+    cover_sheet_symbols = [barScan.select_symbol(scan_results[i]['symbols'],match_re,symbologies,position) for i in cover_sheet_indices]
+    cover_sheet_orientations = [scan_results[i]['orientation'] for i in cover_sheet_indices]
+    signatures = [scan_result.get('signature') for scan_result in scan_results]
+    return png_file_page_number_tuples, cover_sheet_barcodes, cover_sheet_indices, cover_sheet_symbols, cover_sheet_orientations, signatures
+
+def extract_and_scan (pdf_file_spec,index,scratch_dir,match_re,rasterize_p,decoder,timings,resolutions=None,barcode_filter=None,page_numbers=None,signature_p=False):
+    """
+    Extract image data from the pages PAGE_NUMBERS (by default, all
+    pages) of the PDF file specified by PDF_FILE_SPEC, described by
+    INDEX, into SCRATCH_DIR and scan each image for barcodes. Return
+    multiple values: the (<PNG file name>,<PDF page number>) tuples,
+    ordered by page number, and a parallel list of scan results (see
+    scan_for_barcode). Record the time spent in each stage in the
+    dictionary TIMINGS.
+
+    If RASTERIZE_P is true, rasterize every page. If RASTERIZE_P is
+    False, extract the images embedded in the PDF. If RASTERIZE_P is
+    None, choose for each page based on the content of the page (see
+    pdfindex.content_kind): extract the embedded images of pages which
+    only draw images, rasterize pages with vector content, and skip
+    pages which draw nothing.
+
+    If SIGNATURE_P is true, the scan result of each extracted image
+    holds its signature (see pruning.py); rendered regions of pages
+    have no signature.
+    """
+    timings['extract'] = 0
+    timings['scan'] = 0
+    if page_numbers is None:
+        pages = index.pages
+    else:
+        pages = [index.page(page_number) for page_number in page_numbers]
+    if rasterize_p is None:
+        image_page_numbers = [page['page'] for page in pages if page['content'] == 'image']
+        vector_page_numbers = [page['page'] for page in pages if page['content'] == 'vector']
+        lg.info(json1.json_extraction_plan(image_page_numbers,vector_page_numbers,len(pages)))
+        if len(image_page_numbers) == index.number_of_pages:
+            # a single pdfimages invocation handles the entire document
+            image_page_numbers = None
+    elif rasterize_p:
+        image_page_numbers = []
+        vector_page_numbers = [page['page'] for page in pages]
+    else:
+        image_page_numbers = page_numbers
+        vector_page_numbers = []
+    png_file_page_number_tuples = []
+    scan_results = []
+    if image_page_numbers is None or image_page_numbers:
+        tuples, results = extract_images_and_scan(pdf_file_spec,index,scratch_dir,decoder,timings,image_page_numbers,
+                                                  barcode_filter,signature_p)
+        png_file_page_number_tuples.extend(tuples)
+        scan_results.extend(results)
+    if vector_page_numbers:
+        tuples, results = rasterize_and_scan(pdf_file_spec,index,scratch_dir,decoder,timings,resolutions,vector_page_numbers,match_re,
+                                             barcode_filter)
+        png_file_page_number_tuples.extend(tuples)
+        scan_results.extend(results)
+    # Code below expects png_file_page_number_tuples to be ordered with
+    # respect to page number (sorting is stable; images on the same page
+    # remain in order).
+    tuple_result_pairs = sorted(zip(png_file_page_number_tuples,scan_results),
+                                key=lambda pair: pair[0][1])
+    return [pair[0] for pair in tuple_result_pairs], [pair[1] for pair in tuple_result_pairs]
+
+def extract_images_and_scan (pdf_file_spec,index,scratch_dir,decoder,timings,page_numbers=None,barcode_filter=None,signature_p=False):
+    """
+    Extract the images embedded in the pages PAGE_NUMBERS (by default,
+    all pages) of the PDF file specified by PDF_FILE_SPEC and scan
+    each image for a barcode. Return multiple values: the (<PNG file
+    name>,<PDF page number>) tuples, ordered by page number, and a
+    parallel list of scan results (see scan_for_barcode). See
+    scan_images regarding BARCODE_FILTER and SIGNATURE_P.
+    """
+    stage_start_time = time.time()
+    progress.stage('extract',len(page_numbers) if page_numbers else index.number_of_pages)
+    # extract images directly from PDF
+    png_file_page_number_tuples = invoke_pdfimages_on(pdf_file_spec,scratch_dir,index,page_numbers)
+    # Note that sorted default is ascending order.
+    png_file_page_number_tuples = sorted(png_file_page_number_tuples,
+                                         key=lambda tuple: tuple[1])
+    timings['extract'] = timings['extract'] + time.time() - stage_start_time
+    # png files represent images from PDF (via pdfimages)
+    scan_region = None # None is not treated as the equivalent of ([0,0,1,1]). ([0,0,1,1]) triggers cropping by barcodeScan.
+    stage_start_time = time.time()
+    scan_results = scan_images(png_file_page_number_tuples,scratch_dir,scan_region,decoder,index,
+                               barcode_filter=barcode_filter,signature_p=signature_p)
+    timings['scan'] = timings['scan'] + time.time() - stage_start_time
+    return png_file_page_number_tuples, scan_results
+
+def rasterize_and_scan (pdf_file_spec,index,scratch_dir,decoder,timings,resolutions=None,page_numbers=None,match_re=None,barcode_filter=None):
+    """
+    Rasterize the pages PAGE_NUMBERS (by default, all pages) of the
+    PDF file specified by PDF_FILE_SPEC and scan each for a barcode.
+    Return values as extract_images_and_scan.
+
+    Only the scan region of each page is rendered, first at the low
+    resolution of RESOLUTIONS (by default, DEFAULT_RESOLUTIONS). Pages
+    where no barcode matching MATCH_RE is decoded but where a barcode appears to be
+    present (see barScan.barcode_likely) are rendered again at the high
+    resolution and scanned again.
+    """
+    low_resolution, high_resolution = resolutions or default_resolutions
+    stage_start_time = time.time()
+    # Once rasterized pages are generated, optionally scan for cue marks
+    # CUE_INDICES = array where each member is an integer indicating index of member of png_file_page_number_tuples where the corresponding bitmap has a cue mark
+    # cue_indices = scan_for_cue_marks(png_file_page_number_tuples) <-- use urh_corner_mean w/reasonable threshold (10? 20? 50?) for "black" 
+    progress.stage('rasterize',len(page_numbers) if page_numbers else index.number_of_pages)
+    png_file_page_number_tuples = split_pdf_to_png_files(pdf_file_spec,scratch_dir,index,
+                                                         low_resolution,rasterize_scan_region,
+                                                         page_numbers)
+    timings['extract'] = timings['extract'] + time.time() - stage_start_time
+    # the rendered images are already limited to the scan region
+    stage_start_time = time.time()
+    # pdftoppm applies /Rotate; the renderings are upright
+    scan_results = scan_images(png_file_page_number_tuples,scratch_dir,None,decoder,index,False,barcode_filter)
+    suspect_page_numbers = [page_number for (png_file, page_number), scan_result in zip(png_file_page_number_tuples,scan_results)
+                            if not [symbol for symbol in scan_result['symbols'] if cover_sheet_barcode_p(symbol['data'],match_re)]
+                            and barScan.barcode_likely(os.path.join(scratch_dir,png_file))]
+    timings['scan'] = timings['scan'] + time.time() - stage_start_time
+    if suspect_page_numbers:
+        lg.debug("rendering pages %s at %s DPI",suspect_page_numbers,high_resolution)
+        stage_start_time = time.time()
+        progress.stage('rasterize',len(suspect_page_numbers))
+        high_resolution_tuples = split_pdf_to_png_files(pdf_file_spec,scratch_dir,index,
+                                                        high_resolution,rasterize_scan_region,
+                                                        suspect_page_numbers)
+        timings['extract'] = timings['extract'] + time.time() - stage_start_time
+        stage_start_time = time.time()
+        positions = dict([(page_number, i) for i, (png_file, page_number) in enumerate(png_file_page_number_tuples)])
+        progress.stage('scan',len(high_resolution_tuples))
+        for png_file, page_number in high_resolution_tuples:
+            i = positions[page_number]
+            png_file_page_number_tuples[i] = (png_file, page_number)
+            scan_results[i] = scan_for_barcode(os.path.join(scratch_dir,png_file),None,decoder,
+                                               index.page(page_number)['rotate'],False,
+                                               barcode_filter=barcode_filter)
+            progress.advance()
+        timings['scan'] = timings['scan'] + time.time() - stage_start_time
+    return png_file_page_number_tuples, scan_results
+
+def pdfxcb_async (pdf_file_spec,output_dir,match_re,rasterize_p,loop=None,executor=None,**kwargs):
+    """
+    Return an asyncio future for the result of calling pdfxcb with
+    the specified arguments (see pdfxcb). The call is made in EXECUTOR
+    (by default, the default executor of LOOP). Cancelling the future
+    kills any external tool run on behalf of the call and abandons the
+    call at that point or, if no tool is running, before the next
+    stage begins (in particular, before any output is written); the
+    number of external tools running at once, across all calls, is
+    capped (see tools.set_max_processes). A failure which would end a
+    command-line run (a SystemExit, including
+    preflight.PreflightFailed) sets the exception of the future to a
+    PdfxcbError rather than ending the process running the loop.
+    """
+    if asyncio is None:
+        msg = json1.json_msg_module_not_accessible('asyncio')
+        lg.error(msg)
+        raise RuntimeError(msg)
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    cancel_event = threading.Event()
+    def call_pdfxcb ():
+        tools.set_cancel_event(cancel_event)
+        try:
+            return pdfxcb(pdf_file_spec,output_dir,match_re,rasterize_p,**kwargs)
+        except SystemExit as e:
+            raise PdfxcbError(e.code,getattr(e,'report',None))
+        finally:
+            tools.set_cancel_event(None)
+    future = loop.run_in_executor(executor,call_pdfxcb)
+    def cancel_tools (future):
+        if future.cancelled():
+            cancel_event.set()
+    future.add_done_callback(cancel_tools)
+    return future
+
+def archive_sanity_check (archive_spec,overwrite_p=False):
+    msg = None
+    if archive_spec and not archive.archive_format(archive_spec):
+        msg = json1.json_msg(108,["Unrecognized archive suffix"],False,file=archive_spec)
+    elif archive_spec and archive_spec != '-' and os.path.exists(archive_spec) and not overwrite_p:
+        msg = json1.json_msg(108,["Archive exists (see --force)"],False,file=archive_spec)
+    if msg:
+        lg.error(msg)
+        lg.info(json1.json_last_log_msg())
+        sys.exit(msg)
 
 def directory_sanity_check (directory_spec,exitp):
     if not os.path.isdir(directory_spec):
@@ -260,11 +962,13 @@ def file_sanity_checks (files,exitp):
     for file in files:
         file_sanity_check(file,True)
 
-def invoke_pdfimages_on (pdf_file_spec,output_dir):
+def invoke_pdfimages_on (pdf_file_spec,output_dir,index=None,page_numbers=None):
     """
     Extract images in PDF file specified by PDF_FILE_SPEC into a
     series of files, each representing a single PNG image. Write files
-    to directory specified by OUTPUT_DIR.
+    to directory specified by OUTPUT_DIR. INDEX, if specified, is the
+    pdfindex.DocumentIndex for PDF_FILE_SPEC. PAGE_NUMBERS, if
+    specified, limits extraction to the specified pages.
 
     Returns a list of tuples where each tuple has the structure
     (png_file,png_file_page_number) png_file_page_number is an
@@ -279,7 +983,7 @@ def invoke_pdfimages_on (pdf_file_spec,output_dir):
             lg.error(json1.json_msg(108,[msg],False,files=[pdf_file_spec]))
             sys.exit(msg)
         else:
-            png_file_page_number_tuples = pdf.pdfimages(pdf_file_spec,output_dir)
+            png_file_page_number_tuples = pdf.pdfimages(pdf_file_spec,output_dir,index,page_numbers)
     except Exception as e:
         lg.debug(str(e))
         msg = json1.json_failed_to_convert_pdf(e,pdf_file_spec)
@@ -293,6 +997,50 @@ def invoke_pdfimages_on (pdf_file_spec,output_dir):
         ))
         return png_file_page_number_tuples
 
+def preflight_input (pdf_file_spec,preflight_limits=None,resolutions=None):
+    """
+    Examine the PDF file specified by PDF_FILE_SPEC (see
+    preflight.preflight) without logging the outcome. Return the
+    report or None if the file cannot be read (reported, like any
+    failure, by the sanity checks of the run).
+    """
+    try:
+        return preflight.preflight(pdf_file_spec,preflight_limits,(resolutions or default_resolutions)[1])
+    except EnvironmentError as e:
+        lg.debug("preflight: %s",e)
+        return None
+
+def tune_resources (preflight_report,resolutions=None):
+    """
+    Return the concurrency suited to the CPUs and memory available for
+    scanning the PDF described by PREFLIGHT_REPORT (see
+    preflight.preflight; None if unknown). Pages are assumed to be the
+    size of the first page, rendered whole at the high resolution of
+    RESOLUTIONS (by default, DEFAULT_RESOLUTIONS). See resources.tune.
+    """
+    page_dimensions = (preflight_report['page_dimensions'] if preflight_report else None)
+    return resources.tune(page_dimensions,(resolutions or default_resolutions)[1])
+
+def make_scratch_dir (scratch_root):
+    """
+    Create and return a private directory, for intermediate files,
+    within the directory specified by SCRATCH_ROOT. If SCRATCH_ROOT is
+    None, use the system temporary directory (see tempfile.gettempdir).
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="pdfxcb-",dir=scratch_root)
+    lg.debug("scratch directory: %s",scratch_dir)
+    return scratch_dir
+
+def remove_scratch_dir (scratch_dir,keep_scratch):
+    """
+    Remove the directory SCRATCH_DIR and its contents unless
+    KEEP_SCRATCH is true (supports debugging/development).
+    """
+    if keep_scratch:
+        lg.debug("retaining scratch directory: %s",scratch_dir)
+    else:
+        shutil.rmtree(scratch_dir,True)
+
 def module_sanity_checks (module_names,exitp):
     """MODULE_NAMES is a sequence of strings"""
     for module_name in module_names:
@@ -310,11 +1058,13 @@ def module_sanity_check (module_name,exitp):
         if exitp:
             sys.exit(msg)
 
-def split_pdf_to_png_files (pdf_file_spec,output_dir):
+def split_pdf_to_png_files (pdf_file_spec,output_dir,index=None,resolution=None,region=None,page_numbers=None):
     """
     Split the PDF file specified by PDF_FILE_SPEC into a series of
-    files, each representing a single page as a PNG image. Write files
-    to directory specified by OUTPUT_DIR.
+    files, each representing a single page as a PGM image. Write files
+    to directory specified by OUTPUT_DIR. INDEX, if specified, is the
+    pdfindex.DocumentIndex for PDF_FILE_SPEC. See pdf.pdf_to_pngs
+    regarding RESOLUTION, REGION, and PAGE_NUMBERS.
     """
     png_files = None
     try:
@@ -325,7 +1075,7 @@ def split_pdf_to_png_files (pdf_file_spec,output_dir):
             sys.exit(msg)
         else:
             # array of (<file_name>,<page_number>) tuples
-            png_specs = pdf.pdf_to_pngs(pdf_file_spec,output_dir)
+            png_specs = pdf.pdf_to_pngs(pdf_file_spec,output_dir,index,resolution,region,page_numbers)
     except Exception as e:
         msg = json1.json_failed_to_convert_pdf(e,pdf_file_spec)
         lg.error(msg)
@@ -374,6 +1124,11 @@ def main():
                         action="store",
                         dest="match_re_string",
                         type=str)
+    parser.add_argument("-j",
+                        help="absolute path to JSON Lines manifest file ('-' for standard output)",
+                        action="store",
+                        dest="manifest_spec",
+                        type=str)
     parser.add_argument("-p",
                         help="identifier for a specific instance of pdfxcb",
                         action="store",
@@ -384,12 +1139,163 @@ def main():
                         action="store",
                         dest="log_level",
                         type=int)
+    parser.add_argument("-r",
+                        help="how image data is obtained from pages: auto (default; per page), images (embedded images), or rasterize",
+                        action="store",
+                        dest="extraction_mode",
+                        choices=sorted(extraction_modes.keys()),
+                        default="auto",
+                        type=str)
+    parser.add_argument("-R",
+                        help="low and high rasterization resolutions in DPI (default: 100,300)",
+                        action="store",
+                        dest="resolutions",
+                        type=str)
+    parser.add_argument("-s",
+                        help="absolute path to directory within which a private scratch directory is created",
+                        action="store",
+                        dest="scratch_root",
+                        type=str)
+    parser.add_argument("-k",
+                        help="keep the scratch directory (debugging)",
+                        action="store_true",
+                        dest="keep_scratch")
+    parser.add_argument("-x",
+                        help="absolute path to document index sidecar file (reused if current, otherwise written)",
+                        action="store",
+                        dest="index_file",
+                        type=str)
+    parser.add_argument("-z",
+                        help="barcode decoder (" + ", ".join(sorted(decoders.decoders)) + ")",
+                        action="store",
+                        dest="decoder",
+                        type=str)
+    parser.add_argument("-T",
+                        help="seconds after which an external tool (pdftoppm, gs, pdfimages, zbarimg) is killed",
+                        action="store",
+                        dest="tool_timeout",
+                        type=float)
+    parser.add_argument("-y",
+                        help="comma-separated list of symbologies, in order of preference, for selecting among several barcodes on a cover sheet (e.g., CODE128,QRCODE)",
+                        action="store",
+                        dest="symbologies",
+                        type=str)
+    parser.add_argument("-P",
+                        help="position for selecting among several barcodes on a cover sheet (default: top)",
+                        action="store",
+                        dest="position",
+                        choices=['top','bottom','left','right','first'],
+                        type=str)
+    parser.add_argument("-S",
+                        help="comma-separated list of symbologies to decode (e.g., CODE128,CODE39); other barcodes are ignored",
+                        action="store",
+                        dest="filter_symbologies",
+                        type=str)
+    parser.add_argument("-L",
+                        help="minimum and maximum length of a barcode, separated by a comma (either may be omitted, e.g., 6, or ,12)",
+                        action="store",
+                        dest="filter_lengths",
+                        type=str)
+    parser.add_argument("-C",
+                        help="ignore barcodes without a valid check digit (" + ", ".join(sorted(decoders.check_digit_schemes)) + ")",
+                        action="store",
+                        dest="filter_check_digit",
+                        choices=sorted(decoders.check_digit_schemes),
+                        type=str)
+    parser.add_argument("-w",
+                        help="comma-separated list of worker addresses (<host>:<port>; see pdfxcb-worker) which extract and scan pages",
+                        action="store",
+                        dest="workers",
+                        type=str)
+    parser.add_argument("-W",
+                        help="number of local worker processes which extract and scan pages ('auto': as many as the CPUs and memory available accommodate)",
+                        action="store",
+                        dest="local_workers",
+                        type=str)
+    parser.add_argument("-u",
+                        help="number of pages per work unit handed to a worker (default: pages divided evenly, two units per worker)",
+                        action="store",
+                        dest="unit_pages",
+                        type=int)
+    parser.add_argument("-o",
+                        help="write the output PDFs, and the manifest, to a single archive (.zip, .tar, .tar.gz, or .tgz; '-' writes a TAR stream to standard output) instead of the output directory",
+                        action="store",
+                        dest="archive_spec",
+                        type=str)
+    parser.add_argument("--force",
+                        help="replace an existing archive (see -o)",
+                        action="store_true",
+                        dest="force")
+    parser.add_argument("-n",
+                        help="scan only: write the plan (cover sheet barcodes and page ranges) as JSON to the specified file ('-' for standard output); no PDF is written",
+                        action="store",
+                        dest="plan_spec",
+                        type=str)
+    parser.add_argument("-a",
+                        help="split the input as described by the specified plan file (see -n) without scanning it",
+                        action="store",
+                        dest="apply_plan_spec",
+                        type=str)
+    parser.add_argument("-g",
+                        help="absolute path to a file holding the latest progress event (JSON)",
+                        action="store",
+                        dest="progress_file",
+                        type=str)
+    parser.add_argument("-i",
+                        help="minimum number of seconds between progress events (default: {})".format(progress.default_interval),
+                        action="store",
+                        dest="progress_interval",
+                        type=float)
+    parser.add_argument("-N",
+                        help="reject an input with more than the specified number of pages",
+                        action="store",
+                        dest="max_pages",
+                        type=int)
+    parser.add_argument("-M",
+                        help="reject an input larger than the specified number of megabytes",
+                        action="store",
+                        dest="max_megabytes",
+                        type=float)
+    parser.add_argument("-E",
+                        help="reject an input whose estimated work (pages times megapixels per page at the high resolution) exceeds the specified number of megapixels",
+                        action="store",
+                        dest="max_megapixels",
+                        type=float)
+    parser.add_argument("-Q",
+                        help="absolute path to a directory to which an input rejected by preflight (corrupt, encrypted, empty, or exceeding -N, -M, or -E) is moved",
+                        action="store",
+                        dest="reject_dir",
+                        type=str)
+    parser.add_argument("--profile",
+                        help="profile the run and write the profile (see pstats) to the specified file (default: the log file path followed by .prof); the functions with the most internal time are logged",
+                        action="store",
+                        dest="profile_spec",
+                        nargs='?',
+                        const='',
+                        type=str)
+    parser.add_argument("-e",
+                        help="drop blank and duplicate pages from the output PDFs",
+                        action="store_true",
+                        dest="prune_pages")
+    parser.add_argument("-b",
+                        help="fraction of a page covered by ink below which the page is blank (default: {}; see -e)".format(pruning.default_blank_threshold),
+                        action="store",
+                        dest="blank_threshold",
+                        type=float)
+    parser.add_argument("-t",
+                        help="output file name template (fields: {barcode}, {index}, {stem}, {timestamp}, {version})",
+                        action="store",
+                        dest="name_template",
+                        type=str)
     #parser.add_argument('-v', '--version', action='version', version=version.version)
     parser.add_argument("input_files", help="an input (PDF) file",
                         # keep nargs as we may want to accept multiple PDFs as input at some point
                         nargs=1,
                         type=str)
     args = parser.parse_args()
+    # a TAR stream on standard output cannot be shared
+    if args.archive_spec == '-' and '-' in (args.manifest_spec, args.plan_spec):
+        parser.error("-o -: standard output holds the archive; write the manifest (-j) or the plan (-n) to a file")
     #
     # define logging (level, file, message format, ...)
     #
@@ -430,17 +1336,109 @@ def main():
         match_re = re.compile(match_re_string)
     pdf_file_spec = args.input_files[0]
     lg.debug(pdf_file_spec)
-    lg.info(json1.json_first_log_msg(identifier, files = [pdf_file_spec] ))
-    rasterize_p = False
+    resolutions = None
+    if args.resolutions:
+        resolutions = [int(resolution) for resolution in args.resolutions.split(',')]
+    preflight_limits = {
+        'max_pages': args.max_pages,
+        'max_bytes': (int(args.max_megabytes * 2**20) if args.max_megabytes else None),
+        'max_megapixels': args.max_megapixels
+    }
+    # Preflight is the first stage to read the input, so a PDF which
+    # is rejected is not parsed any further; the first page of a PDF
+    # which passes sizes the concurrency of the run. Preflight maps the
+    # input (see mapped.py); local workers, forked below, inherit the
+    # mapping.
+    preflight_report = preflight_input(pdf_file_spec,preflight_limits,resolutions)
+    rejected_p = bool(preflight_report and preflight_report['reason'] and not args.apply_plan_spec)
+    config = tune_resources(preflight_report,resolutions)
+    local_worker_count = None
+    if args.local_workers == 'auto':
+        local_worker_count = config['workers']
+    elif args.local_workers:
+        local_worker_count = int(args.local_workers)
+    if rejected_p:
+        # no worker is started to scan a rejected input
+        local_worker_count = None
+    config['local_workers'] = local_worker_count
+    lg.info(json1.json_first_log_msg(identifier, files = [pdf_file_spec], config = config ))
+    tools.set_max_processes(config['tool_processes'])
+    rasterize_p = extraction_modes[args.extraction_mode]
+    if args.tool_timeout:
+        tools.set_default_timeout(args.tool_timeout)
+    barcode_filter = None
+    if args.filter_symbologies or args.filter_lengths or args.filter_check_digit or match_re:
+        min_length = None
+        max_length = None
+        if args.filter_lengths:
+            lengths = (args.filter_lengths.split(',') + [''])[:2]
+            try:
+                min_length = int(lengths[0]) if lengths[0].strip() else None
+                max_length = int(lengths[1]) if lengths[1].strip() else None
+            except ValueError:
+                parser.error("-L: expected <min>,<max>, where each is an integer or omitted (e.g., 6, or ,12): " + args.filter_lengths)
+            if (len(args.filter_lengths.split(',')) > 2 or
+                (min_length is not None and min_length < 0) or
+                (max_length is not None and max_length < 0) or
+                (min_length is not None and max_length is not None and min_length > max_length)):
+                parser.error("-L: expected <min>,<max>, non-negative integers with <min> not exceeding <max>: " + args.filter_lengths)
+        barcode_filter = decoders.make_barcode_filter(
+            (args.filter_symbologies.split(',') if args.filter_symbologies else None),
+            min_length,max_length,args.filter_check_digit,match_re)
+    symbologies = None
+    if args.symbologies:
+        symbologies = [decoders.symbology_name(symbology) for symbology in args.symbologies.split(',')]
+    workers = []
+    if args.workers:
+        workers = args.workers.split(',')
+    worker_processes = []
+    if local_worker_count:
+        local_workers, worker_processes = distributed.start_local_workers(local_worker_count,args.scratch_root)
+        workers = workers + local_workers
+    profile_spec = args.profile_spec
+    if profile_spec == '':
+        profile_spec = logfile + '.prof'
     # generic debugging
     lg.debug(os.getcwd())         # current/working directory
     # might also want to import platform to get architecture, other details...
     try:
-        pdfxcb(pdf_file_spec,args.output_dir,match_re,rasterize_p)
+        if args.apply_plan_spec:
+            apply_plan(pdf_file_spec,plan.load_plan(args.apply_plan_spec),args.output_dir,
+                       plan_spec=args.apply_plan_spec,identifier=identifier,
+                       manifest_spec=args.manifest_spec,name_template=args.name_template,
+                       archive_spec=args.archive_spec,profile_spec=profile_spec,
+                       overwrite_archive=args.force)
+        elif args.plan_spec:
+            scan_plan(pdf_file_spec,match_re,rasterize_p,plan_spec=args.plan_spec,
+                      scratch_root=args.scratch_root,keep_scratch=args.keep_scratch,
+                      decoder=args.decoder,index_file=args.index_file,
+                      resolutions=resolutions,symbologies=symbologies,
+                      position=args.position,barcode_filter=barcode_filter,
+                      workers=workers,unit_pages=args.unit_pages,
+                      progress_interval=args.progress_interval,progress_file=args.progress_file,
+                      profile_spec=profile_spec,preflight_limits=preflight_limits,reject_dir=args.reject_dir,
+                      prune_pages=args.prune_pages,blank_threshold=args.blank_threshold,
+                      preflight_report=preflight_report)
+        else:
+            pdfxcb(pdf_file_spec,args.output_dir,match_re,rasterize_p,
+                   identifier=identifier,manifest_spec=args.manifest_spec,
+                   name_template=args.name_template,
+                   scratch_root=args.scratch_root,keep_scratch=args.keep_scratch,
+                   decoder=args.decoder,index_file=args.index_file,
+                   resolutions=resolutions,symbologies=symbologies,
+                   position=args.position,barcode_filter=barcode_filter,
+                   workers=workers,unit_pages=args.unit_pages,
+                   progress_interval=args.progress_interval,progress_file=args.progress_file,
+                   archive_spec=args.archive_spec,profile_spec=profile_spec,
+                   overwrite_archive=args.force,preflight_limits=preflight_limits,reject_dir=args.reject_dir,
+                   prune_pages=args.prune_pages,blank_threshold=args.blank_threshold,
+                   preflight_report=preflight_report)
     except Exception as e:
         lg.error("Crash and burn")
         lg.error(sys.exc_info()[0])
         raise
+    finally:
+        distributed.stop_local_workers(worker_processes)
     lg.info(json1.json_last_log_msg())
 
 if __name__ == "__main__":
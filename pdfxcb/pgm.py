@@ -0,0 +1,85 @@
+"""Map PGM images into memory
+"""
+
+# Author: David A. Thompson
+
+import ctypes
+import mmap
+import re
+
+#
+# pdftoppm writes grayscale renderings as binary (P5) PGM files: a
+# short text header followed by the pixels, one byte per pixel, row by
+# row, without padding -- the layout expected by the decoders (see
+# decoders.py). A PGM file mapped into memory can therefore be handed
+# to a decoder, and excerpts of consecutive rows can be handed to a
+# decoder, without reading, decompressing, or copying the pixels.
+#
+# The pixel data is exposed as a ctypes array sharing the mapping; the
+# mapping is released once the last array (or PIL image) referring to
+# it is released.
+#
+
+# magic number, width, height, maximum value, and the single whitespace
+# character preceding the pixels (comments are not supported)
+pgm_header_re = re.compile(br'P5\s+(\d+)\s+(\d+)\s+(\d+)\s')
+
+class PGMImage(object):
+    """
+    An 8-bit binary PGM file mapped into memory. RAW holds the pixels
+    (see above); WIDTH and HEIGHT are the dimensions of the image.
+    """
+    def __init__(self,mapping,offset,width,height):
+        self._mapping = mapping
+        self._offset = offset
+        self.width = width
+        self.height = height
+        self.raw = self.rows(0,height)
+
+    @property
+    def size(self):
+        return (self.width,self.height)
+
+    def rows(self,top,bottom):
+        """
+        Return the pixels of rows TOP (inclusive) through BOTTOM
+        (exclusive) without copying them.
+        """
+        return (ctypes.c_ubyte * (self.width * (bottom - top))).from_buffer(self._mapping,self._offset + top * self.width)
+
+    def crop(self,box):
+        """
+        Return multiple values: the pixels within BOX (left, upper,
+        right, lower) and the width and height of BOX. The pixels are
+        copied only if BOX does not span the width of the image.
+        """
+        left, top, right, bottom = box
+        if left == 0 and right == self.width:
+            return self.rows(top,bottom), right - left, bottom - top
+        start = self._offset + top * self.width
+        return (b''.join([self._mapping[row_start + left:row_start + right]
+                          for row_start in range(start, start + (bottom - top) * self.width, self.width)]),
+                right - left, bottom - top)
+
+    def image(self):
+        """Return a (read-only) PIL image sharing the pixels."""
+        from PIL import Image
+        return Image.frombuffer('L',self.size,self.raw,'raw','L',0,1)
+
+def open_pgm(path):
+    """
+    Map the file specified by PATH into memory. Return a PGMImage or,
+    if the file is not an 8-bit binary PGM file, None.
+    """
+    with open(path,'rb') as f:
+        header = f.read(64)
+        match = pgm_header_re.match(header)
+        if not match or int(match.group(3)) > 255:
+            return None
+        width, height = int(match.group(1)), int(match.group(2))
+        # the mapping is private: the pixels are never written, so
+        # nothing is copied, but ctypes requires a writable buffer
+        mapping = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_COPY)
+    if len(mapping) < match.end() + width * height:
+        return None
+    return PGMImage(mapping,match.end(),width,height)
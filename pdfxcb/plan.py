@@ -0,0 +1,83 @@
+"""Describe where a PDF is to be split as a JSON plan
+"""
+
+# Author: David A. Thompson
+
+import json
+import os
+import sys
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+import manifest
+
+#
+# A plan records the outcome of scanning a PDF -- the cover sheet
+# barcodes and the page range each identifies -- so that the PDF can
+# be split later (see pdfxcb.apply_plan) without being scanned again.
+# The plan identifies the version of the input it describes by size,
+# modification time, and digest; a copy of the input (e.g., uploaded
+# to a server) is recognized by its digest.
+#
+
+# increment when the structure of a plan changes
+plan_format = 1
+
+def make_plan(pdf_file_spec,number_of_pages,barcodes,indices,page_ranges,symbols,orientations,timings,dropped_pages=None):
+    """
+    Return a plan (a dictionary) for the PDF file specified by
+    PDF_FILE_SPEC. BARCODES, PAGE_RANGES, SYMBOLS, and ORIENTATIONS
+    are parallel lists describing the cover sheets; INDICES is as
+    logged (code 40). TIMINGS describes the time spent scanning.
+    DROPPED_PAGES, if specified, identifies the pages to leave out of
+    the output (see pruning.dropped_pages); plans written before
+    pruning was introduced lack it.
+    """
+    stat = os.stat(pdf_file_spec)
+    return {
+        'format': plan_format,
+        'file': pdf_file_spec,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': manifest.file_digest(pdf_file_spec),
+        'number_of_pages': number_of_pages,
+        'barcodes': barcodes,
+        'indices': indices,
+        'page_ranges': [[page_range[0],page_range[1]] for page_range in page_ranges],
+        'symbols': symbols,
+        'orientations': orientations,
+        'timings': timings,
+        'dropped_pages': dropped_pages
+    }
+
+def plan_current_p(plan,pdf_file_spec):
+    """Return True if PLAN describes the current version of the PDF file specified by PDF_FILE_SPEC."""
+    stat = os.stat(pdf_file_spec)
+    return (plan.get('format') == plan_format and
+            plan.get('size') == stat.st_size and
+            (plan.get('mtime') == stat.st_mtime or
+             plan.get('sha256') == manifest.file_digest(pdf_file_spec)))
+
+def write_plan(plan,plan_spec):
+    """
+    Write PLAN, as JSON, to the file specified by PLAN_SPEC. If
+    PLAN_SPEC is '-', write to standard output.
+    """
+    if plan_spec == '-':
+        json.dump(plan,sys.stdout,sort_keys=True)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+    else:
+        with open(plan_spec,'w') as f:
+            json.dump(plan,f,sort_keys=True)
+            f.write('\n')
+    lg.info(json1.json_plan_written(plan_spec))
+
+def load_plan(plan_spec):
+    """Return the plan written to the file specified by PLAN_SPEC."""
+    with open(plan_spec) as f:
+        return json.load(f)
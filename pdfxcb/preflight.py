@@ -0,0 +1,169 @@
+"""Reject unusable or oversized PDFs before any expensive stage
+"""
+
+# Author: David A. Thompson
+
+import os
+import shutil
+
+# configure logging
+import logging
+lg=logging
+
+import PyPDF2
+
+# internal modules
+import json1
+import mapped
+import pdf
+import pdfindex
+import resources
+
+#
+# Preflight reads only the header, the trailer and cross-reference
+# data, and the page tree of the input -- not page content or images
+# -- so that a PDF which cannot be split is rejected in well under a
+# second rather than after images are extracted or pages rendered.
+# A PDF is rejected, for a REASON, if
+#
+#   corrupt    it lacks a PDF header or end-of-file marker, or its
+#              trailer, cross-reference data, or page tree cannot be
+#              parsed
+#   encrypted  it is encrypted
+#   empty      it has no pages
+#   too_large  it exceeds a limit: 'max_bytes', 'max_pages', or
+#              'max_megapixels' (the estimated work: pages times the
+#              pixels of the first page rendered whole at the high
+#              resolution)
+#
+# A rejected input may be moved to a directory (see reject) so that a
+# batch can route it elsewhere (e.g., to a person).
+#
+
+# the PDF header must appear within the first 1024 bytes
+header_bytes = 1024
+
+# the end-of-file marker must appear within the last 1024 bytes
+trailer_bytes = 1024
+
+class PreflightFailed(SystemExit):
+    """
+    The input failed preflight. REPORT describes the input and the
+    reason (see preflight). As a SystemExit, a failure ends a
+    command-line run as any other fatal error does.
+    """
+    def __init__(self,msg,report):
+        SystemExit.__init__(self,msg)
+        self.report = report
+
+def first_page_dimensions(reader):
+    """
+    Return the width and height, in points, of the first page, as
+    rendered, of the document read by READER, a PyPDF2.PdfFileReader.
+    """
+    page = reader.getPage(0)
+    return pdf.page_dimensions({
+        'cropbox': pdfindex.page_box(page,'/CropBox'),
+        'rotate': int(pdfindex.get_value(page,'/Rotate',0)) % 360
+    })
+
+def structure_problem(pdf_file_spec,size):
+    """
+    Return a string describing why the file specified by PDF_FILE_SPEC,
+    of SIZE bytes, is not a complete PDF or None if no problem is
+    apparent from its first and last bytes.
+    """
+    with open(pdf_file_spec,'rb') as f:
+        head = f.read(header_bytes)
+        f.seek(max(size - trailer_bytes,0))
+        tail = f.read()
+    if b'%PDF-' not in head:
+        return 'no PDF header'
+    if b'%%EOF' not in tail:
+        return 'no end-of-file marker (truncated?)'
+    if b'startxref' not in tail:
+        return 'no startxref'
+    return None
+
+def preflight(pdf_file_spec,limits=None,resolution=None):
+    """
+    Examine the file specified by PDF_FILE_SPEC. Return a dictionary
+    describing the file: 'bytes', 'pages', 'page_dimensions' (the
+    width and height, in points, of the first page), 'megapixels' (the
+    estimated work; see above), 'reason' (None if the file passes; see
+    above), and 'detail' (a string explaining the reason). LIMITS, if
+    specified, is a dictionary with any of 'max_bytes', 'max_pages',
+    and 'max_megapixels'. RESOLUTION is the high resolution (DPI) at
+    which pages may be rendered.
+    """
+    limits = limits or {}
+    report = {
+        'bytes': os.stat(pdf_file_spec).st_size,
+        'pages': None,
+        'page_dimensions': None,
+        'megapixels': None,
+        'reason': None,
+        'detail': None
+    }
+    def failed (reason,detail):
+        report['reason'] = reason
+        report['detail'] = detail
+        return report
+    if limits.get('max_bytes') and report['bytes'] > limits['max_bytes']:
+        return failed('too_large','{} bytes exceeds the limit of {}'.format(report['bytes'],limits['max_bytes']))
+    problem = structure_problem(pdf_file_spec,report['bytes'])
+    if problem:
+        return failed('corrupt',problem)
+    with mapped.open_input(pdf_file_spec) as stream:
+        try:
+            # reads the trailer and cross-reference data only
+            reader = PyPDF2.PdfFileReader(stream,strict=False)
+            if reader.isEncrypted:
+                return failed('encrypted','the PDF is encrypted')
+            report['pages'] = reader.getNumPages()
+            if not report['pages']:
+                return failed('empty','the PDF has no pages')
+            width, height = first_page_dimensions(reader)
+        except Exception as e:
+            return failed('corrupt',str(e) or e.__class__.__name__)
+    report['page_dimensions'] = [width, height]
+    scale = (resolution or resources.default_resolution) / 72.0
+    report['megapixels'] = round(report['pages'] * (width * scale) * (height * scale) / 1e6,1)
+    if limits.get('max_pages') and report['pages'] > limits['max_pages']:
+        return failed('too_large','{} pages exceeds the limit of {}'.format(report['pages'],limits['max_pages']))
+    if limits.get('max_megapixels') and report['megapixels'] > limits['max_megapixels']:
+        return failed('too_large','an estimated {} megapixels exceeds the limit of {}'.format(
+            report['megapixels'],limits['max_megapixels']))
+    return report
+
+def reject(pdf_file_spec,report,reject_dir=None):
+    """
+    Log the failure of the file specified by PDF_FILE_SPEC, described
+    by REPORT (see preflight), and raise PreflightFailed. If REJECT_DIR
+    is specified, move the file there first.
+    """
+    if reject_dir:
+        report['moved_to'] = os.path.join(reject_dir,os.path.basename(pdf_file_spec))
+        shutil.move(pdf_file_spec,report['moved_to'])
+    msg = json1.json_preflight_failed(pdf_file_spec,report)
+    lg.error(msg)
+    lg.info(json1.json_last_log_msg())
+    raise PreflightFailed(msg,report)
+
+def preflight_sanity_check(pdf_file_spec,limits=None,resolution=None,reject_dir=None,result=None,report=None):
+    """
+    Examine the file specified by PDF_FILE_SPEC (see preflight) and
+    log the outcome. If the file fails, reject it (see reject). If
+    RESULT, a dictionary, is specified, record the outcome in its
+    'preflight' slot. Return the report. If REPORT, the outcome of an
+    earlier examination of the file, is specified, the file is not
+    examined again.
+    """
+    if report is None:
+        report = preflight(pdf_file_spec,limits,resolution)
+    if result is not None:
+        result['preflight'] = report
+    if report['reason']:
+        reject(pdf_file_spec,report,reject_dir)
+    lg.info(json1.json_preflight(pdf_file_spec,report))
+    return report
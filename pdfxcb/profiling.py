@@ -0,0 +1,69 @@
+"""Profile a run
+"""
+
+# Author: David A. Thompson
+
+import cProfile
+import os
+import pstats
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+
+#
+# A run may be profiled with cProfile: the profile is written to a
+# file (readable with pstats or any cProfile viewer) and the functions
+# with the most internal time are summarized in the log (code 44).
+# Only the thread performing the run is profiled; time spent in
+# external tools appears as time spent waiting for them (see
+# tools.wait). When profiling is not requested, nothing is done.
+#
+
+# number of functions summarized in the log
+default_top_n = 20
+
+def start(profile_spec):
+    """
+    If PROFILE_SPEC (the path to the profile to be written) is
+    specified, begin profiling the current thread and return the
+    profiler. Otherwise, return None.
+    """
+    if not profile_spec:
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop(profiler,profile_spec,top_n=None):
+    """
+    Stop PROFILER (if not None), write the profile to PROFILE_SPEC,
+    and log a summary of the TOP_N (by default, DEFAULT_TOP_N)
+    functions with the most internal time.
+    """
+    if not profiler:
+        return
+    profiler.disable()
+    profiler.dump_stats(profile_spec)
+    lg.info(json1.json_profile_written(profile_spec,profile_summary(profiler,top_n or default_top_n)))
+
+def profile_summary(profiler,top_n):
+    """
+    Return a list of dictionaries, one for each of the TOP_N functions
+    with the most internal time, ordered by internal time: 'function'
+    (<file>:<line>(<name>), or the name of a built-in function), 'calls', 'tottime' (seconds, excluding
+    callees), and 'cumtime' (seconds, including callees).
+    """
+    stats = pstats.Stats(profiler).stats
+    entries = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:top_n]
+    return [{
+        # built-in functions have no file ('~')
+        'function': (function_name if file_name == '~' else
+                     '{}:{}({})'.format(os.path.basename(file_name),line_number,function_name)),
+        'calls': calls,
+        'tottime': round(tottime,4),
+        'cumtime': round(cumtime,4)
+    } for (file_name, line_number, function_name), (primitive_calls, calls, tottime, cumtime, callers) in entries]
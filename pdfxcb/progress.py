@@ -0,0 +1,150 @@
+"""Report the progress of a run
+"""
+
+# Author: David A. Thompson
+
+import json
+import os
+import threading
+import time
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+
+#
+# A run proceeds through stages (e.g., extracting images, scanning
+# images, splitting the PDF); each stage has a known amount of work
+# (pages, images, or output files). A Progress object counts the work
+# done in the current stage and reports, at most once per interval, a
+# progress event: the stage, the work done and the total, the rate
+# (per second), and the estimated number of seconds remaining in the
+# stage. Events are logged (code 50) and, optionally, written to a
+# progress file (replacing the previous event) and passed to a
+# callback. An event is also reported at the start of each stage and
+# at the end of the run.
+#
+# The Progress object of a run is associated with the thread
+# performing the run (see start); code deep within a run reports work
+# done via the module-level functions STAGE and ADVANCE, which do
+# nothing when no run is being tracked.
+#
+
+# seconds between progress events
+default_interval = 5.0
+
+# per-thread state (Progress object for the current run)
+thread_state = threading.local()
+
+class Progress(object):
+    """
+    INTERVAL is the minimum number of seconds between events (0
+    reports every update). PROGRESS_FILE, if specified, is the path to
+    a file holding the latest event (as JSON). PROGRESS_FN, if
+    specified, is called with each event (a dictionary).
+    """
+    def __init__(self,interval=None,progress_file=None,progress_fn=None):
+        self.interval = default_interval if interval is None else interval
+        self.progress_file = progress_file
+        self.progress_fn = progress_fn
+        self.start_time = time.time()
+        self.stage_name = None
+        self.stage_start_time = None
+        self.done = 0
+        self.total = 0
+        self.last_report_time = None
+        # stages may be advanced from several threads (see distributed.py)
+        self.lock = threading.Lock()
+
+    def stage(self,name,total):
+        """Begin the stage NAME with TOTAL units of work."""
+        with self.lock:
+            self.stage_name = name
+            self.stage_start_time = time.time()
+            self.done = 0
+            self.total = total
+            self.report(True)
+
+    def advance(self,n=1):
+        """Record N units of work done in the current stage."""
+        with self.lock:
+            self.done = self.done + n
+            self.report(False)
+
+    def finish(self):
+        """Report the end of the run."""
+        with self.lock:
+            self.stage_name = 'done'
+            self.stage_start_time = time.time()
+            self.done = self.total = 0
+            self.report(True)
+
+    def event(self):
+        """Return a dictionary describing the progress of the current stage."""
+        now = time.time()
+        stage_seconds = now - self.stage_start_time
+        rate = None
+        eta = None
+        if self.done and stage_seconds > 0:
+            rate = self.done / stage_seconds
+            eta = max(self.total - self.done,0) / rate
+        return {
+            'stage': self.stage_name,
+            'done': self.done,
+            'total': self.total,
+            'rate': (round(rate,2) if rate is not None else None),
+            'eta': (round(eta,1) if eta is not None else None),
+            'elapsed': round(now - self.start_time,1)
+        }
+
+    def report(self,force):
+        now = time.time()
+        if not force and self.last_report_time is not None and now - self.last_report_time < self.interval:
+            return
+        self.last_report_time = now
+        event = self.event()
+        lg.info(json1.json_progress_event(event))
+        if self.progress_file:
+            write_progress_file(event,self.progress_file)
+        if self.progress_fn:
+            self.progress_fn(event)
+
+def write_progress_file(event,progress_file):
+    """Replace the content of PROGRESS_FILE with EVENT (as JSON)."""
+    # readers never see a partially written file
+    temporary_file = progress_file + '.tmp'
+    with open(temporary_file,'w') as f:
+        json.dump(event,f)
+    os.rename(temporary_file,progress_file)
+
+def start(interval=None,progress_file=None,progress_fn=None):
+    """
+    Track the progress of a run performed by the current thread.
+    Return the Progress object.
+    """
+    thread_state.progress = Progress(interval,progress_file,progress_fn)
+    return thread_state.progress
+
+def stop():
+    """Report the end of the run performed by the current thread and stop tracking it."""
+    current_progress = current()
+    if current_progress:
+        current_progress.finish()
+    thread_state.progress = None
+
+def current():
+    """Return the Progress object of the current thread (or None)."""
+    return getattr(thread_state, 'progress', None)
+
+def stage(name,total):
+    current_progress = current()
+    if current_progress:
+        current_progress.stage(name,total)
+
+def advance(n=1):
+    current_progress = current()
+    if current_progress:
+        current_progress.advance(n)
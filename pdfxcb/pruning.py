@@ -0,0 +1,149 @@
+"""Detect blank and duplicate pages
+"""
+
+# Author: David A. Thompson
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import barScan
+
+#
+# Duplex scans hold many blank backsides and, now and then, a sheet
+# fed twice. Such pages may be dropped from the output PDFs. Pages
+# are judged by the images already opened for barcode scanning (see
+# barScan.barcodeScanResult), so no page is decoded again: while an
+# image spanning a page is scanned, its signature is recorded -- the
+# ink coverage (the fraction of dark pixels, ignoring the margins,
+# where scanners leave shadows) and a difference hash (one bit per
+# cell of a grid laid over the page, set if the cell is distinctly
+# brighter than its right-hand neighbor).
+#
+# A page is blank if each of its images has less ink than the blank
+# threshold or if the page draws nothing (see pdfindex.content_kind).
+# A page is a duplicate of the preceding page if both have the same
+# number of images and each pair of images has nearly equal hashes
+# and ink coverage. Signatures describe only images, so only pages
+# drawing nothing but images are judged by them: a page which also
+# draws text or vector content is never dropped (nor is a page
+# compared to it). Cover sheets are never dropped. Pages rendered
+# from a region of the page (see pdfxcb.rasterize_and_scan) have no
+# signature and are never dropped.
+#
+
+# pixels darker than this gray level are ink
+ink_level = 128
+
+# fraction of the width and height ignored at each edge
+margin = 0.03
+
+# fraction of ink below which an image is blank
+default_blank_threshold = 0.0005
+
+# the hash grid has HASH_SIZE x HASH_SIZE cells
+hash_size = 32
+
+# gray levels by which a cell must be brighter than its neighbor to set its bit
+hash_tolerance = 2
+
+# fraction of hash bits which may differ between duplicates
+duplicate_bits = 0.01
+
+# fraction by which the ink coverage of duplicates may differ
+duplicate_ink = 0.1
+
+def page_signature(pil):
+    """
+    Return a dictionary describing the grayscale PIL image PIL: 'ink'
+    (the ink coverage) and 'hash' (the difference hash as a
+    hexadecimal string).
+    """
+    width, height = pil.size
+    margin_x = int(width * margin)
+    margin_y = int(height * margin)
+    inner = pil.crop((margin_x,margin_y,width-margin_x,height-margin_y))
+    histogram = inner.histogram()
+    pixels = sum(histogram)
+    ink = (float(sum(histogram[:ink_level])) / pixels if pixels else 0.0)
+    cells = list(inner.resize((hash_size+1,hash_size),barScan.box_resample).getdata())
+    bits = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            cell = row * (hash_size+1) + column
+            bits = (bits << 1) | (1 if cells[cell] > cells[cell+1] + hash_tolerance else 0)
+    return {
+        'ink': round(ink,6),
+        'hash': '{:0{}x}'.format(bits,hash_size*hash_size//4)
+    }
+
+def hash_distance(hash_a,hash_b):
+    """Return the number of bits differing between the hashes HASH_A and HASH_B."""
+    return bin(int(hash_a,16) ^ int(hash_b,16)).count('1')
+
+def blank_p(signatures,blank_threshold):
+    """Return True if each of SIGNATURES (of the images of a page) has less ink than BLANK_THRESHOLD."""
+    return all([signature['ink'] < blank_threshold for signature in signatures])
+
+def duplicate_p(signatures,previous_signatures):
+    """
+    Return True if SIGNATURES, of the images of a page, nearly equal
+    PREVIOUS_SIGNATURES, of the images of another page.
+    """
+    if len(signatures) != len(previous_signatures):
+        return False
+    for signature, previous_signature in zip(signatures,previous_signatures):
+        if hash_distance(signature['hash'],previous_signature['hash']) > duplicate_bits * hash_size * hash_size:
+            return False
+        if abs(signature['ink'] - previous_signature['ink']) > duplicate_ink * max(signature['ink'],previous_signature['ink']):
+            return False
+    return True
+
+def dropped_pages(index,png_file_page_number_tuples,signatures,cover_sheet_indices,blank_threshold=None):
+    """
+    Return a dictionary: 'blank' and 'duplicate' are the page numbers,
+    in ascending order, of the blank and duplicate pages of the PDF
+    described by INDEX. SIGNATURES is a list, parallel to
+    PNG_FILE_PAGE_NUMBER_TUPLES, of the signatures of the images (or
+    None if an image has no signature). COVER_SHEET_INDICES identify
+    the members of PNG_FILE_PAGE_NUMBER_TUPLES which are cover
+    sheets. BLANK_THRESHOLD defaults to DEFAULT_BLANK_THRESHOLD.
+    """
+    if blank_threshold is None:
+        blank_threshold = default_blank_threshold
+    cover_page_numbers = set([png_file_page_number_tuples[i][1] for i in cover_sheet_indices])
+    # page number -> signatures of its images (None if any image lacks one)
+    page_signatures = {}
+    for (png_file, page_number), signature in zip(png_file_page_number_tuples,signatures):
+        if signature is None or page_signatures.get(page_number,[]) is None:
+            page_signatures[page_number] = None
+        else:
+            page_signatures.setdefault(page_number,[]).append(signature)
+    blank = []
+    duplicate = []
+    previous_signatures = None
+    for page in index.pages:
+        page_number = page['page']
+        if page_number in cover_page_numbers:
+            previous_signatures = (page_signatures.get(page_number) if page['content'] == 'image' else None)
+            continue
+        if page['content'] == 'empty':
+            blank.append(page_number)
+            previous_signatures = None
+            continue
+        if page['content'] != 'image':
+            # the signatures do not describe what else the page draws
+            previous_signatures = None
+            continue
+        signatures_of_page = page_signatures.get(page_number)
+        if signatures_of_page is None:
+            # no image spanning the page was scanned
+            previous_signatures = None
+        elif blank_p(signatures_of_page,blank_threshold):
+            blank.append(page_number)
+        elif previous_signatures and duplicate_p(signatures_of_page,previous_signatures):
+            duplicate.append(page_number)
+        previous_signatures = signatures_of_page
+    lg.debug("blank pages: %s; duplicate pages: %s",blank,duplicate)
+    return {'blank': blank, 'duplicate': duplicate}
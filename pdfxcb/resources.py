@@ -0,0 +1,174 @@
+"""Size concurrency to the CPUs and memory available
+"""
+
+# Author: David A. Thompson
+
+import math
+import multiprocessing
+import os
+
+# configure logging
+import logging
+lg=logging
+
+#
+# Containers commonly grant a process far fewer CPUs, and far less
+# memory, than the host has: a cgroup CPU quota does not change the
+# number of CPUs reported by multiprocessing.cpu_count, and exceeding
+# a cgroup memory limit gets the process killed. The CPUs and memory
+# available are taken to be the least of what the host, the CPU
+# affinity of the process, and the cgroup (v2, or v1, as mounted in
+# the container at /sys/fs/cgroup) allow.
+#
+# The memory needed to handle one page is estimated from the
+# dimensions of the page and the resolution at which it is rendered
+# (8-bit grayscale) and multiplied to allow for the copies made while
+# scanning (cropping, deskewing). The number of concurrent external
+# tools, local worker processes, and server threads are then the
+# number of CPUs available, reduced so that each, handling a page,
+# fits in the memory available.
+#
+
+cgroup_root = '/sys/fs/cgroup'
+
+# cgroup v1 reports "no limit" as a very large number
+unlimited_memory = 2**60
+
+# copies of a page image held at once while a page is scanned
+page_copies = 4
+
+# bytes used by an external tool or a worker process irrespective of
+# the page handled
+tool_overhead_bytes = 32 * 2**20
+worker_overhead_bytes = 96 * 2**20
+
+# US Letter, in points; assumed if the page dimensions are not known
+default_page_dimensions = (612, 792)
+
+# DPI; assumed if the resolution is not known (see pdfxcb.default_resolutions)
+default_resolution = 300
+
+def read_cgroup_file(relative_path):
+    """
+    Return the content, stripped of whitespace, of the file at
+    RELATIVE_PATH under CGROUP_ROOT or None if the file cannot be
+    read.
+    """
+    try:
+        with open(os.path.join(cgroup_root,relative_path)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+def cgroup_cpu_limit():
+    """
+    Return the number of CPUs (possibly fractional) the cgroup quota
+    allows or None if there is no quota.
+    """
+    # v2: "<quota> <period>" or "max <period>"
+    cpu_max = read_cgroup_file('cpu.max')
+    if cpu_max:
+        fields = cpu_max.split()
+        if fields[0] != 'max' and len(fields) == 2 and int(fields[1]) > 0:
+            return float(fields[0]) / int(fields[1])
+        return None
+    # v1: a quota of -1 indicates no quota
+    for controller in ('cpu', 'cpu,cpuacct'):
+        quota = read_cgroup_file(os.path.join(controller,'cpu.cfs_quota_us'))
+        period = read_cgroup_file(os.path.join(controller,'cpu.cfs_period_us'))
+        if quota and period:
+            if int(quota) > 0 and int(period) > 0:
+                return float(quota) / int(period)
+            return None
+    return None
+
+def cgroup_memory_limit():
+    """
+    Return the number of bytes the cgroup may still use (the limit
+    less current usage) or None if there is no limit.
+    """
+    # v2
+    limit = read_cgroup_file('memory.max')
+    usage = read_cgroup_file('memory.current')
+    if not limit:
+        # v1
+        limit = read_cgroup_file(os.path.join('memory','memory.limit_in_bytes'))
+        usage = read_cgroup_file(os.path.join('memory','memory.usage_in_bytes'))
+    if not limit or limit == 'max' or int(limit) >= unlimited_memory:
+        return None
+    return max(int(limit) - int(usage or 0),0)
+
+def host_available_memory():
+    """Return the number of bytes of memory available on the host or None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def available_cpus():
+    """Return the number (an integer, at least one) of CPUs available to the process."""
+    cpus = multiprocessing.cpu_count()
+    if hasattr(os,'sched_getaffinity'):
+        cpus = min(cpus,len(os.sched_getaffinity(0)))
+    cpu_limit = cgroup_cpu_limit()
+    if cpu_limit:
+        cpus = min(cpus,int(math.ceil(cpu_limit)))
+    return max(cpus,1)
+
+def available_memory():
+    """Return the number of bytes of memory available to the process or None if unknown."""
+    amounts = [amount for amount in (cgroup_memory_limit(),host_available_memory()) if amount is not None]
+    if amounts:
+        return min(amounts)
+    return None
+
+def page_bytes(page_dimensions=None,resolution=None):
+    """
+    Return the estimated number of bytes needed to scan a page with
+    dimensions PAGE_DIMENSIONS ((<width>,<height>), in points) rendered
+    at RESOLUTION (DPI).
+    """
+    width, height = page_dimensions or default_page_dimensions
+    scale = (resolution or default_resolution) / 72.0
+    return int(width * scale) * int(height * scale) * page_copies
+
+def pool_size(cpus,memory,bytes_each):
+    """
+    Return the number of concurrent tasks, each needing BYTES_EACH
+    bytes, which CPUS CPUs and MEMORY bytes (None if unknown)
+    accommodate (at least one).
+    """
+    if memory is None:
+        return cpus
+    return max(min(cpus,memory // bytes_each),1)
+
+def tune(page_dimensions=None,resolution=None):
+    """
+    Return a dictionary describing the concurrency suited to the CPUs
+    and memory available when scanning pages with dimensions
+    PAGE_DIMENSIONS ((<width>,<height>), in points; by default, those
+    of a letter page), as the first page of the input, taken to be
+    typical, rendered at RESOLUTION (DPI): 'cpus', 'memory' (bytes; None if
+    unknown), 'page_bytes' (see page_bytes), 'tool_processes' (see
+    tools.set_max_processes), and 'workers' (local worker processes
+    or server threads).
+    """
+    cpus = available_cpus()
+    memory = available_memory()
+    bytes_per_page = page_bytes(page_dimensions,resolution)
+    config = {
+        'cpus': cpus,
+        'memory': memory,
+        'page_bytes': bytes_per_page,
+        'tool_processes': pool_size(cpus,memory,tool_overhead_bytes + bytes_per_page),
+        'workers': pool_size(cpus,memory,worker_overhead_bytes + bytes_per_page)
+    }
+    lg.debug("resources: %s",config)
+    return config
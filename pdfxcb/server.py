@@ -0,0 +1,415 @@
+"""Serve pdfxcb requests from a long-lived process
+"""
+
+# Author: David A. Thompson
+
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+# configure logging
+import logging
+lg=logging
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+    import Queue as queue
+except ImportError:
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+    import queue
+
+# internal modules
+import decoders
+import distributed
+import json1
+import mapped
+import pdfxcb
+import preflight
+import resources
+import tools
+
+#
+# A server answers requests over HTTP without paying, per request,
+# for interpreter startup, module imports, checks for external tools,
+# and decoder initialization. Requests are POSTed to an endpoint; the
+# query parameter 'options' holds a JSON object (see request_options)
+# and the body of the request holds the PDF (alternatively, the
+# 'file' option names a PDF readable by the server).
+#
+#   /split  locate cover sheets and split the PDF into OPTIONS['output_dir']
+#   /scan   locate cover sheets without splitting the PDF
+#
+# Each response is a JSON object (see split_request and
+# scan_request); on failure, the object has an 'error' slot.
+#
+# Requests are queued; a fixed number of threads, each with its own
+# warm decoder, handle the requests in the queue. When the queue is
+# full, a request is refused at once (status 503) rather than left
+# waiting. A request not answered within the request timeout is
+# cancelled (status 504).
+#
+# As with a worker (see distributed.local_client_p), only a client on
+# the host of the server may name files ('file' and 'output_dir');
+# other clients send the PDF in the body and use /scan.
+#
+
+default_queue_size = 16
+
+# seconds; a request not answered in time is cancelled
+default_request_timeout = 3600
+
+class BadRequest(Exception):
+    """The options of a request are unacceptable."""
+    pass
+
+class PdfxcbHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # a queue.Queue of jobs (see submit)
+    jobs = None
+    # SCRATCH_ROOT is the directory within which scratch directories are created
+    scratch_root = None
+    # PREFLIGHT_LIMITS applies to every request (see preflight.preflight)
+    preflight_limits = None
+    # seconds (see default_request_timeout)
+    request_timeout = default_request_timeout
+
+class PdfxcbRequestHandler(distributed.WorkerRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        request_fns = {'/split': split_request, '/scan': scan_request}
+        if url.path not in request_fns:
+            return self.send_json(404,{'error': 'unknown endpoint: ' + url.path})
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        try:
+            options = request_options(json.loads(parse_qs(url.query).get('options',['{}'])[0]))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400,{'error': 'malformed options: ' + str(e)})
+        options['preflight_limits'] = self.server.preflight_limits
+        if ((options['file'] or options['output_dir']) and
+            not distributed.local_client_p(self.client_address[0])):
+            return self.send_json(403,{'error': 'files may be named only by a client on the host of the server'})
+        try:
+            check_request_options(url.path,options,body)
+        except BadRequest as e:
+            return self.send_json(400,{'error': str(e)})
+        job = submit(self.server.jobs,request_fns[url.path],options,body,self.server.scratch_root)
+        if not job:
+            return self.send_json(503,{'error': 'too many requests'})
+        if not job['done'].wait(self.server.request_timeout):
+            # the job stops at its next external tool or stage (see handle_jobs)
+            job['cancel'].set()
+            return self.send_json(504,{'error': 'request timed out after {} seconds'.format(self.server.request_timeout),
+                                       'id': options['id']})
+        if job['error']:
+            response = {'error': job['error'], 'id': options['id']}
+            if job['preflight']:
+                response['preflight'] = job['preflight']
+            return self.send_json(job['status'],response)
+        self.send_json(200,job['result'])
+
+def request_options(obj):
+    """
+    Return a dictionary of request options, given OBJ, the decoded
+    'options' parameter of a request. Options not specified take
+    default values.
+
+      id             identifier of the request (default: a new UUID)
+      file           PDF readable by the server (instead of the body)
+      name           file name of the PDF in the body (for {stem})
+      output_dir     absolute path to the output directory (/split)
+      match          regex (see -m)
+      mode           auto, images, or rasterize (see -r)
+      name_template  output file name template (see -t)
+      decoder        barcode decoder (see -z)
+      symbologies, position  barcode selection (see -y, -P)
+      filter         barcode filter: symbologies, min_length, max_length,
+                     check_digit (see -S, -L, -C)
+      plan           plan returned by /scan; /split splits the PDF as
+                     planned without scanning it (see -a)
+      prune          drop blank and duplicate pages (see -e)
+      blank_threshold  ink coverage below which a page is blank (see -b)
+    """
+    options = {
+        'id': obj.get('id') or str(uuid.uuid1()),
+        'file': obj.get('file'),
+        'name': os.path.basename(obj.get('name') or 'input.pdf'),
+        'output_dir': obj.get('output_dir'),
+        'match_re': (re.compile(obj['match']) if obj.get('match') else None),
+        'rasterize_p': pdfxcb.extraction_modes[obj.get('mode') or 'auto'],
+        'name_template': obj.get('name_template'),
+        'decoder': obj.get('decoder'),
+        'symbologies': obj.get('symbologies'),
+        'position': obj.get('position'),
+        'barcode_filter': None,
+        'plan': obj.get('plan'),
+        'prune_pages': bool(obj.get('prune')),
+        'blank_threshold': obj.get('blank_threshold')
+    }
+    filter_obj = obj.get('filter')
+    if filter_obj or options['match_re']:
+        filter_obj = filter_obj or {}
+        options['barcode_filter'] = decoders.make_barcode_filter(
+            filter_obj.get('symbologies'),filter_obj.get('min_length'),filter_obj.get('max_length'),
+            filter_obj.get('check_digit'),options['match_re'])
+    return options
+
+def check_request_options(path,options,body):
+    """
+    Raise BadRequest unless OPTIONS (see request_options), and BODY,
+    describe a request which the endpoint PATH can handle.
+    """
+    if not (body or options['file']):
+        raise BadRequest("no PDF")
+    if options['file'] and not os.path.isfile(options['file']):
+        raise BadRequest("file not found: " + options['file'])
+    if path == '/split' and not (options['output_dir'] and os.path.isabs(options['output_dir'])):
+        raise BadRequest("output_dir must be an absolute path")
+    if options['decoder'] and not (options['decoder'] in decoders.decoders and
+                                   decoders.decoder_available_p(options['decoder'])):
+        raise BadRequest("decoder unavailable: " + options['decoder'])
+
+def submit(jobs,request_fn,options,body,scratch_root):
+    """
+    Queue a job calling REQUEST_FN with OPTIONS, BODY, and a scratch
+    directory. Return the job, a dictionary whose 'done' slot holds a
+    threading.Event set once 'result' (or 'error' and 'status') is
+    available, or None if the queue JOBS is full. Setting the
+    threading.Event in the 'cancel' slot abandons the job.
+    """
+    job = {
+        'fn': request_fn,
+        'options': options,
+        'body': body,
+        'scratch_root': scratch_root,
+        'done': threading.Event(),
+        'cancel': threading.Event(),
+        'result': None,
+        'error': None,
+        'status': None,
+        'preflight': None
+    }
+    try:
+        jobs.put_nowait(job)
+    except queue.Full:
+        return None
+    return job
+
+def handle_jobs(jobs,decoder):
+    """Handle the jobs in the queue JOBS, one at a time, indefinitely."""
+    # each thread has its own decoder (see decoders.decode_zbar)
+    decoders.warm(decoder)
+    while True:
+        job = jobs.get()
+        # external tools run for the job are killed once the job is cancelled
+        tools.set_cancel_event(job['cancel'])
+        try:
+            tools.check_cancelled('request')
+            job['result'] = run_job(job)
+        except BaseException as e:
+            job['status'] = failure_status(e)
+            job['error'] = str(e)
+            if isinstance(e,preflight.PreflightFailed):
+                job['preflight'] = e.report
+            lg.error(json1.json_msg(113,['Request failed', str(e)],False,data={'id': job['options']['id']}))
+        finally:
+            tools.set_cancel_event(None)
+            job['done'].set()
+
+def failure_status(e):
+    """Return the HTTP status describing the failure of a job which raised E."""
+    if isinstance(e,preflight.PreflightFailed):
+        # the PDF itself is unacceptable
+        return (413 if e.report['reason'] == 'too_large' else 422)
+    if isinstance(e,BadRequest):
+        return 400
+    # anything else (e.g., a failed external tool or an unwritable
+    # output directory) is a failure of the server
+    return 500
+
+def run_job(job):
+    options = job['options']
+    scratch_dir = pdfxcb.make_scratch_dir(job['scratch_root'])
+    try:
+        pdf_file_spec = options['file']
+        if not pdf_file_spec:
+            pdf_file_spec = os.path.join(scratch_dir,options['name'])
+            with open(pdf_file_spec,'wb') as f:
+                f.write(job['body'])
+        start_time = time.time()
+        result = job['fn'](pdf_file_spec,scratch_dir,options)
+        result['id'] = options['id']
+        result['seconds'] = time.time() - start_time
+        return result
+    finally:
+        mapped.release(pdf_file_spec)
+        shutil.rmtree(scratch_dir,ignore_errors=True)
+
+def split_request(pdf_file_spec,scratch_dir,options):
+    """
+    Locate cover sheets in, and split, the PDF file specified by
+    PDF_FILE_SPEC. Return a dictionary as filled by pdfxcb.pdfxcb
+    (see RESULT).
+    """
+    result = {}
+    if options['plan']:
+        pdfxcb.apply_plan(pdf_file_spec,options['plan'],options['output_dir'],
+                          identifier=options['id'],name_template=options['name_template'],result=result)
+        return result
+    pdfxcb.pdfxcb(pdf_file_spec,options['output_dir'],options['match_re'],options['rasterize_p'],
+                  identifier=options['id'],name_template=options['name_template'],
+                  scratch_root=scratch_dir,decoder=options['decoder'],
+                  symbologies=options['symbologies'],position=options['position'],
+                  barcode_filter=options['barcode_filter'],check_p=False,result=result,
+                  preflight_limits=options['preflight_limits'],prune_pages=options['prune_pages'],
+                  blank_threshold=options['blank_threshold'])
+    return result
+
+def scan_request(pdf_file_spec,scratch_dir,options):
+    """
+    Locate cover sheets in the PDF file specified by PDF_FILE_SPEC
+    without splitting the PDF. Return the plan (see
+    pdfxcb.scan_plan); a plan may be passed to the /split endpoint
+    ('plan') to split the PDF without scanning it again.
+    """
+    return pdfxcb.scan_plan(pdf_file_spec,options['match_re'],options['rasterize_p'],
+                            scratch_root=scratch_dir,decoder=options['decoder'],
+                            symbologies=options['symbologies'],position=options['position'],
+                            barcode_filter=options['barcode_filter'],check_p=False,
+                            preflight_limits=options['preflight_limits'],prune_pages=options['prune_pages'],
+                            blank_threshold=options['blank_threshold'])
+
+def serve(address,threads=None,queue_size=None,scratch_root=None,decoder=None,ready_fn=None,preflight_limits=None,request_timeout=None):
+    """
+    Serve requests at ADDRESS, a (<host>,<port>) tuple, until the
+    process is terminated. THREADS (by default, as many as the CPUs
+    and memory available accommodate; see resources.tune) requests
+    are handled at once; up to QUEUE_SIZE (by default,
+    DEFAULT_QUEUE_SIZE) further requests wait. Each PDF is checked
+    against PREFLIGHT_LIMITS (see preflight.preflight). A request not
+    answered within REQUEST_TIMEOUT seconds (by default,
+    DEFAULT_REQUEST_TIMEOUT) is cancelled. READY_FN, if specified, is
+    called with the address of the server once the server is
+    listening.
+    """
+    # external tools (see pdfxcb.sanity_checks) and the default decoder are checked once
+    pdfxcb.executable_sanity_checks(pdfxcb.required_executables)
+    decoders.decoder_sanity_check(decoder or decoders.default_decoder)
+    config = resources.tune()
+    tools.set_max_processes(config['tool_processes'])
+    jobs = queue.Queue(queue_size or default_queue_size)
+    for i in range(threads or config['workers']):
+        thread = threading.Thread(target=handle_jobs,args=(jobs,decoder))
+        thread.daemon = True
+        thread.start()
+    server = PdfxcbHTTPServer(address,PdfxcbRequestHandler)
+    server.jobs = jobs
+    server.scratch_root = scratch_root
+    server.preflight_limits = preflight_limits
+    server.request_timeout = request_timeout or default_request_timeout
+    host, port = server.server_address[:2]
+    lg.debug("server listening on %s:%s",host,port)
+    if ready_fn:
+        ready_fn('{}:{}'.format(host,port))
+    server.serve_forever()
+
+def main():
+    """Handle command-line invocation of server.py."""
+    parser = argparse.ArgumentParser(description="Serve pdfxcb requests")
+    parser.add_argument("-a",
+                        help="address to listen on (default: 127.0.0.1:8400)",
+                        action="store",
+                        dest="address",
+                        default="127.0.0.1:8400",
+                        type=str)
+    parser.add_argument("-f",
+                        help="absolute path to log file",
+                        action="store",
+                        dest="log_file",
+                        type=str)
+    parser.add_argument("-l",
+                        help="integer between 0 (verbose) and 51 (terse) defining logging",
+                        action="store",
+                        dest="log_level",
+                        type=int)
+    parser.add_argument("-n",
+                        help="number of requests handled at once (default: as many as the CPUs and memory available accommodate)",
+                        action="store",
+                        dest="threads",
+                        type=int)
+    parser.add_argument("-q",
+                        help="number of requests which may wait; further requests are refused (default: {})".format(default_queue_size),
+                        action="store",
+                        dest="queue_size",
+                        type=int)
+    parser.add_argument("-s",
+                        help="absolute path to a directory within which scratch directories are created",
+                        action="store",
+                        dest="scratch_root",
+                        type=str)
+    parser.add_argument("-w",
+                        help="seconds after which an unanswered request is cancelled (default: {})".format(default_request_timeout),
+                        action="store",
+                        dest="request_timeout",
+                        type=float)
+    parser.add_argument("-z",
+                        help="default barcode decoder (" + ", ".join(sorted(decoders.decoders)) + ")",
+                        action="store",
+                        dest="decoder",
+                        type=str)
+    parser.add_argument("-T",
+                        help="seconds after which an external tool is killed",
+                        action="store",
+                        dest="tool_timeout",
+                        type=float)
+    parser.add_argument("-N",
+                        help="reject a PDF with more than the specified number of pages",
+                        action="store",
+                        dest="max_pages",
+                        type=int)
+    parser.add_argument("-M",
+                        help="reject a PDF larger than the specified number of megabytes",
+                        action="store",
+                        dest="max_megabytes",
+                        type=float)
+    parser.add_argument("-E",
+                        help="reject a PDF whose estimated work exceeds the specified number of megapixels",
+                        action="store",
+                        dest="max_megapixels",
+                        type=float)
+    args = parser.parse_args()
+    if args.log_file:
+        for handler in lg.getLogger().handlers:
+            lg.getLogger().removeHandler(handler)
+        file_handler = logging.FileHandler(args.log_file,'a')
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        lg.getLogger().addHandler(file_handler)
+    if args.log_level is not None:
+        lg.getLogger().setLevel(args.log_level)
+    else:
+        lg.getLogger().setLevel(logging.INFO)
+    if args.tool_timeout:
+        tools.set_default_timeout(args.tool_timeout)
+    if args.decoder:
+        decoders.default_decoder = args.decoder
+    host, port = args.address.rsplit(':',1)
+    preflight_limits = {
+        'max_pages': args.max_pages,
+        'max_bytes': (int(args.max_megabytes * 2**20) if args.max_megabytes else None),
+        'max_megapixels': args.max_megapixels
+    }
+    serve((host,int(port)),args.threads,args.queue_size,args.scratch_root,args.decoder,
+          preflight_limits=preflight_limits,request_timeout=args.request_timeout)
+
+if __name__ == "__main__":
+    main()
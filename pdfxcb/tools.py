@@ -0,0 +1,197 @@
+"""Run external tools (pdftoppm, gs, pdfimages, zbarimg)
+"""
+
+# Author: David A. Thompson
+
+import subprocess
+import threading
+import time
+
+# configure logging
+import logging
+lg=logging
+
+# internal modules
+import json1
+import resources
+
+#
+# Every external tool is run via RUN. RUN streams the tool's output
+# (so a chatty tool never blocks on a full pipe), enforces an
+# optional timeout, caps the number of concurrently running tools,
+# and kills the tool if the calling run is cancelled or the process
+# is asked to terminate.
+#
+
+# seconds; None indicates no timeout
+default_timeout = None
+
+# cap on the number of concurrently running external tools (see
+# resources.tune regarding memory)
+max_processes = resources.available_cpus()
+process_slots = threading.BoundedSemaphore(max_processes)
+
+# live subprocess.Popen objects
+running_processes = set()
+running_processes_lock = threading.Lock()
+
+# per-thread state (cancel event for the current run)
+thread_state = threading.local()
+
+# executable name -> path, as validated by the sanity checks (see
+# set_executable_path); a tool not listed is looked up on the PATH
+executable_paths = {}
+
+class ToolTimeout(Exception):
+    """An external tool did not complete within the allotted time."""
+    pass
+
+class ToolCancelled(Exception):
+    """
+    The run was cancelled: an external tool was killed or a stage of
+    the run was not begun (see check_cancelled).
+    """
+    pass
+
+def set_default_timeout(timeout):
+    """TIMEOUT is a number of seconds or None."""
+    global default_timeout
+    default_timeout = timeout
+
+def set_max_processes(n):
+    """
+    Cap at N the number of external tools running concurrently. Only
+    affects tools started after the call.
+    """
+    global max_processes, process_slots
+    max_processes = n
+    process_slots = threading.BoundedSemaphore(n)
+
+def set_executable_path(executable_name,path):
+    """
+    Run the external tool EXECUTABLE_NAME from PATH, the file found by
+    the sanity checks, rather than looking it up again on each run.
+    """
+    executable_paths[executable_name] = path
+
+def set_cancel_event(cancel_event):
+    """
+    Associate CANCEL_EVENT, a threading.Event (or None), with the
+    current thread. Tools subsequently run by the current thread are
+    killed once CANCEL_EVENT is set.
+    """
+    thread_state.cancel_event = cancel_event
+
+def current_cancel_event():
+    return getattr(thread_state, 'cancel_event', None)
+
+def check_cancelled(stage):
+    """
+    Raise ToolCancelled if the cancel event of the current thread (see
+    set_cancel_event) is set, so that a cancelled run does not begin
+    STAGE (e.g., 'split') even though no external tool is running.
+    """
+    cancel_event = current_cancel_event()
+    if cancel_event and cancel_event.is_set():
+        lg.debug("cancelled before %s",stage)
+        raise ToolCancelled(stage)
+
+def terminate_all():
+    """Kill all external tools currently running."""
+    with running_processes_lock:
+        processes = list(running_processes)
+    for process in processes:
+        kill(process)
+
+def kill(process):
+    try:
+        process.kill()
+    except OSError:
+        # already exited
+        pass
+
+def run(command,timeout=None,stdout_line_fn=None):
+    """
+    Run the external tool specified by COMMAND, a list of strings.
+    Return multiple values: the return code and a list of the lines
+    written by the tool to standard output. If STDOUT_LINE_FN is
+    specified, it is called with each line of standard output as the
+    line is read. Lines written to standard error are logged (debug).
+
+    Raise ToolTimeout if the tool has not completed after TIMEOUT
+    seconds (by default, DEFAULT_TIMEOUT). Raise ToolCancelled if the
+    cancel event of the current thread (see set_cancel_event) is set
+    while the tool is running. In either case, the tool is killed.
+    """
+    if timeout is None:
+        timeout = default_timeout
+    cancel_event = current_cancel_event()
+    lg.debug(command)
+    slots = process_slots
+    slots.acquire()
+    try:
+        process = subprocess.Popen([executable_paths.get(command[0],command[0])] + command[1:],
+                                   shell=False,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        with running_processes_lock:
+            running_processes.add(process)
+        try:
+            stdout_lines = []
+            def handle_stdout_line (line):
+                stdout_lines.append(line)
+                if stdout_line_fn:
+                    stdout_line_fn(line)
+            def handle_stderr_line (line):
+                lg.debug("%s: %s",command[0],line.rstrip())
+            readers = [
+                start_reader(process.stdout,handle_stdout_line),
+                start_reader(process.stderr,handle_stderr_line)
+            ]
+            wait(process,command,timeout,cancel_event)
+            for reader in readers:
+                reader.join()
+        finally:
+            with running_processes_lock:
+                running_processes.discard(process)
+    finally:
+        slots.release()
+    return process.returncode,stdout_lines
+
+def start_reader(stream,line_fn):
+    """
+    Call LINE_FN with each line read from STREAM, in a separate
+    thread. Return the thread.
+    """
+    def read_lines ():
+        for line in iter(stream.readline, b''):
+            line_fn(line)
+        stream.close()
+    reader = threading.Thread(target=read_lines)
+    reader.daemon = True
+    reader.start()
+    return reader
+
+def wait(process,command,timeout,cancel_event):
+    """
+    Wait for PROCESS to exit. Kill PROCESS and raise an exception on
+    timeout or cancellation.
+    """
+    deadline = None
+    if timeout:
+        deadline = time.time() + timeout
+    # poll frequently at first since most invocations are brief
+    interval = 0.001
+    while process.poll() is None:
+        if cancel_event and cancel_event.is_set():
+            kill(process)
+            process.wait()
+            lg.error(json1.json_tool_failed(command[0],"cancelled"))
+            raise ToolCancelled(command[0])
+        if deadline and time.time() > deadline:
+            kill(process)
+            process.wait()
+            lg.error(json1.json_tool_failed(command[0],"timed out after {} seconds".format(timeout)))
+            raise ToolTimeout(command[0])
+        time.sleep(interval)
+        interval = min(interval * 2, 0.05)
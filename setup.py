@@ -8,11 +8,17 @@ setup(
     version = "0.1",
     entry_points={
         'console_scripts': [
-            'pdfxcb=pdfxcb.pdfxcb:main'
+            'pdfxcb=pdfxcb.pdfxcb:main',
+            'pdfxcb-benchmark=pdfxcb.benchmark:main',
+            'pdfxcb-golden=pdfxcb.golden:main',
+            'pdfxcb-worker=pdfxcb.distributed:main',
+            'pdfxcb-server=pdfxcb.server:main'
         ]
     },
     # dependencies (a project's PyPI name)
     install_requires = ['PyPDF2'],
+    # pdfxcb_async (the trollius backport of asyncio)
+    extras_require = {'async': ['trollius']},
     packages = find_packages()
 )
 